@@ -1,22 +1,41 @@
 # agent.py
 import os
+import sys
 import json
+import asyncio
+import hashlib
 import time
 import logging
-from typing import Dict, List, Any, Optional
+import threading
+from typing import Callable, Dict, List, Any, Optional
 from dotenv import load_dotenv
-from langchain_openai import ChatOpenAI
-from langchain_classic.agents import AgentExecutor, create_openai_tools_agent
-from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
-from langchain_classic.memory import ConversationBufferMemory
-from langchain.tools import tool
-import httpx
+# LangChain (клиент OpenAI, исполнитель, промпты, инструменты, callbacks)
+# загружается при создании агента или заранее в warm_up(), а не при импорте
+# модуля: инструменты здесь — обычные функции, обертки LangChain над ними
+# собирает build_tools()
+
+# Корень проекта в sys.path, чтобы агент можно было запускать как скрипт (python ai_agent/agent.py)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from tracing import start_span
+from tools.http_client import api_call, is_local, CAD_API_URL
+from ai_agent.fast_path import FAST_PATH_ENABLED, parse_command, execute_intent
+from ai_agent.plan_cache import PLAN_CACHE_ENABLED, PlanCache
+from ai_agent.session_memory import DEFAULT_SESSION, SessionMemory
+from ai_agent.tool_schemas import (
+    MAKE_PART_DESCRIPTION, MAKE_PART_SCHEMA, CREATE_SHAPE_SCHEMA, OPEN_DOCUMENT_SCHEMA,
+    SAVE_DOCUMENT_SCHEMA, NO_ARGS_SCHEMA, select_tools, prompt_size
+)
+from ai_agent.session_pool import SessionPool
+from ai_agent.prefetch import PREFETCH_ENABLED, CADPrefetch
+from metrics import record_agent_query
 
 load_dotenv()
 
 # Конфигурация
 MODEL = os.getenv("SBER_MODEL", "Qwen/Qwen3-Next-80B-A3B-Instruct")
+# OpenAI-совместимый endpoint модели; для офлайн тестов — helpers/fake_llm_server.py
+LLM_BASE_URL = os.getenv("LLM_BASE_URL", "https://foundation-models.api.cloud.ru/v1")
+API_URL = CAD_API_URL
 
 # Настройка логирования
 logging.basicConfig(
@@ -37,197 +56,170 @@ def get_llm():
     if not api_key:
         raise ValueError("API_KEY не найден в .env файле")
     
+    from langchain_openai import ChatOpenAI
+    
     return ChatOpenAI(
-        base_url="https://foundation-models.api.cloud.ru/v1",
+        base_url=LLM_BASE_URL,
         api_key=api_key,
         model=MODEL,
         temperature=0.3,
         max_tokens=2000,
         timeout=60.0,
         max_retries=2,
+        # Токены приходят по мере генерации (стриминг ответа в /api/agent/query)
+        streaming=True,
+        # usage токенов в последнем чанке стрима — для учета расхода
+        stream_usage=True,
         presence_penalty=0,
         frequency_penalty=0.1,
         model_kwargs={}
     )
 
-# ============ ВСПОМОГАТЕЛЬНАЯ ФУНКЦИЯ ДЛЯ СОЗДАНИЯ ФИГУР ============
-def _create_shape_http(shape_type: str, size: float, x: float = 0.0, y: float = 0.0, z: float = 0.0) -> str:
-    """Внутренняя функция для создания фигуры через FastAPI."""
+# ============ ЗАПРОСЫ К FASTAPI ============
+async def _api(path: str, params: Optional[Dict[str, Any]] = None, *, error_prefix: str, idempotent: bool = False) -> str:
+    """
+    Асинхронный запрос к FastAPI через общий пул соединений MCP инструментов.
+
+    Если агент работает в процессе gateway, запрос идет в сервисный слой
+    напрямую. Результат — JSON строка для модели, ошибки тоже JSON.
+    """
     try:
-        params = {
-            "shape_type": shape_type,
-            "size": size,
-            "x": x,
-            "y": y,
-            "z": z
-        }
-        response = httpx.get(
-            "http://localhost:8001/api/cad/create-shape",
-            params=params,
-            timeout=30.0
-        )
-        response.raise_for_status()
-        return json.dumps(response.json(), ensure_ascii=False, indent=2)
-        
+        data = await api_call(path, params=params, idempotent=idempotent)
+        return json.dumps(data, ensure_ascii=False, indent=2)
     except Exception as e:
-        error_msg = f"Ошибка создания {shape_type}: {str(e)}"
+        error_msg = f"{error_prefix}: {str(e)}"
         logger.error(error_msg)
-        return json.dumps({"error": error_msg})
+        return json.dumps({"error": error_msg}, ensure_ascii=False)
+
+# ============ ВСПОМОГАТЕЛЬНАЯ ФУНКЦИЯ ДЛЯ СОЗДАНИЯ ФИГУР ============
+async def _create_shape_http(shape_type: str, size: float, x: float = 0.0, y: float = 0.0, z: float = 0.0) -> str:
+    """Внутренняя функция для создания фигуры через FastAPI."""
+    params = {
+        "shape_type": shape_type,
+        "size": size,
+        "x": x,
+        "y": y,
+        "z": z
+    }
+    return await _api("/api/cad/create-shape", params, error_prefix=f"Ошибка создания {shape_type}")
 
-# ============ ИНСТРУМЕНТЫ LANGCHAIN ============
-@tool
-def get_health() -> str:
-    """Проверить здоровье системы через FastAPI."""
+# ============ ИНСТРУМЕНТЫ АГЕНТА ============
+# Докстринг функции — описание инструмента для модели
+async def get_health() -> str:
+    """Здоровье системы и статус MCP сервера."""
     logger.info("Проверка здоровья системы через FastAPI")
     
-    try:
-        # Проверяем FastAPI
-        fastapi_resp = httpx.get("http://localhost:8001/", timeout=5.0)
-        fastapi_ok = fastapi_resp.status_code == 200
-        
-        # Проверяем MCP через FastAPI эндпоинт
-        mcp_resp = httpx.get("http://localhost:8001/api/mcp/status", timeout=5.0)
-        mcp_ok = mcp_resp.status_code == 200
-        
-        # Проверяем CAD через FastAPI
-        cad_resp = httpx.get("http://localhost:8001/api/cad/documents", timeout=5.0)
-        cad_ok = cad_resp.status_code == 200
-        
-        result = {
-            "fastapi_server": fastapi_ok,
-            "mcp_server": mcp_ok,
-            "cad_system": cad_ok,
-            "agent": True,
-            "timestamp": time.strftime("%Y-%m-%d %H:%M:%S")
-        }
-        
-        return json.dumps(result, ensure_ascii=False, indent=2)
-        
-    except Exception as e:
-        error_msg = f"Ошибка проверки здоровья: {str(e)}"
-        logger.error(error_msg)
-        return json.dumps({"error": error_msg})
+    async def check(path: str):
+        if path == "/" and is_local("/api/mcp/status"):
+            # Агент работает внутри gateway — FastAPI заведомо запущен
+            return True
+        try:
+            return await api_call(path, idempotent=True)
+        except Exception:
+            return False
+    
+    # FastAPI, MCP и CAD проверяем параллельно
+    fastapi_ok, mcp_status, cad_ok = await asyncio.gather(
+        check("/"), check("/api/mcp/status"), check("/api/cad/documents")
+    )
+    
+    result = {
+        "fastapi_server": bool(fastapi_ok),
+        # Статус MCP целиком: отдельный инструмент get_mcp_status агенту не нужен
+        "mcp_server": mcp_status,
+        "cad_system": bool(cad_ok),
+        "agent": True,
+        "timestamp": time.strftime("%Y-%m-%d %H:%M:%S")
+    }
+    
+    return json.dumps(result, ensure_ascii=False, indent=2)
 
-@tool
-def open_document(file_path: str) -> str:
-    """Открыть или создать документ через FastAPI."""
+async def open_document(file_path: str) -> str:
+    """Открыть существующий .FCStd для правки."""
     logger.info(f"Открытие документа через FastAPI: {file_path}")
-    
-    try:
-        response = httpx.get(
-            "http://localhost:8001/api/cad/open-document",
-            params={"file_path": file_path},
-            timeout=30.0
-        )
-        response.raise_for_status()
-        return json.dumps(response.json(), ensure_ascii=False, indent=2)
-        
-    except Exception as e:
-        error_msg = f"Ошибка открытия документа: {str(e)}"
-        logger.error(error_msg)
-        return json.dumps({"error": error_msg})
+    return await _api(
+        "/api/cad/open-document",
+        {"file_path": file_path},
+        error_prefix="Ошибка открытия документа",
+        idempotent=True
+    )
 
-@tool
-def save_document(file_path: Optional[str] = None) -> str:
-    """Сохранить текущий документ через FastAPI."""
+async def save_document(file_path: Optional[str] = None) -> str:
+    """Сохранить открытый документ."""
     logger.info(f"Сохранение документа через FastAPI: {file_path or 'текущий'}")
-    
-    try:
-        params = {"file_path": file_path} if file_path else {}
-        response = httpx.get(
-            "http://localhost:8001/api/cad/save-document",
-            params=params,
-            timeout=30.0
-        )
-        response.raise_for_status()
-        return json.dumps(response.json(), ensure_ascii=False, indent=2)
-        
-    except Exception as e:
-        error_msg = f"Ошибка сохранения документа: {str(e)}"
-        logger.error(error_msg)
-        return json.dumps({"error": error_msg})
+    params = {"file_path": file_path} if file_path else {}
+    return await _api(
+        "/api/cad/save-document",
+        params,
+        error_prefix="Ошибка сохранения документа",
+        idempotent=True
+    )
 
-@tool
-def close_document() -> str:
-    """Закрыть текущий документ через FastAPI."""
+async def close_document() -> str:
+    """Закрыть открытый документ."""
     logger.info("Закрытие документа через FastAPI")
-    
-    try:
-        response = httpx.get(
-            "http://localhost:8001/api/cad/close-document",
-            timeout=30.0
-        )
-        response.raise_for_status()
-        return json.dumps(response.json(), ensure_ascii=False, indent=2)
-        
-    except Exception as e:
-        error_msg = f"Ошибка закрытия документа: {str(e)}"
-        logger.error(error_msg)
-        return json.dumps({"error": error_msg})
+    return await _api("/api/cad/close-document", error_prefix="Ошибка закрытия документа")
 
-@tool
-def create_shape(shape_type: str, size: float, x: float = 0.0, y: float = 0.0, z: float = 0.0) -> str:
-    """Создать фигуру через FastAPI."""
+async def create_shape(shape_type: str, size: float, x: float = 0.0, y: float = 0.0, z: float = 0.0) -> str:
+    """Добавить фигуру в открытый документ (размеры в мм)."""
     logger.info(f"Создание фигуры через FastAPI: {shape_type}")
-    return _create_shape_http(shape_type, size, x, y, z)
+    return await _create_shape_http(shape_type, size, x, y, z)
 
-@tool
-def create_cube(size: float = 10.0, x: float = 0.0, y: float = 0.0, z: float = 0.0) -> str:
-    """Создать куб через FastAPI."""
-    logger.info(f"Создание куба через FastAPI, размер: {size}")
-    return _create_shape_http("cube", size, x, y, z)
+# Описание и схема параметров собираются из реестра фигур (ai_agent/tool_schemas.py)
+async def make_part(
+    parts: List[Dict[str, Any]],
+    file_name: Optional[str] = None,
+    fuse: bool = False,
+    export: Optional[str] = None
+) -> str:
+    logger.info(f"Создание детали через FastAPI: {len(parts)} фигур, файл {file_name or 'авто'}")
+    payload = {"parts": parts, "file_name": file_name, "fuse": fuse, "export": export}
+    try:
+        data = await api_call("/api/cad/make-part", json=payload)
+    except Exception as e:
+        logger.error(f"Ошибка создания детали: {e}")
+        return f"❌ Ошибка создания детали: {e}"
+    if not data.get("success"):
+        return f"❌ Деталь не создана: {data.get('result')}"
+    created = [step["result"] for step in data.get("steps", []) if step["op"] == "create"]
+    lines = [f"✅ Деталь сохранена в файл {data['file_name']}"] + [f"• {line}" for line in created]
+    if export:
+        lines.append(f"📦 Экспорт: {export}")
+    return "\n".join(lines)
 
-@tool
-def create_sphere(size: float = 10.0, x: float = 0.0, y: float = 0.0, z: float = 0.0) -> str:
-    """Создать сферу через FastAPI."""
-    logger.info(f"Создание сферы через FastAPI, диаметр: {size}")
-    return _create_shape_http("sphere", size, x, y, z)
+async def get_documents() -> str:
+    """Список документов FreeCAD."""
+    logger.info("Получение документов через FastAPI")
+    return await _api("/api/cad/documents", error_prefix="Ошибка получения документов", idempotent=True)
 
-@tool
-def create_cylinder(size: float = 10.0, x: float = 0.0, y: float = 0.0, z: float = 0.0) -> str:
-    """Создать цилиндр через FastAPI."""
-    logger.info(f"Создание цилиндра через FastAPI, диаметр: {size}")
-    return _create_shape_http("cylinder", size, x, y, z)
+def build_tools() -> List[Any]:
+    """Инструменты LangChain для модели (схемы — ai_agent/tool_schemas.py)."""
+    from langchain_core.tools import tool
 
-@tool 
-def get_documents() -> str:
-    """Получить список документов через FastAPI."""
-    logger.info("Получение документов через FastAPI")
-    
-    try:
-        response = httpx.get(
-            "http://localhost:8001/api/cad/documents",
-            timeout=30.0
-        )
-        response.raise_for_status()
-        return json.dumps(response.json(), ensure_ascii=False, indent=2)
-        
-    except Exception as e:
-        error_msg = f"Ошибка получения документов: {str(e)}"
-        logger.error(error_msg)
-        return json.dumps({"error": error_msg})
+    return [
+        # Ответ make_part сразу возвращается пользователю
+        tool(description=MAKE_PART_DESCRIPTION, args_schema=MAKE_PART_SCHEMA, return_direct=True)(make_part),
+        tool(args_schema=OPEN_DOCUMENT_SCHEMA)(open_document),
+        tool(args_schema=CREATE_SHAPE_SCHEMA)(create_shape),
+        tool(args_schema=SAVE_DOCUMENT_SCHEMA)(save_document),
+        tool(args_schema=NO_ARGS_SCHEMA)(close_document),
+        tool(args_schema=NO_ARGS_SCHEMA)(get_documents),
+        tool(args_schema=NO_ARGS_SCHEMA)(get_health),
+    ]
 
-@tool
-def get_mcp_status() -> str:
-    """Получить статус MCP через FastAPI."""
-    logger.info("Получение статуса MCP через FastAPI")
-    
-    try:
-        response = httpx.get(
-            "http://localhost:8001/api/mcp/status",
-            timeout=30.0
-        )
-        response.raise_for_status()
-        return json.dumps(response.json(), ensure_ascii=False, indent=2)
-        
-    except Exception as e:
-        error_msg = f"Ошибка получения статуса MCP: {str(e)}"
-        logger.error(error_msg)
-        return json.dumps({"error": error_msg})
+# Инструменты, работающие с текущим открытым документом: зависят друг от друга
+SESSION_TOOLS = {"open_document", "create_shape", "save_document", "close_document"}
+# Открывают и закрывают свой документ: не должны вклиниваться в цепочку SESSION_TOOLS
+DOCUMENT_TOOLS = {"make_part"}
+
+SYSTEM_PROMPT = """Ты — AI ассистент CAD системы FreeCAD. Отвечай на русском языке, кратко.
+Новую деталь создавай одним вызовом make_part. Несколько независимых деталей — несколькими вызовами make_part в одном ответе, они выполнятся параллельно.
+open_document → create_shape → save_document → close_document — только для правки уже существующего файла.
+Пример: "Куб 40 с отверстием 10 в центре" → make_part(parts=[{"shape_type": "cube", "size": 40}, {"shape_type": "cylinder", "size": 10, "x": 20, "y": 20, "subtract": true}])"""
 
 # ============ КЛАСС ПОЛНОЦЕННОГО АГЕНТА ============
 class FullCADAgent:
-    """Полноценный CAD агент с памятью и продвинутыми функциями"""
+    """Полноценный CAD агент: общие LLM и инструменты, память и лимиты по сессиям"""
     
     def __init__(self):
         # Проверяем наличие API ключа
@@ -238,142 +230,308 @@ class FullCADAgent:
         # Инициализация LLM
         self.llm = get_llm()
         
+        from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+        from langchain_core.messages import SystemMessage
+        from ai_agent.callbacks import TracingCallbackHandler
+        
         # Сбор всех инструментов
-        self.tools = [
-            open_document,
-            save_document,
-            close_document,
-            create_shape,
-            create_cube,
-            create_sphere,
-            create_cylinder,
-            get_documents,
-            get_mcp_status,
-            get_health
-        ]
+        self.tools = build_tools()
         
-        # Инициализация памяти
-        self.memory = ConversationBufferMemory(
-            memory_key="chat_history",
-            return_messages=True
-        )
+        # Спаны вызовов LLM для трассировки
+        self.tracing_callback = TracingCallbackHandler(MODEL)
+        
+        # Память по сессиям: окно последних реплик + резюме старых (SQLite)
+        self.memory = SessionMemory(summarizer=self._summarize_history)
+        # Легкие состояния сессий (LRU) и лимиты одновременных запросов к LLM
+        self.sessions = SessionPool()
         
         # Создание промпта
         self.prompt = ChatPromptTemplate.from_messages([
-            SystemMessage(content="""Ты - профессиональный AI ассистент для CAD системы FreeCAD.
-            Используй доступные инструменты для выполнения задач. Всегда работай последовательно:
-            1. Открой документ (open_document)
-            2. Создай фигуру (create_shape, create_cube и т.д.)
-            3. Сохрани документ (save_document)
-            4. Закрой документ (close_document)
-            
-            Будь точным и профессиональным. Отвечай на русском языке.
-            
-            Примеры команд:
-            - "Создай куб 20мм" → open_document(auto_cube.FCStd) → create_cube(size=20) → save_document() → close_document()
-            - "Покажи все документы" → get_documents()
-            - "Проверь здоровье системы" → get_health()
-            """),
+            # Промпт уходит в каждом вызове модели: только правила, описание
+            # параметров — в схемах инструментов (ai_agent/tool_schemas.py)
+            SystemMessage(content=SYSTEM_PROMPT),
             MessagesPlaceholder(variable_name="chat_history"),
             ("human", "{input}"),
             MessagesPlaceholder(variable_name="agent_scratchpad")
         ])
         
-        # Создание агента
-        self.agent = create_openai_tools_agent(
-            llm=self.llm,
-            tools=self.tools,
-            prompt=self.prompt
-        )
+        # Исполнители по наборам инструментов: модели передаются только
+        # инструменты под намерение запроса (select_tools)
+        self._executors: Dict[tuple, Any] = {}
+        self.agent_executor = self.executor_for(self.tools)
         
-        # Создание исполнителя
-        self.agent_executor = AgentExecutor(
-            agent=self.agent,
-            tools=self.tools,
-            memory=self.memory,
-            verbose=True,
-            handle_parsing_errors=True,
-            max_iterations=5
-        )
+        # Кэш планов: повторный запрос выполняется без вызова модели
+        self.tools_by_name = {t.name: t for t in self.tools}
+        self.plan_cache = PlanCache() if PLAN_CACHE_ENABLED else None
+        # Смена модели, промпта или инструментов делает старые планы недействительными
+        self.cache_state = hashlib.sha256(
+            json.dumps([MODEL, SYSTEM_PROMPT, sorted((t.name, t.description) for t in self.tools)]).encode("utf-8")
+        ).hexdigest()[:16]
         
         logger.info("✅ Full CAD Agent инициализирован")
         logger.info(f"Модель: {MODEL}")
-        logger.info(f"Инструментов: {len(self.tools)}")
+        logger.info(
+            f"Инструментов: {len(self.tools)}, промпт без истории: "
+            f"~{prompt_size(SYSTEM_PROMPT, self.tools, [], '')['total']} токенов"
+        )
+    
+    def executor_for(self, tools: List[Any]):
+        """Исполнитель агента с данным набором инструментов (создается один раз)."""
+        key = tuple(t.name for t in tools)
+        executor = self._executors.get(key)
+        if executor is None:
+            from langchain_classic.agents import create_openai_tools_agent
+            from ai_agent.executor import ParallelAgentExecutor
+            
+            executor = self._executors[key] = ParallelAgentExecutor(
+                agent=create_openai_tools_agent(llm=self.llm, tools=tools, prompt=self.prompt),
+                tools=tools,
+                # Работают с текущим документом сервера — только по очереди
+                sequential_tools=SESSION_TOOLS,
+                document_tools=DOCUMENT_TOOLS,
+                verbose=True,
+                handle_parsing_errors=True,
+                max_iterations=5,
+                # Шаги нужны, чтобы сохранить план вызовов инструментов в кэш
+                return_intermediate_steps=True
+            )
+        return executor
     
-    def process(self, query: str) -> Dict[str, Any]:
-        """Обработать запрос пользователя"""
-        logger.info(f"📨 Запрос: {query}")
+    async def aprocess(
+        self,
+        query: str,
+        session_id: str = DEFAULT_SESSION,
+        on_event: Optional[Callable[[str, Dict[str, Any]], None]] = None,
+        include_usage: Optional[bool] = None
+    ) -> Dict[str, Any]:
+        """
+        Обработать запрос пользователя (асинхронно, без блокировки event loop).
+
+        on_event(событие, данные) получает промежуточные события по мере
+        выполнения: token, tool_start, tool_end, tool_error.
+        include_usage — добавить в ответ учет токенов и времени (поле usage);
+        по умолчанию берется из AGENT_RETURN_USAGE.
+        """
+        from ai_agent.callbacks import EventCallbackHandler
+        from ai_agent.usage import RETURN_USAGE, QueryUsage
+        
+        logger.info(f"📨 Запрос [{session_id}]: {query}")
+        usage = QueryUsage(MODEL)
+        route = "llm"
+        callbacks = [self.tracing_callback, usage]
+        if on_event is not None:
+            callbacks.append(EventCallbackHandler(on_event))
         
         try:
-            # Запуск агента
-            result = self.agent_executor.invoke({"input": query})
+            # Запуск агента (корневой спан трассировки для всего запроса)
+            async with self.sessions.session(session_id) as state:
+                with start_span("agent.process", attributes={"query": query}) as span:
+                    intent = parse_command(query) if FAST_PATH_ENABLED else None
+                    span.set_attribute("agent.fast_path", intent is not None)
+                    if intent is not None:
+                        # Простая команда: выполняем сразу, без вызова модели
+                        logger.info(f"⚡ Быстрый путь: {intent.action} {intent.args}")
+                        route = "fast_path"
+                        # Callbacks здесь не вызываются — время инструмента учитываем сами
+                        started, status = time.perf_counter(), "error"
+                        try:
+                            output = await execute_intent(intent)
+                            status = "error" if output.startswith("❌") else "success"
+                        finally:
+                            usage.record_tool(intent.action, time.perf_counter() - started, status)
+                        cached = False
+                    else:
+                        plan = await self.plan_cache.aget(query, self.cache_state) if self.plan_cache else None
+                        cached = plan is not None
+                        span.set_attribute("agent.plan_cache_hit", cached)
+                        if cached:
+                            logger.info(f"♻️ План из кэша: {[step['tool'] for step in plan]}")
+                            route = "cached_plan"
+                            output = await self._replay_plan(plan, callbacks)
+                        else:
+                            # CAD прогревается параллельно с ответом модели
+                            prefetch = CADPrefetch(query) if PREFETCH_ENABLED else None
+                            try:
+                                tools = select_tools(query, self.tools)
+                                history = await self.memory.aload(session_id)
+                                usage.prompt = prompt_size(SYSTEM_PROMPT, tools, history, query)
+                                usage.tools = [t.name for t in tools]
+                                span.set_attribute("agent.prompt_tokens", usage.prompt["total"])
+                                logger.info(
+                                    f"🧮 Промпт ~{usage.prompt['total']} токенов: системный {usage.prompt['system']}, "
+                                    f"инструменты {usage.prompt['tools']} ({', '.join(usage.tools)}), "
+                                    f"история {usage.prompt['history']}, запрос {usage.prompt['input']}"
+                                )
+                                on_wait = on_event and (lambda: on_event("queued", {"session_id": session_id}))
+                                async with self.sessions.llm_slot(state, on_wait):
+                                    result = await self.executor_for(tools).ainvoke(
+                                        {"input": query, "chat_history": history},
+                                        config={"callbacks": callbacks}
+                                    )
+                            finally:
+                                if prefetch is not None:
+                                    usage.prefetch = prefetch.finish()
+                            output = result.get("output", "Нет ответа")
+                            await self._remember_plan(query, result.get("intermediate_steps", []))
+                    # Модель увидит этот обмен в истории следующего запроса сессии
+                    await self.memory.asave_turn(session_id, query, output)
             
             response = {
                 "success": True,
                 "query": query,
-                "response": result.get("output", "Нет ответа")
+                "response": output,
+                "fast_path": intent is not None,
+                "cached_plan": cached
             }
             
             logger.info("✅ Запрос успешно обработан")
-            return response
             
         except Exception as e:
             logger.error(f"❌ Ошибка обработки: {str(e)}")
-            return {
+            response = {
                 "success": False,
                 "query": query,
                 "error": str(e),
                 "response": f"Произошла ошибка при обработке запроса: {str(e)}"
             }
+        
+        summary = usage.summary(route, response["success"])
+        record_agent_query(summary)
+        logger.info(
+            f"📊 [{route}] {summary['total_seconds']:.3f} с (LLM {summary['llm_seconds']:.3f} с, "
+            f"инструменты {summary['tool_seconds']:.3f} с), вызовов LLM: {summary['llm_calls']}, "
+            f"токены: {summary['prompt_tokens']}+{summary['completion_tokens']}, стоимость: {summary['cost']}"
+        )
+        if RETURN_USAGE if include_usage is None else include_usage:
+            response["usage"] = summary
+        return response
+    
+    def process(self, query: str, session_id: str = DEFAULT_SESSION) -> Dict[str, Any]:
+        """Обработать запрос пользователя (синхронная обертка над aprocess для CLI)"""
+        return asyncio.run(self.aprocess(query, session_id))
     
-    def clear_memory(self):
-        """Очистить память агента"""
-        self.memory.clear()
-        logger.info("🧹 Память агента очищена")
+    async def _summarize_history(self, previous: str, transcript: str) -> str:
+        """Свернуть старые реплики сессии в краткое резюме (вызывается в фоне)."""
+        from langchain_core.messages import SystemMessage, HumanMessage
+        
+        # Фоновая свертка тоже занимает слот LLM процесса
+        async with self.sessions.llm_slots:
+            message = await self.llm.ainvoke([
+                SystemMessage(content=(
+                    "Сожми историю диалога с CAD ассистентом в краткое резюме на русском языке, "
+                    "до 5 предложений. Сохрани имена файлов, созданные фигуры, размеры и "
+                    "договоренности с пользователем. Ответь только текстом резюме."
+                )),
+                HumanMessage(content=f"Текущее резюме:\n{previous or '(нет)'}\n\nНовые реплики:\n{transcript}")
+            ])
+        return str(message.content)
+    
+    async def _remember_plan(self, query: str, steps):
+        """Сохранить план в кэш, если все вызовы инструментов прошли без ошибок."""
+        if self.plan_cache is None or not steps:
+            return
+        plan = []
+        for action, observation in steps:
+            observation = str(observation)
+            if action.tool not in self.tools_by_name or '"error"' in observation or observation.startswith("❌"):
+                return
+            plan.append({"tool": action.tool, "args": action.tool_input})
+        await self.plan_cache.aput(query, plan, self.cache_state)
+    
+    async def _replay_plan(self, plan: List[Dict[str, Any]], callbacks=None) -> str:
+        """Выполнить сохраненный план без модели и собрать ответ из результатов."""
+        lines = ["♻️ Выполнено по сохраненному плану:"]
+        for step in plan:
+            observation = await self.tools_by_name[step["tool"]].ainvoke(step["args"], config={"callbacks": callbacks})
+            try:
+                data = json.loads(observation)
+            except (TypeError, ValueError):
+                data = {"result": str(observation)}
+            if "error" in data or str(data.get("result", "")).startswith("❌"):
+                lines.append(f"❌ {step['tool']}: {data.get('error') or data['result']}")
+                break
+            lines.append(f"✅ {step['tool']}: {data.get('result', observation)}")
+        return "\n".join(lines)
+    
+    def clear_memory(self, session_id: Optional[str] = None):
+        """Очистить память одной сессии или всех сессий"""
+        self.memory.clear(session_id)
+        logger.info(f"🧹 Память агента очищена: {session_id or 'все сессии'}")
 
 # ============ SINGLETON ДЛЯ ПРОЕКТА ============
 _agent_instance = None
+# Агента может создавать фоновый прогрев (поток) одновременно с первым запросом
+_agent_lock = threading.Lock()
 
 def get_agent() -> FullCADAgent:
-    """Получить глобальный экземпляр агента"""
+    """
+    Получить агента процесса.
+
+    Экземпляр один (общие клиент LLM и инструменты), состояние каждой
+    сессии — в пуле agent.sessions и в SessionMemory.
+    """
     global _agent_instance
     if _agent_instance is None:
-        _agent_instance = FullCADAgent()
+        with _agent_lock:
+            if _agent_instance is None:
+                _agent_instance = FullCADAgent()
     return _agent_instance
 
+def warm_up() -> bool:
+    """
+    Заранее загрузить тяжелые зависимости и создать агента.
+
+    Вызывается gateway в фоновом потоке после старта, чтобы первый запрос
+    к агенту не ждал импорта LangChain. Без API_KEY только импортирует
+    модули. Возвращает True, если агент создан.
+    """
+    import langchain_openai  # noqa: F401
+    import langchain_classic.agents  # noqa: F401
+    import ai_agent.executor  # noqa: F401
+    import ai_agent.callbacks  # noqa: F401
+    import ai_agent.usage  # noqa: F401
+    if not os.getenv("API_KEY"):
+        return False
+    get_agent()
+    return True
+
 # ============ ТЕСТОВЫЙ СКРИПТ ============
+async def _chat():
+    """Интерактивный чат в одном event loop (общий пул соединений на весь сеанс)"""
+    agent = get_agent()
+    print("=" * 60)
+    print("✅ CAD Agent успешно инициализирован")
+    print(f"Модель: {MODEL}")
+    print(f"Инструментов: {len(agent.tools)}")
+    print("=" * 60)
+    
+    # Тестовый запрос
+    test_query = "Проверь здоровье системы"
+    print(f"Тестовый запрос: {test_query}")
+    result = await agent.aprocess(test_query)
+    print(f"Ответ: {result['response']}")
+    print("=" * 60)
+    
+    # Интерактивный режим
+    print("Чат с агентом (нажмите Ctrl+C для выхода)")
+    print("-" * 50)
+    
+    while True:
+        user_input = (await asyncio.to_thread(input, "Вы: ")).strip()
+        if not user_input:
+            continue
+        
+        result = await agent.aprocess(user_input)
+        print(f"🤖 Агент: {result['response']}\n")
+
 if __name__ == "__main__":
-    # Инициализация агента
     try:
-        agent = get_agent()
-        print("=" * 60)
-        print("✅ CAD Agent успешно инициализирован")
-        print(f"Модель: {MODEL}")
-        print(f"Инструментов: {len(agent.tools)}")
-        print("=" * 60)
-        
-        # Тестовый запрос
-        test_query = "Проверь здоровье системы"
-        print(f"Тестовый запрос: {test_query}")
-        result = agent.process(test_query)
-        print(f"Ответ: {result['response']}")
-        print("=" * 60)
-        
-        # Интерактивный режим
-        print("Чат с агентом (нажмите Ctrl+C для выхода)")
-        print("-" * 50)
-        
-        while True:
-            user_input = input("Вы: ").strip()
-            if not user_input:
-                continue
-            
-            result = agent.process(user_input)
-            print(f"🤖 Агент: {result['response']}\n")
-            
+        asyncio.run(_chat())
+    except KeyboardInterrupt:
+        pass
     except Exception as e:
         print(f"❌ Ошибка инициализации: {str(e)}")
         print("Убедитесь что:")
         print("1. Установлены переменные окружения в .env файле")
         print("2. API_KEY указан для SberCloud")
-        print("3. FastAPI сервер запущен (python main.py)")
\ No newline at end of file
+        print("3. FastAPI сервер запущен (python main.py)")
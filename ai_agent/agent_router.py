@@ -0,0 +1,174 @@
+"""
+HTTP API AI агента: /api/agent/query, /api/agent/batch, /api/agent/status, /api/agent/help.
+
+/api/agent/query отвечает потоком Server-Sent Events, если клиент передал
+"stream": true или заголовок Accept: text/event-stream. События приходят
+по мере выполнения, первое (start) — сразу после получения запроса:
+    start       — запрос принят
+    queued      — запрос ждет свободного слота LLM (лимиты сессии/процесса)
+    token       — очередной фрагмент ответа модели
+    tool_start  — вызов инструмента (имя и аргументы)
+    tool_end    — результат инструмента (ответ CAD)
+    tool_error  — ошибка инструмента
+    done        — итоговый ответ (тот же JSON, что и без стриминга)
+Без стриминга возвращается обычный JSON после завершения запроса.
+
+/api/agent/batch выполняет список запросов с ограниченной параллельностью
+и повторами (ai_agent/batch.py). В стриминге события:
+    start   — пакет принят
+    item    — результат очередного запроса (в порядке завершения)
+    summary — сводка по пакету
+Без стриминга — {"items": [...по порядку запросов], "summary": {...}}.
+
+Модуль агента импортируется при первом запросе: gateway без API_KEY
+запускается и обслуживает CAD API, а эндпоинты агента отвечают 503.
+Агент создается (и ожидается фоновый прогрев) в пуле потоков, чтобы
+первые запросы не блокировали event loop — /health и MCP отвечают сразу.
+"""
+
+import asyncio
+import json
+from typing import Any, Dict, List, Optional
+
+from fastapi import APIRouter, HTTPException, Request
+from pydantic import BaseModel
+from sse_starlette.sse import EventSourceResponse
+
+from ai_agent.batch import BATCH_MAX_ITEMS, run_batch
+from ai_agent.session_memory import DEFAULT_SESSION
+
+router = APIRouter(prefix="/api/agent", tags=["agent"])
+
+EXAMPLES = [
+    "Создай куб 20мм",
+    "Сфера диаметром 15 в точке 10,0,0",
+    "Куб 40 с отверстием 10 посередине, файл plate.FCStd",
+    "Сделай куб, сферу и цилиндр по 10мм",
+    "Покажи все документы",
+    "Проверь здоровье системы",
+]
+
+
+class AgentQuery(BaseModel):
+    query: str
+    session_id: str = DEFAULT_SESSION
+    stream: bool = False
+    include_usage: Optional[bool] = None
+
+
+class AgentBatch(BaseModel):
+    prompts: List[str]
+    concurrency: Optional[int] = None
+    retries: Optional[int] = None
+    stream: bool = False
+
+
+def _load_agent():
+    from ai_agent.agent import get_agent
+    return get_agent()
+
+
+async def _get_agent():
+    try:
+        # get_agent ждет блокировку, пока фоновый прогрев импортирует LangChain
+        return await asyncio.to_thread(_load_agent)
+    except ValueError as e:
+        # Нет API_KEY — агент недоступен, остальной gateway работает
+        raise HTTPException(status_code=503, detail=str(e))
+
+
+def _event(name: str, data: Dict[str, Any]) -> Dict[str, str]:
+    return {"event": name, "data": json.dumps(data, ensure_ascii=False)}
+
+
+async def _stream(agent, body: AgentQuery):
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def run():
+        try:
+            result = await agent.aprocess(
+                body.query, body.session_id,
+                on_event=lambda event, data: queue.put_nowait((event, data)),
+                include_usage=body.include_usage
+            )
+            queue.put_nowait(("done", result))
+        finally:
+            queue.put_nowait(None)
+
+    yield _event("start", {"query": body.query, "session_id": body.session_id})
+    task = asyncio.create_task(run())
+    try:
+        while (item := await queue.get()) is not None:
+            yield _event(*item)
+    finally:
+        # Клиент отключился — запрос агента больше никому не нужен
+        if not task.done():
+            task.cancel()
+
+
+@router.post("/query")
+async def agent_query(body: AgentQuery, request: Request):
+    """Выполнить запрос к агенту (JSON или поток SSE)."""
+    agent = await _get_agent()
+    if body.stream or "text/event-stream" in request.headers.get("accept", ""):
+        return EventSourceResponse(_stream(agent, body), ping=15)
+    return await agent.aprocess(body.query, body.session_id, include_usage=body.include_usage)
+
+
+@router.post("/batch")
+async def agent_batch(body: AgentBatch, request: Request):
+    """Выполнить пакет запросов (JSON или поток SSE с результатами по мере готовности)."""
+    if not body.prompts:
+        raise HTTPException(status_code=400, detail="Пустой пакет: передайте хотя бы один запрос")
+    if len(body.prompts) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"Слишком большой пакет: максимум {BATCH_MAX_ITEMS} запросов")
+    agent = await _get_agent()
+    events = run_batch(agent, body.prompts, body.concurrency, body.retries)
+
+    if body.stream or "text/event-stream" in request.headers.get("accept", ""):
+        async def stream():
+            yield _event("start", {"total": len(body.prompts)})
+            try:
+                async for event in events:
+                    yield _event(event["event"], event["data"])
+            finally:
+                # Клиент отключился — оставшиеся запросы пакета отменяются
+                await events.aclose()
+        return EventSourceResponse(stream(), ping=15)
+
+    items, summary = [], None
+    async for event in events:
+        if event["event"] == "item":
+            items.append(event["data"])
+        else:
+            summary = event["data"]
+    return {"items": sorted(items, key=lambda item: item["index"]), "summary": summary}
+
+
+@router.get("/status")
+async def agent_status():
+    """Состояние агента: модель, инструменты, кэш планов, сессии."""
+    agent = await _get_agent()
+    from ai_agent.agent import MODEL, SYSTEM_PROMPT
+    from ai_agent.tool_schemas import prompt_size
+    return {
+        "status": "ready",
+        "model": MODEL,
+        "tools": [t.name for t in agent.tools],
+        # Размер промпта без истории и запроса, если модели переданы все инструменты
+        "prompt_tokens": prompt_size(SYSTEM_PROMPT, agent.tools, [], ""),
+        "plan_cache": agent.plan_cache.stats() if agent.plan_cache else None,
+        "sessions": agent.sessions.stats(),
+    }
+
+
+@router.get("/help")
+async def agent_help():
+    """Как пользоваться агентом: примеры запросов и формат стриминга."""
+    return {
+        "query": "POST /api/agent/query {\"query\": \"...\", \"session_id\": \"...\", \"stream\": true, \"include_usage\": true}",
+        "stream_events": ["start", "queued", "token", "tool_start", "tool_end", "tool_error", "done"],
+        "batch": "POST /api/agent/batch {\"prompts\": [\"...\", ...], \"concurrency\": 4, \"retries\": 1, \"stream\": true}",
+        "batch_stream_events": ["start", "item", "summary"],
+        "examples": EXAMPLES,
+    }
@@ -0,0 +1,201 @@
+"""
+Пакетная обработка запросов к агенту: много текстовых описаний деталей за раз.
+
+Запросы выполняются пулом из concurrency обработчиков; каждый запрос — в
+своей сессии (история запросов пакета не смешивается). Общие лимиты
+остаются в силе: одновременные вызовы модели ограничивает пул сессий
+(AGENT_LLM_CONCURRENCY), операции записи CAD выполняются по очереди
+(cad_service). Неудачный запрос повторяется до retries раз с паузой.
+
+Результаты отдаются по мере готовности (run_batch — асинхронный генератор),
+в конце — сводка: успехи, ошибки, повторы, время, токены и стоимость.
+
+Используется эндпоинтом POST /api/agent/batch и из командной строки:
+    python ai_agent/batch.py prompts.txt --concurrency 4 --report batch.json
+    (файл: по запросу на строку или JSON список строк; "-" — stdin)
+
+Настройки окружения:
+    AGENT_BATCH_CONCURRENCY  — запросов пакета одновременно (по умолчанию 4)
+    AGENT_BATCH_RETRIES      — повторов неудачного запроса (по умолчанию 1)
+    AGENT_BATCH_MAX_ITEMS    — максимум запросов в пакете (по умолчанию 200)
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+import uuid
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+BATCH_CONCURRENCY = int(os.getenv("AGENT_BATCH_CONCURRENCY", "4"))
+BATCH_RETRIES = int(os.getenv("AGENT_BATCH_RETRIES", "1"))
+BATCH_MAX_ITEMS = int(os.getenv("AGENT_BATCH_MAX_ITEMS", "200"))
+# Базовая пауза перед повтором, с (растет вдвое с каждой попыткой)
+RETRY_BACKOFF = 0.5
+
+
+def _failed(result: Dict[str, Any]) -> bool:
+    # make_part отвечает пользователю напрямую: ошибка CAD приходит текстом с ❌
+    return not result.get("success") or str(result.get("response", "")).startswith("❌")
+
+
+def _percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+async def _run_item(agent, index: int, prompt: str, session_id: str, retries: int) -> Dict[str, Any]:
+    started = time.perf_counter()
+    attempts = 0
+    while True:
+        attempts += 1
+        result = await agent.aprocess(prompt, session_id, include_usage=True)
+        if not _failed(result) or attempts > retries:
+            break
+        await asyncio.sleep(RETRY_BACKOFF * 2 ** (attempts - 1))
+    usage = result.get("usage") or {}
+    return {
+        "index": index,
+        "prompt": prompt,
+        "success": not _failed(result),
+        "attempts": attempts,
+        "seconds": round(time.perf_counter() - started, 4),
+        "response": result.get("response"),
+        "error": result.get("error"),
+        "route": usage.get("route"),
+        "prompt_tokens": usage.get("prompt_tokens", 0),
+        "completion_tokens": usage.get("completion_tokens", 0),
+        "cost": usage.get("cost", 0.0),
+    }
+
+
+def summarize(items: List[Dict[str, Any]], elapsed: float) -> Dict[str, Any]:
+    """Сводка по результатам пакета."""
+    seconds = [item["seconds"] for item in items]
+    return {
+        "total": len(items),
+        "succeeded": sum(1 for item in items if item["success"]),
+        "failed": sum(1 for item in items if not item["success"]),
+        "retried": sum(1 for item in items if item["attempts"] > 1),
+        "elapsed_seconds": round(elapsed, 4),
+        "items_per_second": round(len(items) / elapsed, 3) if elapsed else None,
+        "p50_seconds": round(_percentile(seconds, 0.50), 4),
+        "p95_seconds": round(_percentile(seconds, 0.95), 4),
+        "prompt_tokens": sum(item["prompt_tokens"] for item in items),
+        "completion_tokens": sum(item["completion_tokens"] for item in items),
+        "cost": round(sum(item["cost"] for item in items), 6),
+        "failed_indexes": [item["index"] for item in items if not item["success"]],
+    }
+
+
+async def run_batch(
+    agent,
+    prompts: List[str],
+    concurrency: Optional[int] = None,
+    retries: Optional[int] = None,
+    batch_id: Optional[str] = None
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Выполнить пакет запросов, отдавая результаты по мере готовности.
+
+    Генерирует {"event": "item", "data": результат} для каждого запроса
+    в порядке завершения и последним {"event": "summary", "data": сводка}.
+    При закрытии генератора (клиент отключился) незавершенные запросы отменяются.
+    """
+    concurrency = max(1, concurrency or BATCH_CONCURRENCY)
+    retries = BATCH_RETRIES if retries is None else max(0, retries)
+    batch_id = batch_id or f"batch-{uuid.uuid4().hex[:8]}"
+    started = time.perf_counter()
+
+    pending: asyncio.Queue = asyncio.Queue()
+    for index, prompt in enumerate(prompts):
+        pending.put_nowait((index, prompt))
+    done: asyncio.Queue = asyncio.Queue()
+
+    async def worker():
+        while not pending.empty():
+            index, prompt = pending.get_nowait()
+            session_id = f"{batch_id}-{index}"
+            try:
+                item = await _run_item(agent, index, prompt, session_id, retries)
+            except Exception as e:
+                item = {"index": index, "prompt": prompt, "success": False, "attempts": 1, "seconds": 0.0,
+                        "response": None, "error": str(e), "route": None,
+                        "prompt_tokens": 0, "completion_tokens": 0, "cost": 0.0}
+            finally:
+                # История запроса пакета больше не нужна
+                await agent.memory.aclear(session_id)
+            done.put_nowait(item)
+
+    workers = [asyncio.create_task(worker()) for _ in range(min(concurrency, len(prompts)))]
+    items = []
+    try:
+        for _ in range(len(prompts)):
+            item = await done.get()
+            items.append(item)
+            yield {"event": "item", "data": item}
+        yield {"event": "summary", "data": {"batch_id": batch_id, **summarize(items, time.perf_counter() - started)}}
+    finally:
+        for task in workers:
+            task.cancel()
+        # Дожидаемся отмены: иначе loop закроется с "Task was destroyed but it is pending"
+        await asyncio.gather(*workers, return_exceptions=True)
+
+
+# ============ КОМАНДНАЯ СТРОКА ============
+
+def load_prompts(path: str) -> List[str]:
+    """Запросы из файла: JSON список строк или по запросу на строку ("-" — stdin)."""
+    text = sys.stdin.read() if path == "-" else open(path, encoding="utf-8").read()
+    if text.lstrip().startswith("["):
+        return [str(p) for p in json.loads(text)]
+    return [line.strip() for line in text.splitlines() if line.strip() and not line.startswith("#")]
+
+
+async def _main(args):
+    from ai_agent.agent import get_agent
+
+    prompts = load_prompts(args.prompts)
+    agent = get_agent()
+    print(f"📦 Пакет: {len(prompts)} запросов, одновременно {args.concurrency}, повторов {args.retries}")
+    items, summary = [], None
+    async for event in run_batch(agent, prompts, args.concurrency, args.retries):
+        if event["event"] == "item":
+            item = event["data"]
+            items.append(item)
+            mark = "✅" if item["success"] else "❌"
+            first_line = (item["response"] or item["error"] or "").splitlines()[:1]
+            print(f"{mark} [{item['index']}] {item['seconds']:.2f} с, попыток {item['attempts']}: "
+                  f"{item['prompt']} → {first_line[0] if first_line else ''}")
+        else:
+            summary = event["data"]
+    print("=" * 60)
+    print(f"Готово: {summary['succeeded']}/{summary['total']}, ошибок {summary['failed']}, "
+          f"с повторами {summary['retried']}, {summary['elapsed_seconds']:.2f} с "
+          f"({summary['items_per_second']} запр/с), токены {summary['prompt_tokens']}+{summary['completion_tokens']}, "
+          f"стоимость {summary['cost']}")
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump({"summary": summary, "items": sorted(items, key=lambda i: i["index"])}, f, ensure_ascii=False, indent=2)
+        print(f"📄 Отчет: {args.report}")
+    return 0 if summary["failed"] == 0 else 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Пакетная обработка запросов к CAD агенту")
+    parser.add_argument("prompts", help="Файл с запросами (по строке или JSON список), - для stdin")
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY, help="Запросов одновременно")
+    parser.add_argument("--retries", type=int, default=BATCH_RETRIES, help="Повторов неудачного запроса")
+    parser.add_argument("--report", help="Сохранить результаты и сводку в JSON")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(_main(args)))
+
+
+if __name__ == "__main__":
+    # Корень проекта в sys.path при запуске как скрипта (python ai_agent/batch.py)
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    main()
@@ -0,0 +1,62 @@
+"""
+Callbacks LangChain агента: спаны трассировки и события для стриминга.
+
+Модуль импортирует langchain_core, поэтому агент загружает его при
+создании (ai_agent/agent.py), а не при импорте.
+"""
+
+from typing import Any, Callable, Dict
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from tracing import current_span, new_span
+
+
+class TracingCallbackHandler(BaseCallbackHandler):
+    """Спаны для вызовов LLM внутри AgentExecutor (дочерние к agent.process)."""
+
+    # Вызываться прямо в event loop, без переброса в пул потоков
+    run_inline = True
+
+    def __init__(self, model: str):
+        self.model = model
+        self._spans = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        if current_span() is not None:
+            span = new_span("agent.llm", "CLIENT", None)
+            span.set_attribute("llm.model", self.model)
+            self._spans[run_id] = span
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        span = self._spans.pop(run_id, None)
+        if span is not None:
+            span.end()
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        span = self._spans.pop(run_id, None)
+        if span is not None:
+            span.record_error(error)
+            span.end()
+
+
+class EventCallbackHandler(BaseCallbackHandler):
+    """События агента для стриминга: токены модели, старт и результат инструментов."""
+
+    run_inline = True
+
+    def __init__(self, emit: Callable[[str, Dict[str, Any]], None]):
+        self.emit = emit
+
+    def on_llm_new_token(self, token, **kwargs):
+        if token:
+            self.emit("token", {"text": token})
+
+    def on_tool_start(self, serialized, input_str, *, inputs=None, **kwargs):
+        self.emit("tool_start", {"tool": serialized.get("name"), "input": inputs if inputs is not None else input_str})
+
+    def on_tool_end(self, output, *, name=None, **kwargs):
+        self.emit("tool_end", {"tool": name, "output": str(getattr(output, "content", output))})
+
+    def on_tool_error(self, error, *, name=None, **kwargs):
+        self.emit("tool_error", {"tool": name, "error": str(error)})
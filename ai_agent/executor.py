@@ -0,0 +1,76 @@
+"""
+Исполнитель агента с параллельным запуском независимых инструментов.
+
+Если модель за один ход вызывает несколько инструментов ("сделай куб,
+сферу и цилиндр" -> три make_part), они выполняются одновременно, и ход
+занимает время самого медленного вызова.
+
+Зависимыми считаются инструменты, которые работают с "текущим документом"
+сервера (open_document -> create_shape -> save_document -> close_document):
+они передаются в sequential_tools и выполняются строго в том порядке, в
+котором их вызвала модель. make_part (document_tools) сам открывает и
+закрывает документ, поэтому в ходе с такой цепочкой он встает в ее очередь,
+иначе закрыл бы ее документ посередине; в остальных ходах вызовы make_part
+параллельны. Чтение состояния всегда запускается параллельно. Записи в
+документы дополнительно сериализует сам сервер (см. cad_service).
+
+Класс переопределяет внутренние методы AgentExecutor (_aiter_next_step,
+_aperform_agent_action), поэтому версии langchain-classic и langchain-core
+закреплены в requirements.txt, а поведение проверяет test/test_executor.py.
+"""
+
+import asyncio
+from typing import Dict, List, Optional, Set, Tuple
+
+from langchain_classic.agents import AgentExecutor
+from langchain_core.agents import AgentAction
+from pydantic import PrivateAttr
+
+
+class ParallelAgentExecutor(AgentExecutor):
+    """AgentExecutor, сохраняющий порядок только для зависимых инструментов."""
+
+    sequential_tools: Set[str] = set()
+    """Инструменты с общим состоянием: выполняются по очереди в порядке вызова."""
+
+    document_tools: Set[str] = set()
+    """Инструменты со своим документом: в ходе с sequential_tools встают в их очередь."""
+
+    # id(AgentAction) -> (событие предыдущего зависимого вызова, свое событие)
+    _chain: Dict[int, Tuple[Optional[asyncio.Event], asyncio.Event]] = PrivateAttr(default_factory=dict)
+
+    def _plan_chain(self, actions: List[AgentAction]):
+        # Действия хода известны до их запуска: цепочка строится заново на каждое
+        dependent = self.sequential_tools
+        if any(action.tool in dependent for action in actions):
+            dependent = dependent | self.document_tools
+        previous = None
+        for action in actions:
+            if action.tool in dependent:
+                done = asyncio.Event()
+                self._chain[id(action)] = (previous, done)
+                previous = done
+
+    async def _aiter_next_step(self, name_to_tool_map, color_mapping, inputs, intermediate_steps, run_manager=None):
+        planned = []
+        try:
+            async for item in super()._aiter_next_step(
+                name_to_tool_map, color_mapping, inputs, intermediate_steps, run_manager
+            ):
+                if isinstance(item, AgentAction):
+                    planned.append(item)
+                    self._plan_chain(planned)
+                yield item
+        finally:
+            for action in planned:
+                self._chain.pop(id(action), None)
+
+    async def _aperform_agent_action(self, name_to_tool_map, color_mapping, agent_action, run_manager=None):
+        previous, done = self._chain.get(id(agent_action), (None, None))
+        if previous is not None:
+            await previous.wait()
+        try:
+            return await super()._aperform_agent_action(name_to_tool_map, color_mapping, agent_action, run_manager)
+        finally:
+            if done is not None:
+                done.set()
@@ -0,0 +1,250 @@
+"""
+Быстрый путь агента: разбор простых команд без LLM.
+
+Большая часть запросов к агенту тривиальна: "Создай куб 20мм",
+"сфера 15 в точке 10,0,0", "покажи документы". Для них не нужен вызов
+модели — команда разбирается грамматикой (русский и английский, единицы
+измерения, координаты) и сразу выполняется через CAD API.
+
+Команда считается распознанной уверенно, только если грамматика разобрала
+весь текст: после выделения фигуры, размеров, координат и имени файла не
+осталось ни одного значимого слова. Все остальное уходит в LLM, в том
+числе запросы со ссылками на разговор ("make it a cube 10") — тот же
+список слов, что и у кэша планов, — и размеры, которые после перевода
+единиц вышли больше MAX_CONVERTED_SIZE_MM ("куб 5 м" скорее опечатка,
+чем куб в 5000 мм).
+
+Настройки окружения:
+    AGENT_FAST_PATH — 0, чтобы всегда вызывать LLM (по умолчанию 1)
+"""
+
+import json
+import os
+import re
+import uuid
+from typing import Any, Dict, NamedTuple, Optional
+
+from ai_agent.plan_cache import is_contextual_query
+from tools.http_client import api_call
+
+FAST_PATH_ENABLED = os.getenv("AGENT_FAST_PATH", "1") == "1"
+
+CREATED_RU = {"cube": "Создан куб", "sphere": "Создана сфера", "cylinder": "Создан цилиндр"}
+
+_NUMBER = r"-?\d+(?:\.\d+)?"
+
+# Единицы -> множитель в миллиметры. Голое "in" не единица: в "sphere 15 in
+# point ..." это предлог, такие запросы уходят в LLM
+_UNITS = [
+    (r"мм|mm|миллиметр\w*|millimet\w*", 1.0),
+    (r"см|cm|сантиметр\w*|centimet\w*", 10.0),
+    (r"дюйм\w*|inch(?:es)?|\"", 25.4),
+    (r"м|m|метр\w*|met(?:er|re)s?", 1000.0),
+]
+# Больше этого после перевода из см, дюймов или метров — пусть решает LLM
+MAX_CONVERTED_SIZE_MM = 1000.0
+_UNIT = "|".join(f"(?:{pattern})" for pattern, _ in _UNITS)
+_QUANTITY = rf"({_NUMBER})\s*({_UNIT})?(?![\w])"
+
+_SHAPES = [
+    ("cube", r"куб\w*|cube|box"),
+    ("sphere", r"сфер\w*|шар\w*|sphere|ball"),
+    ("cylinder", r"цилиндр\w*|cylinder"),
+]
+
+_FILE = re.compile(
+    r"(?:(?:в|во|to|in|as|into)\s+)?(?:(?:файл\w*|file)\s+)?(?:как\s+)?([\w\-./\\]+\.fcstd)\b",
+    re.IGNORECASE
+)
+_POINT = re.compile(
+    rf"(?:в\s+)?(?:точк\w*|координат\w*|позици\w*|центр\w*|at|at\s+point|point|position|center)"
+    rf"\s*(?:в\s+)?[(\[]?\s*({_NUMBER})\s*[,;\s]\s*({_NUMBER})\s*[,;\s]\s*({_NUMBER})\s*[)\]]?"
+)
+# Только x=5 или x: 5 — "куб 10 x 5" это размеры 10×5, а не координата
+_AXIS = re.compile(rf"\b([xyz])\s*[=:]\s*({_NUMBER})(?![\w.])")
+_DIAMETER = re.compile(rf"(?:диаметр\w*|diameter|ø|d\s*=)\s*(?:в\s+|of\s+)?{_QUANTITY}")
+_RADIUS = re.compile(rf"(?:радиус\w*|radius|r\s*=)\s*(?:в\s+|of\s+)?{_QUANTITY}")
+_SIZE = re.compile(
+    rf"(?:(?:размер\w*|size|со\s+стороной|сторон\w*|side|ребр\w*|edge)\s*(?:в\s+|of\s+)?)?{_QUANTITY}"
+)
+
+_DOCUMENTS = re.compile(
+    r"^(?:(?:покажи|показать|выведи|вывести|список|какие|list|show|get)\s+)?"
+    r"(?:(?:все|мне|открытые|all|my|open|the)\s+)*(?:документ\w*|documents?|docs)"
+    r"(?:\s+(?:открыты|open))?$"
+)
+_HEALTH = re.compile(
+    r"^(?:(?:проверь|проверить|check|show)\s+)?(?:(?:здоровье|состояние|health)\s*(?:системы|system)?|"
+    r"(?:системы|system)\s+(?:health|check)|health\s*check)$"
+)
+_MCP_STATUS = re.compile(r"^(?:(?:покажи|проверь|show|get)\s+)?(?:статус\s+mcp|mcp\s+status)(?:\s+(?:сервера|server))?$")
+
+# Слова, которые не меняют смысла команды создания фигуры
+_STOP_WORDS = {
+    "создай", "создать", "сделай", "сделать", "построй", "построить", "нарисуй", "добавь",
+    "добавить", "мне", "пожалуйста", "плиз", "новый", "новую", "новая", "один", "одну",
+    "с", "со", "размером", "и", "сохрани", "сохранить",
+    "create", "make", "build", "draw", "add", "please", "a", "an", "the", "new", "one",
+    "with", "of", "and", "save",
+}
+
+
+class Intent(NamedTuple):
+    """Распознанная команда: действие и аргументы CAD API."""
+    action: str
+    args: Dict[str, Any]
+
+
+def _normalize(text: str) -> str:
+    text = text.lower().replace("ё", "е").strip()
+    text = re.sub(r"[!?]+$", "", text).rstrip(". ")
+    # Десятичная запятая внутри числа ("2,5 см"), но не разделитель координат ("10,0,0")
+    text = re.sub(r"(?<![\d,])(\d+),(\d+)(?![\d,])(?!\s*[,;]?\s*-?\d)", r"\1.\2", text)
+    return re.sub(r"\s+", " ", text)
+
+
+def _to_mm(value: str, unit: Optional[str]) -> Optional[float]:
+    """Размер в мм или None, если перевод единиц дал подозрительно большой размер."""
+    number = float(value)
+    if unit:
+        for pattern, factor in _UNITS:
+            if re.fullmatch(pattern, unit):
+                if factor != 1.0 and abs(number * factor) > MAX_CONVERTED_SIZE_MM:
+                    return None
+                return number * factor
+    return number
+
+
+def _take(pattern: re.Pattern, text: str):
+    """Найти первое совпадение и вырезать его из текста."""
+    match = pattern.search(text)
+    if not match:
+        return None, text
+    return match, text[:match.start()] + " " + text[match.end():]
+
+
+def _leftover_words(text: str):
+    words = re.findall(r"[\w\"]+", text)
+    return [w for w in words if w not in _STOP_WORDS]
+
+
+def _parse_create(text: str, file_name: Optional[str]) -> Optional[Intent]:
+    found = [(name, m) for name, pattern in _SHAPES for m in re.finditer(rf"\b(?:{pattern})\b", text)]
+    if len(found) != 1:
+        # Нет фигуры или несколько фигур за раз — это работа для LLM
+        return None
+    shape_type, match = found[0]
+    text = text[:match.start()] + " " + text[match.end():]
+
+    x = y = z = 0.0
+    point, text = _take(_POINT, text)
+    if point:
+        x, y, z = (float(point.group(i)) for i in (1, 2, 3))
+    else:
+        axes = {}
+        while True:
+            axis, text = _take(_AXIS, text)
+            if not axis:
+                break
+            if axis.group(1) in axes:
+                return None
+            axes[axis.group(1)] = float(axis.group(2))
+        x, y, z = axes.get("x", 0.0), axes.get("y", 0.0), axes.get("z", 0.0)
+
+    size = None
+    diameter, text = _take(_DIAMETER, text)
+    radius, text = _take(_RADIUS, text)
+    if diameter and radius:
+        return None
+    if (diameter or radius) and shape_type == "cube":
+        return None
+    if diameter or radius:
+        size = _to_mm(*(diameter or radius).group(1, 2))
+        if size is None:
+            return None
+        if radius:
+            size *= 2
+    else:
+        quantity, text = _take(_SIZE, text)
+        if quantity:
+            size = _to_mm(quantity.group(1), quantity.group(2))
+            if size is None:
+                return None
+
+    if _leftover_words(text):
+        return None
+    if size is not None and size <= 0:
+        return None
+
+    return Intent("create_shape", {
+        "shape_type": shape_type,
+        "size": size if size is not None else 10.0,
+        "x": x, "y": y, "z": z,
+        "file_name": file_name,
+    })
+
+
+def parse_command(query: str) -> Optional[Intent]:
+    """
+    Разобрать команду пользователя.
+
+    Returns:
+        Intent, если команда разобрана целиком, иначе None (нужен LLM).
+    """
+    if is_contextual_query(query):
+        return None
+    # Имя файла вырезаем до приведения к нижнему регистру, чтобы сохранить его как есть
+    file_match, query = _take(_FILE, query)
+    file_name = file_match.group(1) if file_match else None
+
+    text = _normalize(query)
+    if not text:
+        return None
+    if file_name:
+        return _parse_create(text, file_name)
+    if _DOCUMENTS.match(text):
+        return Intent("get_documents", {})
+    if _HEALTH.match(text):
+        return Intent("get_health", {})
+    if _MCP_STATUS.match(text):
+        return Intent("get_mcp_status", {})
+    return _parse_create(text, None)
+
+
+def _fmt(value: float) -> str:
+    return f"{value:g}"
+
+
+async def execute_intent(intent: Intent) -> str:
+    """Выполнить разобранную команду через CAD API и вернуть ответ пользователю."""
+    if intent.action == "get_documents":
+        data = await api_call("/api/cad/documents", idempotent=True)
+        return f"📋 {data.get('result')}"
+
+    if intent.action == "get_mcp_status":
+        data = await api_call("/api/mcp/status", idempotent=True)
+        return f"📊 MCP сервер: {data.get('status')}, инструментов: {len(data.get('tools', []))}"
+
+    if intent.action == "get_health":
+        # Тот же инструмент, что вызвала бы модель
+        from ai_agent.agent import get_health
+        health = json.loads(await get_health())
+        lines = [f"{'✅' if ok else '❌'} {name}" for name, ok in health.items() if isinstance(ok, bool)]
+        return "🩺 Состояние системы:\n" + "\n".join(lines)
+
+    if intent.action == "create_shape":
+        args = intent.args
+        shape_type, size = args["shape_type"], args["size"]
+        file_name = args["file_name"] or f"auto_{shape_type}_{_fmt(size)}mm_{uuid.uuid4().hex[:6]}.FCStd"
+        # Открыть, создать, сохранить и закрыть — одной транзакцией на сервере
+        data = await api_call("/api/cad/make-part", json={"file_name": file_name, "parts": [
+            {"shape_type": shape_type, "size": size, "x": args["x"], "y": args["y"], "z": args["z"]},
+        ]})
+        if not data.get("success"):
+            return f"❌ {data.get('result')}"
+        return (
+            f"✅ {CREATED_RU[shape_type]} {_fmt(size)} мм в точке "
+            f"({_fmt(args['x'])}, {_fmt(args['y'])}, {_fmt(args['z'])}), файл: {file_name}"
+        )
+
+    raise ValueError(f"Неизвестное действие: {intent.action}")
@@ -0,0 +1,165 @@
+"""
+Кэш планов агента: запрос -> список вызовов инструментов.
+
+Пользователи часто повторяют одни и те же запросы с мелкими отличиями
+("Создай куб 20мм" / "создай, пожалуйста, куб 20 мм!"). Вместо текста
+ответа кэшируется план — какие инструменты и с какими аргументами вызвала
+модель. Повторный запрос выполняет план заново против CAD API без вызова
+модели, поэтому данные в ответе (список документов и т.п.) всегда свежие.
+
+Ключ — нормализованный запрос плюс отпечаток состояния агента (модель,
+промпт, набор инструментов): смена промпта или модели не отдаст старые планы.
+Запросы со ссылками на предыдущий разговор ("сделай его больше") не
+кэшируются — их план зависит от истории.
+
+Хранилище — SQLite на диске, переживает перезапуск. Агент обращается к нему
+через aget/aput (asyncio.to_thread), чтобы запись на диск не останавливала
+event loop.
+
+Настройки окружения:
+    AGENT_PLAN_CACHE              — 0, чтобы выключить кэш (по умолчанию 1)
+    AGENT_PLAN_CACHE_PATH         — файл базы (по умолчанию plan_cache.db)
+    AGENT_PLAN_CACHE_TTL          — время жизни плана, с (по умолчанию 86400)
+    AGENT_PLAN_CACHE_MAX_ENTRIES  — максимум планов, старые вытесняются (1000)
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from metrics import record_cache
+
+PLAN_CACHE_ENABLED = os.getenv("AGENT_PLAN_CACHE", "1") == "1"
+PLAN_CACHE_PATH = os.getenv("AGENT_PLAN_CACHE_PATH", "plan_cache.db")
+PLAN_CACHE_TTL = float(os.getenv("AGENT_PLAN_CACHE_TTL", "86400"))
+PLAN_CACHE_MAX_ENTRIES = int(os.getenv("AGENT_PLAN_CACHE_MAX_ENTRIES", "1000"))
+
+# Слова-паразиты и синонимы глаголов, которые не меняют план
+_FILLER = {"пожалуйста", "плиз", "please", "мне", "ну", "можешь", "можно", "can", "you", "could", "a", "an", "the"}
+_VERBS = {
+    "сделай": "создай", "построй": "создай", "нарисуй": "создай", "create": "создай",
+    "make": "создай", "build": "создай", "draw": "создай",
+    "покажи": "покажи", "выведи": "покажи", "show": "покажи", "list": "покажи",
+}
+# Ссылки на предыдущие сообщения: план таких запросов зависит от истории
+_CONTEXTUAL = re.compile(
+    r"\b(?:его|ее|её|это|этот|эту|этого|такой|такую|такого|тот же|ту же|предыдущ\w*|прошл\w*|"
+    r"еще|ещё|снова|опять|it|this|that|same|previous|again|another|last)\b"
+)
+
+
+def normalize_query(query: str) -> str:
+    """Привести запрос к каноническому виду для ключа кэша."""
+    text = query.lower().replace("ё", "е")
+    # "20мм" и "20 мм" — одно и то же
+    text = re.sub(r"(\d)\s*([a-zа-я])", r"\1 \2", text)
+    words = re.findall(r"[\w.\-]+", text)
+    return " ".join(_VERBS.get(w, w) for w in words if w not in _FILLER)
+
+
+def is_contextual_query(query: str) -> bool:
+    """Ссылается ли запрос на предыдущий разговор ("сделай его больше")."""
+    return _CONTEXTUAL.search(query.lower()) is not None
+
+
+def is_cacheable_query(query: str) -> bool:
+    """Можно ли кэшировать план запроса (он не ссылается на историю)."""
+    return not is_contextual_query(query)
+
+
+class PlanCache:
+    """Персистентный кэш планов с TTL, ограничением размера и статистикой."""
+
+    def __init__(self, path: str = PLAN_CACHE_PATH, ttl: float = PLAN_CACHE_TTL, max_entries: int = PLAN_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS plans ("
+            " key TEXT PRIMARY KEY, query TEXT NOT NULL, plan TEXT NOT NULL,"
+            " created_at REAL NOT NULL, last_used_at REAL NOT NULL, hits INTEGER NOT NULL DEFAULT 0)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS plans_last_used ON plans(last_used_at)")
+
+    @staticmethod
+    def make_key(query: str, state: str = "") -> str:
+        payload = json.dumps([normalize_query(query), state], ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, query: str, state: str = "") -> Optional[List[Dict[str, Any]]]:
+        """План для запроса или None (промах, план устарел или запрос не кэшируется)."""
+        if not is_cacheable_query(query):
+            return None
+        key = self.make_key(query, state)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT plan FROM plans WHERE key = ? AND created_at > ?", (key, now - self.ttl)
+            ).fetchone()
+            if row is not None:
+                self._conn.execute(
+                    "UPDATE plans SET last_used_at = ?, hits = hits + 1 WHERE key = ?", (now, key)
+                )
+                self.hits += 1
+            else:
+                self.misses += 1
+        record_cache("agent_plan", row is not None)
+        return json.loads(row[0]) if row is not None else None
+
+    def put(self, query: str, plan: List[Dict[str, Any]], state: str = ""):
+        """Сохранить план и вытеснить устаревшие и самые давно использованные."""
+        if not plan or not is_cacheable_query(query):
+            return
+        key = self.make_key(query, state)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO plans (key, query, plan, created_at, last_used_at, hits)"
+                " VALUES (?, ?, ?, ?, ?, 0)",
+                (key, query, json.dumps(plan, ensure_ascii=False), now, now)
+            )
+            self._conn.execute("DELETE FROM plans WHERE created_at <= ?", (now - self.ttl,))
+            self._conn.execute(
+                "DELETE FROM plans WHERE key IN ("
+                " SELECT key FROM plans ORDER BY last_used_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+
+    async def aget(self, query: str, state: str = "") -> Optional[List[Dict[str, Any]]]:
+        return await asyncio.to_thread(self.get, query, state)
+
+    async def aput(self, query: str, plan: List[Dict[str, Any]], state: str = ""):
+        await asyncio.to_thread(self.put, query, plan, state)
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM plans")
+
+    def stats(self) -> Dict[str, Any]:
+        """Статистика: попадания и промахи с запуска процесса, число планов на диске."""
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM plans").fetchone()[0]
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
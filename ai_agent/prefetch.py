@@ -0,0 +1,71 @@
+"""
+Спекулятивная подготовка CAD, пока агент ждет ответа модели.
+
+Ответ модели занимает секунды, и все это время CAD простаивает, а потом
+первый инструмент еще платит за подключение FreeCAD, первые операции ядра
+геометрии и чтение файла с диска. CADPrefetch сразу после получения
+запроса запускает /api/cad/prefetch параллельно с вызовом модели:
+подключение FreeCAD, пробные примитивы и чтение упомянутых в запросе
+.FCStd в кэш ОС (см. cad_service.prefetch).
+
+Если к концу запроса прогрев не завершился (модель ответила без
+инструментов или быстрее прогрева), задача отменяется. Документ при
+прогреве не открывается: текущий документ gateway общий для всех запросов.
+
+Настройки окружения:
+    AGENT_PREFETCH — 0, чтобы выключить прогрев (по умолчанию 1)
+"""
+
+import asyncio
+import logging
+import os
+import re
+import time
+from typing import List
+
+from metrics import AGENT_PREFETCH
+from tools.http_client import api_call
+
+PREFETCH_ENABLED = os.getenv("AGENT_PREFETCH", "1") == "1"
+
+_FILE = re.compile(r"[\w\-./\\]+\.fcstd\b", re.IGNORECASE)
+
+logger = logging.getLogger("CADAgent")
+
+
+def mentioned_files(query: str) -> List[str]:
+    """Файлы .FCStd, упомянутые в запросе (без повторов, в порядке появления)."""
+    return list(dict.fromkeys(_FILE.findall(query)))
+
+
+class CADPrefetch:
+    """Фоновый прогрев CAD на время одного запроса к модели."""
+
+    def __init__(self, query: str):
+        self.files = mentioned_files(query)
+        self.started = time.perf_counter()
+        self.seconds = None
+        self.task = asyncio.create_task(self._run())
+        # Исход забираем в finish; отмененная задача не должна писать в лог asyncio
+        self.task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+    async def _run(self):
+        result = await api_call("/api/cad/prefetch", json={"files": self.files}, idempotent=True)
+        self.seconds = time.perf_counter() - self.started
+        return result
+
+    def finish(self) -> str:
+        """Завершить прогрев: completed, cancelled (не успел, не понадобился) или error."""
+        if not self.task.done():
+            self.task.cancel()
+            outcome = "cancelled"
+        elif self.task.cancelled():
+            outcome = "cancelled"
+        elif self.task.exception() is not None:
+            logger.warning(f"⚠️ Прогрев CAD не удался: {self.task.exception()}")
+            outcome = "error"
+        else:
+            outcome = "completed"
+            logger.info(f"🔥 CAD прогрет за {self.seconds:.3f} с, пока модель отвечала")
+        AGENT_PREFETCH.labels(outcome).inc()
+        return outcome
@@ -0,0 +1,222 @@
+"""
+Память агента по сессиям с ограниченным размером.
+
+У каждого пользователя (сессии) своя история в SQLite. В промпт попадает
+только окно последних реплик в пределах бюджета токенов плюс краткое
+резюме более старого разговора, поэтому размер chat_history не растет,
+сколько бы сервер ни работал.
+
+Когда реплики выходят за окно, они в фоне сворачиваются в резюме
+(вызовом LLM, если передан summarizer) и удаляются из базы.
+
+Асинхронные методы (aload, asave_turn, aclear и фоновая свертка) ходят
+в SQLite через asyncio.to_thread, чтобы запись на диск не останавливала
+event loop.
+
+Настройки окружения:
+    AGENT_MEMORY_PATH                — файл базы (по умолчанию agent_memory.db)
+    AGENT_MEMORY_MAX_TOKENS          — бюджет токенов на окно реплик (1500)
+    AGENT_MEMORY_WINDOW              — максимум реплик в окне (10)
+    AGENT_MEMORY_SUMMARY_MAX_TOKENS  — максимум токенов резюме (300)
+"""
+
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import TYPE_CHECKING, Awaitable, Callable, List, Optional
+
+if TYPE_CHECKING:
+    # Сообщения LangChain нужны только агенту; gateway импортирует модуль ради DEFAULT_SESSION
+    from langchain_core.messages import BaseMessage
+
+MEMORY_PATH = os.getenv("AGENT_MEMORY_PATH", "agent_memory.db")
+MEMORY_MAX_TOKENS = int(os.getenv("AGENT_MEMORY_MAX_TOKENS", "1500"))
+MEMORY_WINDOW = int(os.getenv("AGENT_MEMORY_WINDOW", "10"))
+MEMORY_SUMMARY_MAX_TOKENS = int(os.getenv("AGENT_MEMORY_SUMMARY_MAX_TOKENS", "300"))
+
+DEFAULT_SESSION = "default"
+
+logger = logging.getLogger("CADAgent.memory")
+
+# summarizer(текущее резюме, новые реплики) -> новое резюме
+Summarizer = Callable[[str, str], Awaitable[str]]
+
+
+def estimate_tokens(text: str) -> int:
+    """Грубая оценка числа токенов (~3 символа на токен для смеси RU/EN)."""
+    return len(text) // 3 + 1
+
+
+class SessionMemory:
+    """История диалогов по сессиям: окно последних реплик + резюме."""
+
+    def __init__(
+        self,
+        path: str = MEMORY_PATH,
+        summarizer: Optional[Summarizer] = None,
+        max_tokens: int = MEMORY_MAX_TOKENS,
+        window: int = MEMORY_WINDOW,
+        summary_max_tokens: int = MEMORY_SUMMARY_MAX_TOKENS
+    ):
+        self.summarizer = summarizer
+        self.max_tokens = max_tokens
+        self.window = window
+        self.summary_max_tokens = summary_max_tokens
+        self._lock = threading.Lock()
+        self._summarizing = set()
+        self._tasks = set()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS messages ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT NOT NULL, role TEXT NOT NULL,"
+            " content TEXT NOT NULL, tokens INTEGER NOT NULL, created_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS messages_session ON messages(session_id, id)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS summaries ("
+            " session_id TEXT PRIMARY KEY, summary TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+
+    def _window_rows(self, session_id: str):
+        """Последние реплики сессии в пределах окна и бюджета токенов (от старых к новым)."""
+        rows = self._conn.execute(
+            "SELECT id, role, content, tokens FROM messages WHERE session_id = ?"
+            " ORDER BY id DESC LIMIT ?", (session_id, self.window)
+        ).fetchall()
+        selected, budget = [], self.max_tokens
+        for row in rows:
+            if row[3] > budget and selected:
+                break
+            selected.append(row)
+            budget -= row[3]
+        return list(reversed(selected))
+
+    def messages(self, session_id: str = DEFAULT_SESSION) -> List["BaseMessage"]:
+        """chat_history для промпта: резюме (если есть) и окно последних реплик."""
+        from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+        with self._lock:
+            summary = self._conn.execute(
+                "SELECT summary FROM summaries WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            rows = self._window_rows(session_id)
+        history: List["BaseMessage"] = []
+        if summary:
+            history.append(SystemMessage(content=f"Краткое содержание предыдущего разговора: {summary[0]}"))
+        for _, role, content, _ in rows:
+            history.append(HumanMessage(content=content) if role == "human" else AIMessage(content=content))
+        return history
+
+    async def aload(self, session_id: str = DEFAULT_SESSION) -> List["BaseMessage"]:
+        return await asyncio.to_thread(self.messages, session_id)
+
+    def save_turn(self, session_id: str, user_text: str, ai_text: str) -> bool:
+        """Записать реплику пользователя и ответ агента; True, если пора сворачивать старые."""
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT INTO messages (session_id, role, content, tokens, created_at) VALUES (?, ?, ?, ?, ?)",
+                [
+                    (session_id, "human", user_text, estimate_tokens(user_text), now),
+                    (session_id, "ai", ai_text, estimate_tokens(ai_text), now),
+                ]
+            )
+            return session_id not in self._summarizing and bool(self._stale_rows(session_id))
+
+    async def asave_turn(self, session_id: str, user_text: str, ai_text: str):
+        """Записать обмен (в потоке); старые реплики свернуть в фоне."""
+        if await asyncio.to_thread(self.save_turn, session_id, user_text, ai_text):
+            self._schedule_summary(session_id)
+
+    def _stale_rows(self, session_id: str):
+        """Реплики, которые уже не попадают в окно."""
+        window = self._window_rows(session_id)
+        if not window:
+            return []
+        return self._conn.execute(
+            "SELECT id, role, content FROM messages WHERE session_id = ? AND id < ? ORDER BY id",
+            (session_id, window[0][0])
+        ).fetchall()
+
+    def _schedule_summary(self, session_id: str):
+        if session_id in self._summarizing:
+            return
+        self._summarizing.add(session_id)
+        task = asyncio.get_running_loop().create_task(self._summarize(session_id))
+        # Держим ссылку, иначе задачу может собрать сборщик мусора
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _load_stale(self, session_id: str):
+        with self._lock:
+            stale = self._stale_rows(session_id)
+            previous = self._conn.execute(
+                "SELECT summary FROM summaries WHERE session_id = ?", (session_id,)
+            ).fetchone()
+        return stale, previous[0] if previous else ""
+
+    def _store_summary(self, session_id: str, summary: str, last_id: int):
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.execute(
+                "INSERT INTO summaries (session_id, summary, updated_at) VALUES (?, ?, ?)"
+                " ON CONFLICT(session_id) DO UPDATE SET summary = excluded.summary, updated_at = excluded.updated_at",
+                (session_id, summary, time.time())
+            )
+            self._conn.execute("DELETE FROM messages WHERE session_id = ? AND id <= ?", (session_id, last_id))
+            self._conn.execute("COMMIT")
+
+    async def _summarize(self, session_id: str):
+        try:
+            stale, previous = await asyncio.to_thread(self._load_stale, session_id)
+            if not stale:
+                return
+            transcript = "\n".join(
+                f"{'Пользователь' if role == 'human' else 'Агент'}: {content}" for _, role, content in stale
+            )
+            summary = await self._make_summary(previous, transcript)
+            # Резюме тоже ограничено, иначе промпт рос бы через него
+            summary = summary[:self.summary_max_tokens * 3]
+            await asyncio.to_thread(self._store_summary, session_id, summary, stale[-1][0])
+        except Exception as e:
+            # Реплики остаются в базе, резюме повторится после следующего запроса
+            logger.warning(f"⚠️ Не удалось свернуть историю сессии {session_id}: {e}")
+        finally:
+            self._summarizing.discard(session_id)
+
+    async def _make_summary(self, previous: str, transcript: str) -> str:
+        if self.summarizer is not None:
+            return (await self.summarizer(previous, transcript)).strip()
+        # Без LLM оставляем самые свежие строки в пределах лимита
+        combined = f"{previous}\n{transcript}".strip()
+        return combined[-self.summary_max_tokens * 3:]
+
+    async def wait_idle(self):
+        """Дождаться фоновых сверток (для тестов и остановки сервера)."""
+        if self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+
+    def clear(self, session_id: Optional[str] = None):
+        """Очистить историю одной сессии или всех."""
+        with self._lock:
+            if session_id is None:
+                self._conn.execute("DELETE FROM messages")
+                self._conn.execute("DELETE FROM summaries")
+            else:
+                self._conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+                self._conn.execute("DELETE FROM summaries WHERE session_id = ?", (session_id,))
+
+    async def aclear(self, session_id: Optional[str] = None):
+        await asyncio.to_thread(self.clear, session_id)
+
+    def prompt_tokens(self, session_id: str = DEFAULT_SESSION) -> int:
+        """Оценка размера chat_history сессии в токенах."""
+        return sum(estimate_tokens(str(m.content)) for m in self.messages(session_id))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
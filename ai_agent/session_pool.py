@@ -0,0 +1,146 @@
+"""
+Пул состояний сессий агента.
+
+Тяжелые части агента (клиент LLM, инструменты, исполнитель) одни на процесс.
+На каждую сессию заводится легкое состояние: лимит одновременных запросов
+к LLM и статистика. История диалога сессии живет в SessionMemory (SQLite),
+поэтому состояние можно вытеснить и создать заново без потерь.
+
+Сессии хранятся в LRU: при превышении AGENT_MAX_SESSIONS вытесняются
+самые давно использованные простаивающие сессии.
+
+Лимиты LLM:
+    - на сессию — запросы одного пользователя к модели идут по очереди
+      (по умолчанию), поэтому его история не перемешивается;
+    - глобальный — сколько запросов к модели выполняется одновременно на
+      весь процесс; остальные ждут в очереди.
+Лимит действует на запросы, которым нужна модель; быстрый путь и кэш
+планов выполняются без ожидания. Семафоры заводятся на каждый event loop:
+process() агента запускает каждый запрос в своем asyncio.run.
+
+Настройки окружения:
+    AGENT_MAX_SESSIONS             — максимум сессий в памяти (по умолчанию 1000)
+    AGENT_SESSION_LLM_CONCURRENCY  — одновременных запросов к LLM на сессию (1)
+    AGENT_LLM_CONCURRENCY          — одновременных запросов к LLM на процесс (16)
+"""
+
+import asyncio
+import os
+import time
+import weakref
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Any, Dict
+
+MAX_SESSIONS = int(os.getenv("AGENT_MAX_SESSIONS", "1000"))
+SESSION_LLM_CONCURRENCY = int(os.getenv("AGENT_SESSION_LLM_CONCURRENCY", "1"))
+LLM_CONCURRENCY = int(os.getenv("AGENT_LLM_CONCURRENCY", "16"))
+
+
+def _loop_semaphore(semaphores: weakref.WeakKeyDictionary, limit: int) -> asyncio.Semaphore:
+    # asyncio.Semaphore привязан к своему loop
+    loop = asyncio.get_running_loop()
+    semaphore = semaphores.get(loop)
+    if semaphore is None:
+        semaphore = semaphores[loop] = asyncio.Semaphore(limit)
+    return semaphore
+
+
+def _in_use(semaphores: weakref.WeakKeyDictionary, limit: int) -> int:
+    return sum(limit - semaphore._value for semaphore in list(semaphores.values()))
+
+
+class SessionState:
+    """Легкое состояние одной сессии."""
+
+    def __init__(self, session_id: str, llm_concurrency: int):
+        self.session_id = session_id
+        self.llm_concurrency = llm_concurrency
+        self._llm_slots = weakref.WeakKeyDictionary()
+        self.active = 0
+        self.queries = 0
+        self.last_used = time.time()
+
+    @property
+    def llm_slots(self) -> asyncio.Semaphore:
+        """Слоты LLM сессии в текущем event loop."""
+        return _loop_semaphore(self._llm_slots, self.llm_concurrency)
+
+
+class SessionPool:
+    """LRU пул сессий с лимитами одновременных запросов к LLM."""
+
+    def __init__(
+        self,
+        max_sessions: int = MAX_SESSIONS,
+        session_llm_concurrency: int = SESSION_LLM_CONCURRENCY,
+        llm_concurrency: int = LLM_CONCURRENCY
+    ):
+        self.max_sessions = max_sessions
+        self.session_llm_concurrency = session_llm_concurrency
+        self.llm_concurrency = llm_concurrency
+        self._llm_slots = weakref.WeakKeyDictionary()
+        self.sessions: "OrderedDict[str, SessionState]" = OrderedDict()
+        self.evicted = 0
+        self.queued = 0
+
+    @property
+    def llm_slots(self) -> asyncio.Semaphore:
+        """Слоты LLM процесса в текущем event loop."""
+        return _loop_semaphore(self._llm_slots, self.llm_concurrency)
+
+    def get(self, session_id: str) -> SessionState:
+        """Состояние сессии (создается при первом обращении)."""
+        state = self.sessions.get(session_id)
+        if state is None:
+            state = self.sessions[session_id] = SessionState(session_id, self.session_llm_concurrency)
+            self._evict()
+        else:
+            self.sessions.move_to_end(session_id)
+        state.last_used = time.time()
+        return state
+
+    def _evict(self):
+        # Вытесняем самые старые простаивающие сессии; занятые пропускаем.
+        # Последняя — только что созданная, ее get() сейчас вернет
+        for session_id in list(self.sessions)[:-1]:
+            if len(self.sessions) <= self.max_sessions:
+                break
+            if self.sessions[session_id].active == 0:
+                del self.sessions[session_id]
+                self.evicted += 1
+
+    @asynccontextmanager
+    async def session(self, session_id: str):
+        """Запрос сессии: сессия не вытесняется, пока он выполняется."""
+        state = self.get(session_id)
+        state.active += 1
+        state.queries += 1
+        try:
+            yield state
+        finally:
+            state.active -= 1
+            state.last_used = time.time()
+
+    @asynccontextmanager
+    async def llm_slot(self, state: SessionState, on_wait=None):
+        """Дождаться свободного слота LLM сессии и процесса."""
+        session_slots, process_slots = state.llm_slots, self.llm_slots
+        if (session_slots.locked() or process_slots.locked()) and on_wait is not None:
+            on_wait()
+        if process_slots.locked():
+            self.queued += 1
+        async with session_slots:
+            async with process_slots:
+                yield
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "sessions": len(self.sessions),
+            "active_sessions": sum(1 for s in self.sessions.values() if s.active),
+            "max_sessions": self.max_sessions,
+            "evicted": self.evicted,
+            "llm_concurrency": self.llm_concurrency,
+            "llm_in_use": _in_use(self._llm_slots, self.llm_concurrency),
+            "queued_for_llm": self.queued,
+        }
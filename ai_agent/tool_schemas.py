@@ -0,0 +1,140 @@
+"""
+Компактные схемы инструментов агента и выбор инструментов под запрос.
+
+Схемы всех переданных инструментов уходят модели в каждом вызове, поэтому:
+    - параметры фигур генерируются из реестра cad_service.SHAPES — типы фигур
+      и их параметры описаны в одном месте;
+    - схемы записаны вручную, без anyOf/null и заголовков, которые добавляет
+      автоматический вывод из сигнатуры; описания короткие;
+    - на каждый запрос модели выдается только группа инструментов под
+      намерение (select_tools); если намерение не распознано — все.
+
+prompt_size() оценивает размер промпта в токенах по частям: системный
+промпт, схемы инструментов, история сессии, запрос.
+
+Настройки окружения:
+    AGENT_TOOL_SELECTION — 0, чтобы всегда передавать модели все инструменты (по умолчанию 1)
+"""
+
+import json
+import os
+import re
+from typing import Any, Dict, Iterable, List
+
+from cad_service import SHAPES, SIMPLE_SHAPES
+from ai_agent.session_memory import estimate_tokens
+
+TOOL_SELECTION_ENABLED = os.getenv("AGENT_TOOL_SELECTION", "1") == "1"
+
+_JSON_TYPES = {int: "integer", float: "number"}
+_STRING = {"type": "string"}
+_NUMBER = {"type": "number"}
+_BOOLEAN = {"type": "boolean"}
+
+
+def _object(properties: Dict[str, Any], required: Iterable[str] = ()) -> Dict[str, Any]:
+    schema = {"type": "object", "properties": properties}
+    if required:
+        schema["required"] = list(required)
+    return schema
+
+
+def part_schema() -> Dict[str, Any]:
+    """Схема одной фигуры детали: shape_type и параметры всех фигур реестра."""
+    properties: Dict[str, Any] = {"shape_type": {"enum": list(SHAPES)}}
+    for params in SHAPES.values():
+        for name, kind in params.items():
+            properties.setdefault(name, {"type": _JSON_TYPES[kind]})
+    properties["subtract"] = _BOOLEAN
+    return _object(properties, ["shape_type"])
+
+
+def shapes_hint() -> str:
+    """Какие параметры у каких фигур: 'cube|sphere|cylinder: size, x, y, z; star: ...'."""
+    groups: Dict[tuple, List[str]] = {}
+    for name, params in SHAPES.items():
+        groups.setdefault(tuple(params), []).append(name)
+    return "; ".join(f"{'|'.join(names)}: {', '.join(params)}" for params, names in groups.items())
+
+
+MAKE_PART_SCHEMA = _object({
+    "parts": {"type": "array", "items": part_schema()},
+    "file_name": _STRING,
+    "fuse": _BOOLEAN,
+    "export": _STRING,
+}, ["parts"])
+
+MAKE_PART_DESCRIPTION = (
+    f"Новый файл детали за один вызов. Параметры фигур (мм): {shapes_hint()}. "
+    "subtract — отверстие, fuse — одно тело, export — .step/.stl."
+)
+
+CREATE_SHAPE_SCHEMA = _object({
+    "shape_type": {"enum": SIMPLE_SHAPES},
+    "size": _NUMBER,
+    "x": _NUMBER,
+    "y": _NUMBER,
+    "z": _NUMBER,
+}, ["shape_type", "size"])
+
+OPEN_DOCUMENT_SCHEMA = _object({"file_path": _STRING}, ["file_path"])
+SAVE_DOCUMENT_SCHEMA = _object({"file_path": _STRING})
+NO_ARGS_SCHEMA = _object({})
+
+# Группы инструментов по намерению запроса
+TOOL_GROUPS = {
+    "part": ["make_part"],
+    "document": ["open_document", "create_shape", "save_document", "close_document"],
+    "list": ["get_documents"],
+    "health": ["get_health"],
+}
+
+_SHAPE_WORDS = r"куб|сфер|шар|цилиндр|звезд|шестер|зубчат|\bтор|" + "|".join(SHAPES)
+_INTENTS = [
+    ("part", re.compile(r"созда|сдела|постро|нарису|детал|фигур|отверсти|" + _SHAPE_WORDS, re.IGNORECASE)),
+    ("document", re.compile(r"откро|откры|добав|сохран|закро|закры|\.fcstd|\bopen|\bsave|\bclose|\badd", re.IGNORECASE)),
+    ("list", re.compile(r"документ|файл|список|покажи|\blist|document", re.IGNORECASE)),
+    ("health", re.compile(r"здоров|статус|состояни|провер|работает|health|status", re.IGNORECASE)),
+]
+
+
+def select_tools(query: str, tools: List[Any]) -> List[Any]:
+    """
+    Инструменты для запроса: объединение групп распознанных намерений.
+
+    Порядок инструментов сохраняется. Если ни одно намерение не распознано
+    (или выбор выключен), возвращаются все инструменты.
+    """
+    if not TOOL_SELECTION_ENABLED:
+        return tools
+    names = {name for group, pattern in _INTENTS if pattern.search(query) for name in TOOL_GROUPS[group]}
+    selected = [t for t in tools if t.name in names]
+    return selected or tools
+
+
+# Набор инструментов (имя, описание) -> размер схем; схемы не меняются во время работы
+_tool_tokens_cache: Dict[tuple, int] = {}
+
+
+def tool_tokens(tools: List[Any]) -> int:
+    """Оценка размера схем инструментов в токенах (как они уходят в API)."""
+    from langchain_core.utils.function_calling import convert_to_openai_tool
+
+    key = tuple((t.name, t.description) for t in tools)
+    if key not in _tool_tokens_cache:
+        _tool_tokens_cache[key] = sum(
+            estimate_tokens(json.dumps(convert_to_openai_tool(t), ensure_ascii=False)) for t in tools
+        )
+    return _tool_tokens_cache[key]
+
+
+def prompt_size(system: str, tools: List[Any], history: List[Any], query: str) -> Dict[str, int]:
+    """Оценка промпта одного вызова модели в токенах по частям и итого."""
+    size = {
+        "system": estimate_tokens(system),
+        "tools": tool_tokens(tools),
+        "history": sum(estimate_tokens(str(m.content)) for m in history),
+        "input": estimate_tokens(query),
+    }
+    size["total"] = sum(size.values())
+    return size
@@ -0,0 +1,142 @@
+"""
+Учет ресурсов одного запроса к агенту.
+
+QueryUsage — callback LangChain, который на время запроса собирает:
+число вызовов LLM и итераций агента, токены prompt/completion, время в
+модели и в инструментах, попадания в быстрый путь и кэш планов, оценку
+стоимости, размер промпта по частям (системный промпт, схемы инструментов,
+история, запрос) и переданные модели инструменты. Итог пишется в лог
+и метрики Prometheus (metrics.record_agent_query) и по запросу
+возвращается в ответе агента (поле usage).
+
+Быстрый путь выполняет команду без LangChain и callbacks, поэтому агент
+передает время его вызова сам (record_tool).
+
+Токены берутся из usage, который вернул провайдер; если его нет, они
+оцениваются по длине текста (usage.estimated = true).
+
+Настройки окружения:
+    AGENT_PRICE_PROMPT_PER_1K      — цена 1000 prompt токенов (по умолчанию 0)
+    AGENT_PRICE_COMPLETION_PER_1K  — цена 1000 completion токенов (по умолчанию 0)
+    AGENT_RETURN_USAGE             — 1, чтобы всегда добавлять usage в ответ (по умолчанию 0)
+"""
+
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from ai_agent.session_memory import estimate_tokens
+from metrics import AGENT_LLM_DURATION, AGENT_TOOL_DURATION
+
+PRICE_PROMPT_PER_1K = float(os.getenv("AGENT_PRICE_PROMPT_PER_1K", "0"))
+PRICE_COMPLETION_PER_1K = float(os.getenv("AGENT_PRICE_COMPLETION_PER_1K", "0"))
+RETURN_USAGE = os.getenv("AGENT_RETURN_USAGE", "0") == "1"
+
+
+class QueryUsage(BaseCallbackHandler):
+    """Счетчики одного запроса к агенту."""
+
+    run_inline = True
+
+    def __init__(self, model: str):
+        self.model = model
+        self.started = time.perf_counter()
+        self.llm_calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.estimated = False
+        self.llm_seconds = 0.0
+        self.tool_calls = 0
+        self.tool_errors = 0
+        self.tool_seconds = 0.0
+        # Заполняет агент перед вызовом модели (ai_agent/tool_schemas.py)
+        self.prompt: Dict[str, int] = {}
+        self.tools: List[str] = []
+        # Исход прогрева CAD (ai_agent/prefetch.py), если он запускался
+        self.prefetch: Optional[str] = None
+        self._llm_runs: Dict[Any, tuple] = {}
+        self._tool_runs: Dict[Any, tuple] = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        prompt = sum(estimate_tokens(str(m.content)) for batch in messages for m in batch)
+        self._llm_runs[run_id] = (time.perf_counter(), prompt)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        start, estimated_prompt = self._llm_runs.pop(run_id, (time.perf_counter(), 0))
+        duration = time.perf_counter() - start
+        self.llm_calls += 1
+        self.llm_seconds += duration
+        AGENT_LLM_DURATION.labels(self.model).observe(duration)
+
+        usage = None
+        generations = response.generations[0] if response.generations else []
+        message = getattr(generations[0], "message", None) if generations else None
+        if message is not None and getattr(message, "usage_metadata", None):
+            usage = message.usage_metadata
+            prompt, completion = usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+        elif (response.llm_output or {}).get("token_usage"):
+            usage = response.llm_output["token_usage"]
+            prompt, completion = usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+        if usage is None:
+            self.estimated = True
+            prompt = estimated_prompt
+            completion = sum(estimate_tokens(g.text or str(getattr(g, "message", ""))) for g in generations)
+        self.prompt_tokens += prompt
+        self.completion_tokens += completion
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        start, _ = self._llm_runs.pop(run_id, (time.perf_counter(), 0))
+        self.llm_calls += 1
+        self.llm_seconds += time.perf_counter() - start
+
+    def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+        self._tool_runs[run_id] = (time.perf_counter(), serialized.get("name"))
+
+    def record_tool(self, name: Optional[str], seconds: float, status: str = "success"):
+        """Учесть вызов инструмента (status: success или error)."""
+        self.tool_calls += 1
+        self.tool_seconds += seconds
+        if status == "error":
+            self.tool_errors += 1
+        AGENT_TOOL_DURATION.labels(name, status).observe(seconds)
+
+    def _tool_done(self, run_id, status):
+        start, name = self._tool_runs.pop(run_id, (time.perf_counter(), None))
+        self.record_tool(name, time.perf_counter() - start, status)
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        self._tool_done(run_id, "success")
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self._tool_done(run_id, "error")
+
+    @property
+    def cost(self) -> float:
+        return (self.prompt_tokens * PRICE_PROMPT_PER_1K + self.completion_tokens * PRICE_COMPLETION_PER_1K) / 1000
+
+    def summary(self, route: str, success: bool) -> Dict[str, Any]:
+        """Итог запроса. route: fast_path, cached_plan или llm."""
+        return {
+            "route": route,
+            "status": "success" if success else "error",
+            "model": self.model,
+            "total_seconds": round(time.perf_counter() - self.started, 4),
+            "llm_seconds": round(self.llm_seconds, 4),
+            "tool_seconds": round(self.tool_seconds, 4),
+            # В AgentExecutor каждая итерация — один вызов модели
+            "iterations": self.llm_calls,
+            "llm_calls": self.llm_calls,
+            "tool_calls": self.tool_calls,
+            "tool_errors": self.tool_errors,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "estimated": self.estimated,
+            "cost": round(self.cost, 6),
+            "prompt": self.prompt,
+            "tools": self.tools,
+            "prefetch": self.prefetch,
+            "fast_path": route == "fast_path",
+            "cached_plan": route == "cached_plan",
+        }
@@ -0,0 +1,813 @@
+"""
+Сервисный слой CAD gateway.
+
+Вся логика эндпоинтов /api/cad/* и /api/mcp/status живет здесь, а не в
+обработчиках FastAPI. Ее используют:
+    - main.py — тонкие HTTP обработчики поверх этих функций;
+    - MCP инструменты — напрямую, без loopback HTTP, когда инструменты и
+      gateway работают в одном процессе (см. tools/http_client.py).
+
+Ошибки валидации и CAD поднимаются как CADServiceError с HTTP статусом,
+FastAPI превращает их в обычный ответ {"detail": ...}.
+
+Операции записи сериализуются: у FreeCADCore один текущий документ, и
+параллельные запросы (например, несколько вызовов инструментов агента за
+один ход) не должны перемешивать шаги друг друга. Чтение (статус, список
+документов) выполняется без ожидания.
+
+prefetch() — прогрев CAD, пока AI агент ждет ответа модели: подключение
+FreeCAD, первые операции ядра геометрии и чтение нужных файлов в кэш ОС.
+Подключение и пробные примитивы работают с общим ядром, поэтому идут под
+блокировкой записи и в пуле потоков, чтобы не останавливать event loop.
+"""
+
+import asyncio
+import functools
+import math
+import os
+import uuid
+import weakref
+from typing import Any, Dict, List, Optional
+
+from common_logic import core
+from metrics import time_operation
+
+# Реестр фигур: тип -> параметры построения и их типы. Отсюда берутся
+# списки допустимых фигур сервиса и схемы инструментов AI агента.
+SHAPES = {
+    "cube": {"size": float, "x": float, "y": float, "z": float},
+    "sphere": {"size": float, "x": float, "y": float, "z": float},
+    "cylinder": {"size": float, "x": float, "y": float, "z": float},
+    "star": {"num_points": int, "inner_radius": float, "outer_radius": float, "height": float},
+    "gear": {"teeth": int, "module": float, "outer_radius": float, "height": float},
+    "torus": {"major_radius": float, "minor_radius": float},
+}
+SIMPLE_SHAPES = [name for name, params in SHAPES.items() if "size" in params]
+COMPLEX_SHAPES = [name for name in SHAPES if name not in SIMPLE_SHAPES]
+COMPLEX_SHAPE_PARAMS = sorted({param for name in COMPLEX_SHAPES for param in SHAPES[name]})
+
+# Сколько файлов из одного запроса prefetch читает заранее
+PREFETCH_MAX_FILES = 3
+_primitives_warm = False
+
+MCP_TOOLS = [
+    "get_mcp_status", "get_documents", "create_shape", "create_cube", "create_sphere",
+    "create_cylinder", "open_document", "save_document", "close_document",
+    "create_complex_shape", "create_test_shape", "run_cad_script"
+]
+
+
+class CADServiceError(Exception):
+    """Ошибка сервисного слоя с HTTP статусом и текстом для клиента."""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+# event loop -> блокировка записи (asyncio.Lock привязан к своему loop)
+_write_locks = weakref.WeakKeyDictionary()
+
+
+def _write_lock() -> asyncio.Lock:
+    loop = asyncio.get_running_loop()
+    lock = _write_locks.get(loop)
+    if lock is None:
+        lock = _write_locks[loop] = asyncio.Lock()
+    return lock
+
+
+def _serialized(func):
+    """Выполнять операцию записи только после завершения предыдущих."""
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        async with _write_lock():
+            return await func(*args, **kwargs)
+    return wrapper
+
+
+def _validate_simple_shape(shape_type: str, size: float):
+    if size <= 0:
+        raise CADServiceError(400, "Размер должен быть положительным числом")
+    if shape_type.lower() not in SIMPLE_SHAPES:
+        raise CADServiceError(
+            400, f"Неподдерживаемый тип фигуры. Доступно: {', '.join(SIMPLE_SHAPES)}"
+        )
+
+
+async def mcp_status() -> Dict[str, Any]:
+    """Статус MCP сервера."""
+    return {
+        "status": "running",
+        "tools": list(MCP_TOOLS),
+        "description": "CAD MCP Server for FreeCAD operations"
+    }
+
+
+async def get_documents() -> Dict[str, Any]:
+    """Документы из FreeCAD."""
+    result = await core.get_onshape_documents()
+    return {"result": result}
+
+
+@_serialized
+async def create_shape(
+    shape_type: str = "cube",
+    size: float = 10.0,
+    x: float = 0.0,
+    y: float = 0.0,
+    z: float = 0.0
+) -> Dict[str, Any]:
+    """Создать простую фигуру в указанных координатах."""
+    _validate_simple_shape(shape_type, size)
+
+    result = await core.create_simple_shape(shape_type.lower(), size, x, y, z)
+
+    return {
+        "result": result,
+        "parameters": {
+            "shape_type": shape_type,
+            "size": size,
+            "x": x,
+            "y": y,
+            "z": z
+        }
+    }
+
+
+def _make_torus(doc, major_radius, minor_radius):
+    if major_radius is None or minor_radius is None:
+        raise CADServiceError(400, "Для тора требуются major_radius и minor_radius")
+    if major_radius <= 0 or minor_radius <= 0:
+        raise CADServiceError(400, "Радиусы должны быть положительными")
+    if minor_radius >= major_radius:
+        raise CADServiceError(400, "minor_radius должен быть меньше major_radius")
+
+    with time_operation("makeTorus"):
+        torus = core.part.makeTorus(major_radius, minor_radius)
+    obj = doc.addObject("Part::Feature", f"Torus_{major_radius}x{minor_radius}")
+    obj.Shape = torus
+    with time_operation("recompute"):
+        doc.recompute()
+
+    return obj, f"Тор создан с большим радиусом {major_radius} мм и малым радиусом {minor_radius} мм"
+
+
+def _make_star(doc, num_points, inner_radius, outer_radius, height):
+    if num_points is None or inner_radius is None or outer_radius is None or height is None:
+        raise CADServiceError(400, "Для звезды требуются num_points, inner_radius, outer_radius, height")
+    if num_points < 5 or num_points % 2 == 0:
+        raise CADServiceError(400, "num_points для звезды должно быть нечетным числом >=5")
+    if inner_radius <= 0 or outer_radius <= 0 or height <= 0:
+        raise CADServiceError(400, "Радиусы и высота должны быть положительными")
+    if inner_radius >= outer_radius:
+        raise CADServiceError(400, "inner_radius должен быть меньше outer_radius")
+
+    points = []
+    for i in range(num_points * 2):
+        angle = i * math.pi / num_points
+        radius = inner_radius if i % 2 == 0 else outer_radius
+        points.append(core.freecad.Vector(radius * math.cos(angle), radius * math.sin(angle), 0))
+
+    # Замыкаем контур
+    points.append(points[0])
+
+    wire = core.part.makePolygon(points)
+    face = core.part.Face(wire)
+
+    with time_operation("extrude"):
+        extruded = face.extrude(core.freecad.Vector(0, 0, height))
+    obj = doc.addObject("Part::Feature", f"Star_{num_points}pts")
+    obj.Shape = extruded
+    with time_operation("recompute"):
+        doc.recompute()
+
+    return obj, f"Звезда создана с {num_points} лучами, высотой {height} мм"
+
+
+def _make_gear(doc, teeth, module, outer_radius, height):
+    if teeth is None or module is None or outer_radius is None or height is None:
+        raise CADServiceError(400, "Для шестеренки требуются teeth, module, outer_radius, height")
+    if teeth < 3:
+        raise CADServiceError(400, "teeth должно быть >=3")
+    if module <= 0 or outer_radius <= 0 or height <= 0:
+        raise CADServiceError(400, "module, outer_radius и height должны быть положительными")
+
+    # В реальном проекте нужно использовать более сложную геометрию
+    with time_operation("makeCylinder"):
+        cylinder = core.part.makeCylinder(outer_radius, height)
+    obj = doc.addObject("Part::Feature", f"Gear_{teeth}teeth")
+    obj.Shape = cylinder
+    with time_operation("recompute"):
+        doc.recompute()
+
+    return obj, (
+        f"Упрощенная шестеренка создана с {teeth} зубьями, высотой {height} мм. "
+        f"Для точной геометрии используйте специализированные библиотеки."
+    )
+
+
+def _make_complex(doc, kind, num_points=None, inner_radius=None, outer_radius=None, height=None,
+                  teeth=None, module=None, major_radius=None, minor_radius=None):
+    if kind == "torus":
+        return _make_torus(doc, major_radius, minor_radius)
+    if kind == "star":
+        return _make_star(doc, num_points, inner_radius, outer_radius, height)
+    return _make_gear(doc, teeth, module, outer_radius, height)
+
+
+@_serialized
+async def create_complex_shape(
+    shape_type: str,
+    num_points: Optional[int] = None,
+    inner_radius: Optional[float] = None,
+    outer_radius: Optional[float] = None,
+    height: Optional[float] = None,
+    teeth: Optional[int] = None,
+    module: Optional[float] = None,
+    major_radius: Optional[float] = None,
+    minor_radius: Optional[float] = None
+) -> Dict[str, Any]:
+    """Создать сложную фигуру (star, gear, torus) в открытом документе."""
+    if shape_type.lower() not in COMPLEX_SHAPES:
+        raise CADServiceError(
+            400, f"Неподдерживаемый тип фигуры. Доступно: {', '.join(COMPLEX_SHAPES)}"
+        )
+
+    # Проверяем подключение к FreeCAD
+    if not core.freecad:
+        result = core.connect()
+        if not result["success"]:
+            raise CADServiceError(
+                500, f"Ошибка подключения к FreeCAD: {result.get('error', 'Неизвестная ошибка')}"
+            )
+
+    if not core.current_doc:
+        raise CADServiceError(
+            400, "Нет открытого документа. Сначала откройте документ с помощью /api/cad/open-document"
+        )
+
+    try:
+        doc = core.current_doc
+        kind = shape_type.lower()
+        _, result_message = _make_complex(
+            doc, kind, num_points=num_points, inner_radius=inner_radius,
+            outer_radius=outer_radius, height=height, teeth=teeth, module=module,
+            major_radius=major_radius, minor_radius=minor_radius
+        )
+    except CADServiceError:
+        raise
+    except Exception as e:
+        raise CADServiceError(500, f"Ошибка создания сложной фигуры: {str(e)}")
+
+    return {
+        "result": result_message,
+        "parameters": {
+            "shape_type": shape_type,
+            "num_points": num_points,
+            "inner_radius": inner_radius,
+            "outer_radius": outer_radius,
+            "height": height,
+            "teeth": teeth,
+            "module": module,
+            "major_radius": major_radius,
+            "minor_radius": minor_radius
+        }
+    }
+
+
+@_serialized
+async def open_document(file_path: str) -> Dict[str, Any]:
+    """Открыть документ или создать новый."""
+    if not file_path:
+        raise CADServiceError(400, "Путь к файлу обязателен")
+    result = await core.open_document(file_path)
+    return {"result": result}
+
+
+@_serialized
+async def save_document(file_path: Optional[str] = None) -> Dict[str, Any]:
+    """Сохранить текущий документ."""
+    result = await core.save_document(file_path)
+    return {"result": result}
+
+
+@_serialized
+async def close_document() -> Dict[str, Any]:
+    """Закрыть текущий документ."""
+    result = await core.close_document()
+    return {"result": result}
+
+
+@_serialized
+async def create_test_shape(
+    shape_type: str = "cube",
+    size: float = 10.0,
+    x: float = 0.0,
+    y: float = 0.0,
+    z: float = 0.0,
+    file_name: Optional[str] = None
+) -> Dict[str, Any]:
+    """Открыть документ, создать фигуру, сохранить и закрыть."""
+    _validate_simple_shape(shape_type, size)
+    if not file_name:
+        file_name = f"test_{shape_type}_{size}mm_{uuid.uuid4().hex[:8]}.FCStd"
+    elif not file_name.lower().endswith('.fcstd'):
+        raise CADServiceError(400, "Файл должен иметь расширение .FCStd")
+
+    try:
+        open_result = await core.open_document(file_name)
+        create_result = await core.create_simple_shape(shape_type.lower(), size, x, y, z)
+        save_result = await core.save_document(file_name)
+        close_result = await core.close_document()
+    except Exception as e:
+        raise CADServiceError(500, f"Ошибка при создании тестовой фигуры: {str(e)}")
+
+    return {
+        "success": True,
+        "result": "Тестовая фигура создана и сохранена успешно",
+        "details": {
+            "file": file_name,
+            "shape_type": shape_type,
+            "size": size,
+            "coordinates": {"x": x, "y": y, "z": z},
+            "open_result": open_result,
+            "create_result": create_result,
+            "save_result": save_result,
+            "close_result": close_result
+        },
+        "message": (
+            f"✅ Файл создан: {file_name}\n"
+            f"📐 Тип фигуры: {shape_type}\n"
+            f"📏 Размер: {size} мм\n"
+            f"📍 Координаты: ({x}, {y}, {z}) мм\n"
+            f"📄 Открытие документа: {open_result}\n"
+            f"🎯 Создание фигуры: {create_result}\n"
+            f"💾 Сохранение: {save_result}\n"
+            f"🚪 Закрытие: {close_result}"
+        )
+    }
+
+
+# ============ СЦЕНАРИИ (run_cad_script) ============
+
+MAX_SCRIPT_OPERATIONS = int(os.getenv("CAD_MAX_SCRIPT_OPERATIONS", "100"))
+# Шаги, которые меняют модель в памяти: при ошибке их можно откатить
+SCRIPT_MODEL_OPS = {"open", "create", "boolean", "pattern"}
+# Шаги записи и закрытия: после первого успешного шага записи сценарий не откатывается
+SCRIPT_OUTPUT_OPS = {"save", "export", "close"}
+BOOLEAN_OPERATIONS = {"fuse", "cut", "common"}
+# Поля шагов, в которых шаг ссылается на объекты документа
+SCRIPT_REF_FIELDS = ("base", "tool", "tools", "source", "objects")
+EXPORT_FORMATS = {".step": "exportStep", ".stp": "exportStep", ".stl": "exportStl"}
+
+
+class _ScriptStepError(Exception):
+    """Ошибка выполнения шага сценария (сценарий откатывается)."""
+
+
+def _check_core_result(result: str) -> str:
+    # FreeCADCore сообщает об ошибках строкой, а не исключением
+    if result.startswith(("Ошибка", "Нет открытого", "Неизвестный")):
+        raise _ScriptStepError(result)
+    return result
+
+
+def _shape_params(index: int, step: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Шаг create с параметрами фигуры, приведенными к типам реестра SHAPES.
+
+    Модель часто передает числа строками ("20"); по HTTP их приводит FastAPI,
+    а при прямом вызове сервиса — эта функция, чтобы ответ был одинаковым.
+    """
+    params = SHAPES.get(str(step.get("shape_type", "")).lower())
+    if params is None:
+        return step
+    step = dict(step)
+    for name, kind in params.items():
+        value = step.get(name)
+        if value is None:
+            continue
+        try:
+            if isinstance(value, bool):
+                raise ValueError
+            number = float(value)
+            if not math.isfinite(number) or (kind is int and not number.is_integer()):
+                raise ValueError
+        except (TypeError, ValueError):
+            expected = "целым числом" if kind is int else "числом"
+            raise CADServiceError(400, f"Шаг {index}: параметр {name} должен быть {expected}, получено {value!r}")
+        step[name] = kind(number)
+    return step
+
+
+def _validate_script(operations: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Проверить сценарий и вернуть его шаги с приведенными параметрами фигур."""
+    if not operations:
+        raise CADServiceError(400, "Сценарий пуст: передайте хотя бы одну операцию")
+    if len(operations) > MAX_SCRIPT_OPERATIONS:
+        raise CADServiceError(400, f"Слишком много операций: {len(operations)} > {MAX_SCRIPT_OPERATIONS}")
+    allowed = SCRIPT_MODEL_OPS | SCRIPT_OUTPUT_OPS
+    for index, step in enumerate(operations):
+        op = step.get("op") if isinstance(step, dict) else None
+        if op not in allowed:
+            raise CADServiceError(
+                400, f"Шаг {index}: неизвестная операция {op!r}. Доступно: {', '.join(sorted(allowed))}"
+            )
+        if op == "open" and index != 0:
+            raise CADServiceError(400, f"Шаг {index}: open допускается только первым шагом")
+        if op in SCRIPT_MODEL_OPS and any(s.get("op") == "close" for s in operations[:index]):
+            raise CADServiceError(400, f"Шаг {index}: {op} после close")
+    return [_shape_params(index, step) if step["op"] == "create" else step for index, step in enumerate(operations)]
+
+
+def _step_refs(step: Dict[str, Any]) -> set:
+    refs = set()
+    for field in SCRIPT_REF_FIELDS:
+        value = step.get(field)
+        if isinstance(value, list):
+            refs.update(str(v) for v in value)
+        elif value:
+            refs.add(str(value))
+    return refs
+
+
+class _ScriptRun:
+    """Выполнение одного сценария с журналом для отката."""
+
+    def __init__(self):
+        self.created = []       # объекты, созданные сценарием
+        self.consumed = []      # входы булевых операций — удаляются, когда на них больше не ссылаются
+        self.removed = []       # удаленные входы, которых не было до сценария: (имя, метка, фигура)
+        self.aliases = {}       # имя из сценария -> объект документа
+        self.opened = False
+        self.new_file = None    # файл, созданный шагом open (удаляется при откате)
+        self.written = False    # сценарий уже записал что-то на диск (save/export)
+        # Документ, открытый до сценария: шаги open/close могут его закрыть
+        self.previous = core.current_doc
+        self.previous_file = getattr(self.previous, "FileName", "") if self.previous else ""
+
+    @property
+    def doc(self):
+        if not core.current_doc:
+            raise _ScriptStepError("Нет открытого документа: начните сценарий с шага open")
+        return core.current_doc
+
+    def _resolve(self, ref):
+        if not ref:
+            raise _ScriptStepError("Не указан объект")
+        obj = self.aliases.get(ref) or self.doc.getObject(ref)
+        if obj is None:
+            raise _ScriptStepError(f"Объект {ref!r} не найден")
+        return obj
+
+    def _add(self, shape, name, alias=None):
+        obj = self.doc.addObject("Part::Feature", name)
+        obj.Shape = shape
+        self._register(obj, alias)
+        return obj
+
+    def _register(self, obj, alias=None):
+        self.created.append(obj.Name)
+        if alias:
+            obj.Label = alias
+            self.aliases[alias] = obj
+
+    async def op_open(self, step):
+        if not step.get("file_path"):
+            raise _ScriptStepError("Для open требуется file_path")
+        existed = os.path.exists(step["file_path"])
+        result = _check_core_result(await core.open_document(step["file_path"]))
+        self.opened = True
+        if not existed:
+            # FreeCADCore сразу сохраняет новый документ — при откате файл нужно удалить
+            self.new_file = step["file_path"]
+        return {"result": result}
+
+    async def op_create(self, step):
+        kind = str(step.get("shape_type", "")).lower()
+        doc = self.doc
+        if kind in SIMPLE_SHAPES:
+            size = step.get("size", 10.0)
+            if size <= 0:
+                raise _ScriptStepError("Размер должен быть положительным числом")
+            count = len(doc.Objects)
+            result = _check_core_result(await core.create_simple_shape(
+                kind, size, step.get("x", 0.0), step.get("y", 0.0), step.get("z", 0.0)
+            ))
+            if len(doc.Objects) <= count:
+                raise _ScriptStepError(result)
+            obj = doc.Objects[-1]
+        elif kind in COMPLEX_SHAPES:
+            params = {k: step.get(k) for k in COMPLEX_SHAPE_PARAMS}
+            try:
+                obj, result = _make_complex(doc, kind, **params)
+            except CADServiceError as e:
+                raise _ScriptStepError(e.detail)
+        else:
+            raise _ScriptStepError(
+                f"Неподдерживаемый тип фигуры {kind!r}. Доступно: {', '.join(SIMPLE_SHAPES + COMPLEX_SHAPES)}"
+            )
+        self._register(obj, step.get("name"))
+        return {"result": result, "object": obj.Name}
+
+    async def op_boolean(self, step):
+        operation = step.get("operation")
+        if operation not in BOOLEAN_OPERATIONS:
+            raise _ScriptStepError(f"operation должна быть одной из: {', '.join(sorted(BOOLEAN_OPERATIONS))}")
+        base = self._resolve(step.get("base"))
+        tools = step.get("tools") or [step.get("tool")]
+        tool_objects = [self._resolve(ref) for ref in tools]
+
+        shape = base.Shape
+        with time_operation(operation):
+            for tool in tool_objects:
+                shape = getattr(shape, operation)(tool.Shape)
+        obj = self._add(shape, step.get("name") or f"{operation.capitalize()}_{base.Name}", step.get("name"))
+        if not step.get("keep_inputs", False):
+            self.consumed.extend(o.Name for o in [base] + tool_objects)
+        with time_operation("recompute"):
+            self.doc.recompute()
+        return {"result": f"{operation}: {base.Name} + {', '.join(o.Name for o in tool_objects)}", "object": obj.Name}
+
+    async def op_pattern(self, step):
+        source = self._resolve(step.get("source"))
+        count = int(step.get("count", 2))
+        if count < 2:
+            raise _ScriptStepError("count для pattern должно быть >= 2 (вместе с исходным объектом)")
+        kind = step.get("kind", "linear")
+        # Копии доступны следующим шагам как <name или source>_<kind><i>
+        prefix = step.get("name") or step.get("source")
+        vector = core.freecad.Vector
+        objects = []
+        with time_operation("pattern"):
+            for i in range(1, count):
+                shape = source.Shape.copy()
+                if kind == "linear":
+                    dx, dy, dz = step.get("step", [10.0, 0.0, 0.0])
+                    shape.translate(vector(dx * i, dy * i, dz * i))
+                elif kind == "polar":
+                    cx, cy, cz = step.get("center", [0.0, 0.0, 0.0])
+                    angle = float(step.get("angle", 360.0)) / count
+                    shape.rotate(vector(cx, cy, cz), vector(0, 0, 1), angle * i)
+                else:
+                    raise _ScriptStepError("kind для pattern: linear или polar")
+                objects.append(self._add(shape, f"{source.Name}_{kind}{i}", f"{prefix}_{kind}{i}").Name)
+        with time_operation("recompute"):
+            self.doc.recompute()
+        return {"result": f"{kind} массив из {count} элементов", "objects": [source.Name] + objects}
+
+    async def op_save(self, step):
+        result = _check_core_result(await core.save_document(step.get("file_path")))
+        self.written = True
+        return {"result": result}
+
+    async def op_export(self, step):
+        file_path = step.get("file_path") or ""
+        method = EXPORT_FORMATS.get(os.path.splitext(file_path)[1].lower())
+        if not method:
+            raise _ScriptStepError(f"Для export нужен file_path с расширением {', '.join(sorted(EXPORT_FORMATS))}")
+        refs = step.get("objects")
+        objects = [self._resolve(ref) for ref in refs] if refs else [o for o in self.doc.Objects if o.Shape]
+        if not objects:
+            raise _ScriptStepError("Нечего экспортировать: в документе нет фигур")
+        shape = objects[0].Shape
+        for obj in objects[1:]:
+            shape = shape.fuse(obj.Shape)
+        with time_operation(method):
+            getattr(shape, method)(file_path)
+        self.written = True
+        return {"result": f"Экспортировано в {file_path}", "objects": [o.Name for o in objects]}
+
+    async def op_close(self, step):
+        return {"result": _check_core_result(await core.close_document())}
+
+    def release_inputs(self, remaining: List[Dict[str, Any]]):
+        """Удалить входы булевых операций, на которые не ссылаются оставшиеся шаги."""
+        doc = core.current_doc
+        if doc is None or not self.consumed:
+            return
+        refs = set().union(*(_step_refs(step) for step in remaining)) if remaining else set()
+        referenced = {obj.Name for alias, obj in self.aliases.items() if alias in refs} | refs
+        released = [name for name in dict.fromkeys(self.consumed) if name not in referenced]
+        if not released:
+            return
+        for name in released:
+            obj = doc.getObject(name)
+            if obj is None:
+                continue
+            if name not in self.created:
+                self.removed.append((name, obj.Label, obj.Shape))
+            doc.removeObject(name)
+        self.consumed = [name for name in self.consumed if name not in released]
+        with time_operation("recompute"):
+            doc.recompute()
+
+    def rollback(self):
+        doc = core.current_doc
+        if doc is not None:
+            for name in reversed(self.created):
+                if doc.getObject(name) is not None:
+                    doc.removeObject(name)
+            if self.opened:
+                # Документ открыт этим сценарием и не сохранен — закрываем без записи
+                core.freecad.closeDocument(doc.Name)
+                core.current_doc = None
+            else:
+                # Документ был открыт до сценария — возвращаем удаленные входы
+                for name, label, shape in self.removed:
+                    obj = doc.addObject("Part::Feature", name)
+                    obj.Label = label
+                    obj.Shape = shape
+                doc.recompute()
+        if self.new_file and os.path.exists(self.new_file):
+            os.remove(self.new_file)
+        if self.previous is not None and core.current_doc is None and os.path.exists(self.previous_file):
+            # Документ до сценария закрыт его шагом open или close — открываем
+            # заново с диска (несохраненные до сценария изменения не вернуть)
+            core.current_doc = core.freecad.openDocument(self.previous_file)
+
+
+@_serialized
+async def run_script(operations: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Выполнить упорядоченный список операций как одну транзакцию.
+
+    Шаги выполняются строго в заданном порядке: save или export записывают
+    модель в том состоянии, в котором она находится на этом шаге. Входы
+    булевых операций удаляются перед шагами записи и в конце сценария, если
+    на них не ссылаются следующие шаги.
+
+    Если шаг падает до первой успешной записи, сценарий откатывается:
+    созданные объекты удаляются, открытый сценарием документ закрывается
+    без сохранения, а созданный для него файл удаляется. Если сценарий
+    закрыл документ, открытый до него, тот открывается заново из своего
+    файла: изменения, не сохраненные до сценария, при этом теряются. После
+    записи откат невозможен — сценарий останавливается на упавшем шаге.
+    """
+    operations = _validate_script(operations)
+    if not core.freecad:
+        result = core.connect()
+        if not result["success"]:
+            raise CADServiceError(
+                500, f"Ошибка подключения к FreeCAD: {result.get('error', 'Неизвестная ошибка')}"
+            )
+
+    run = _ScriptRun()
+    steps = [{"step": i, "op": step["op"], "status": "pending"} for i, step in enumerate(operations)]
+
+    failed = None
+    for i, step in enumerate(operations):
+        try:
+            if step["op"] in SCRIPT_OUTPUT_OPS:
+                run.release_inputs(operations[i:])
+            steps[i].update(await getattr(run, f"op_{step['op']}")(step))
+            steps[i]["status"] = "ok"
+        except Exception as e:
+            steps[i].update(status="error", error=str(e))
+            failed = i
+            break
+
+    rolled_back = False
+    if failed is None:
+        run.release_inputs([])
+    else:
+        for step in steps:
+            if step["status"] == "pending":
+                step["status"] = "skipped"
+        # Откатить можно только пока сценарий ничего не записал на диск
+        if not run.written:
+            run.rollback()
+            rolled_back = True
+
+    ok = failed is None
+    return {
+        "success": ok,
+        "rolled_back": rolled_back,
+        "result": (
+            f"Сценарий выполнен: {len(steps)} шагов" if ok
+            else f"Шаг {failed} ({operations[failed]['op']}) завершился ошибкой: {steps[failed]['error']}"
+        ),
+        "steps": steps
+    }
+
+
+def _read_file(path: str):
+    with open(path, "rb") as f:
+        while f.read(1024 * 1024):
+            pass
+
+
+def _warm_core():
+    global _primitives_warm
+    if not core.freecad:
+        result = core.connect()
+        if not result["success"]:
+            raise CADServiceError(
+                500, f"Ошибка подключения к FreeCAD: {result.get('error', 'Неизвестная ошибка')}"
+            )
+    if not _primitives_warm:
+        with time_operation("prefetch_primitives"):
+            core.part.makeBox(1, 1, 1)
+            core.part.makeSphere(1)
+            core.part.makeCylinder(1, 1)
+        _primitives_warm = True
+
+
+async def prefetch(files: Optional[List[str]] = None) -> Dict[str, Any]:
+    """
+    Подготовить CAD к ожидаемому запросу, пока агент ждет модель.
+
+    Подключает FreeCAD, один раз на процесс строит и выбрасывает по
+    примитиву каждого простого типа (первые вызовы ядра геометрии самые
+    долгие) и читает существующие .FCStd из files в кэш ОС, чтобы
+    последующее открытие не ждало диск.
+    """
+    async with _write_lock():
+        warm = asyncio.ensure_future(asyncio.to_thread(_warm_core))
+        try:
+            await asyncio.shield(warm)
+        except asyncio.CancelledError:
+            # Поток не прервать: блокировку отпускаем только после него,
+            # иначе следующая операция записи пойдет в ядро параллельно
+            await asyncio.wait({warm})
+            raise
+
+    warmed = []
+    for path in (files or [])[:PREFETCH_MAX_FILES]:
+        if path.lower().endswith(".fcstd") and os.path.isfile(path):
+            await asyncio.to_thread(_read_file, path)
+            warmed.append(path)
+    return {"success": True, "files": warmed}
+
+
+def _flag(value: Any) -> bool:
+    # Модель может передать флаг строкой: "false" не должно значить True
+    if isinstance(value, str):
+        return value.strip().lower() in ("1", "true", "yes", "on")
+    return bool(value)
+
+
+async def make_part(
+    parts: List[Dict[str, Any]],
+    file_name: Optional[str] = None,
+    fuse: bool = False,
+    export: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Создать готовый файл детали по описанию одним вызовом.
+
+    parts — фигуры в формате шага create сценария; фигуры с "subtract": true
+    вычитаются из остальных. При fuse (или если есть вычитаемые фигуры)
+    остальные фигуры объединяются в одно тело. Документ открывается,
+    строится, сохраняется (и при export экспортируется) и закрывается
+    одной транзакцией run_script.
+    """
+    if not parts:
+        raise CADServiceError(400, "Описание детали пусто: передайте хотя бы одну фигуру")
+    file_name = file_name or f"part_{uuid.uuid4().hex[:6]}.FCStd"
+
+    operations = [{"op": "open", "file_path": file_name}]
+    solids, holes = [], []
+    for index, part in enumerate(parts):
+        if not isinstance(part, dict):
+            raise CADServiceError(400, f"Фигура {index}: ожидается объект с shape_type")
+        name = part.get("name") or f"part{index}"
+        step = {k: v for k, v in part.items() if k != "subtract"}
+        operations.append({**step, "op": "create", "name": name})
+        (holes if _flag(part.get("subtract")) else solids).append(name)
+    if not solids:
+        raise CADServiceError(400, "Все фигуры помечены subtract: не из чего вычитать")
+
+    body = solids[0]
+    if len(solids) > 1 and (_flag(fuse) or holes):
+        operations.append({"op": "boolean", "operation": "fuse", "base": body, "tools": solids[1:], "name": "body"})
+        body = "body"
+    if holes:
+        operations.append({"op": "boolean", "operation": "cut", "base": body, "tools": holes, "name": "result"})
+    operations.append({"op": "save"})
+    if export:
+        operations.append({"op": "export", "file_path": export})
+    operations.append({"op": "close"})
+
+    data = await run_script(operations)
+    data["file_name"] = file_name
+    return data
+
+
+# Путь эндпоинта -> функция сервиса. По этой таблице MCP инструменты
+# вызывают сервис напрямую, минуя HTTP, когда работают в процессе gateway.
+ROUTES = {
+    "/api/mcp/status": mcp_status,
+    "/api/cad/documents": get_documents,
+    "/api/cad/create-shape": create_shape,
+    "/api/cad/create-complex-shape": create_complex_shape,
+    "/api/cad/open-document": open_document,
+    "/api/cad/save-document": save_document,
+    "/api/cad/close-document": close_document,
+    "/api/cad/create-test-shape": create_test_shape,
+    "/api/cad/run-script": run_script,
+    "/api/cad/make-part": make_part,
+    "/api/cad/prefetch": prefetch,
+}
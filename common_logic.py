@@ -1,6 +1,8 @@
 import sys
 import os
 
+from metrics import time_operation, register_freecad_gauges
+
 class FreeCADCore:
     """Минимальный клиент для работы с FreeCAD."""
     
@@ -21,21 +23,25 @@ class FreeCADCore:
         
         try:
             if self.current_doc:
-                self.freecad.closeDocument(self.current_doc.Name)
+                with time_operation("closeDocument"):
+                    self.freecad.closeDocument(self.current_doc.Name)
                 self.current_doc = None
             
             if not file_path.lower().endswith('.fcstd'):
                 return "Ошибка: Файл должен иметь расширение .FCStd"
             
             if os.path.exists(file_path):
-                self.current_doc = self.freecad.openDocument(file_path)
+                with time_operation("openDocument"):
+                    self.current_doc = self.freecad.openDocument(file_path)
                 return f"Документ открыт: {self.current_doc.Name}"
             else:
                 # Создать новый документ
                 doc_name = os.path.splitext(os.path.basename(file_path))[0]
-                self.current_doc = self.freecad.newDocument(doc_name)
+                with time_operation("newDocument"):
+                    self.current_doc = self.freecad.newDocument(doc_name)
                 # Сохранить сразу, чтобы файл существовал
-                self.current_doc.saveAs(file_path)
+                with time_operation("saveAs"):
+                    self.current_doc.saveAs(file_path)
                 return f"Создан новый документ и сохранен по пути: {file_path}. Теперь открыт: {self.current_doc.Name}"
         
         except Exception as e:
@@ -48,10 +54,12 @@ class FreeCADCore:
         
         try:
             if file_path:
-                self.current_doc.saveAs(file_path)
+                with time_operation("saveAs"):
+                    self.current_doc.saveAs(file_path)
                 return f"Документ сохранен как: {file_path}"
             else:
-                self.current_doc.save()
+                with time_operation("save"):
+                    self.current_doc.save()
                 return "Документ сохранен"
         except Exception as e:
             return f"Ошибка сохранения документа: {str(e)}"
@@ -62,7 +70,8 @@ class FreeCADCore:
             return "Нет открытого документа для закрытия"
         
         try:
-            self.freecad.closeDocument(self.current_doc.Name)
+            with time_operation("closeDocument"):
+                self.freecad.closeDocument(self.current_doc.Name)
             self.current_doc = None
             return "Документ закрыт"
         except Exception as e:
@@ -76,8 +85,9 @@ class FreeCADCore:
         
         # 2. Пытаемся импортировать
         try:
-            import FreeCAD
-            import Part
+            with time_operation("connect"):
+                import FreeCAD
+                import Part
             
             self.freecad = FreeCAD
             self.part = Part
@@ -136,15 +146,18 @@ class FreeCADCore:
             
             if shape_type.lower() == "cube":
                 # Для куба координаты указывают его начальную точку (один из углов)
-                shape = self.part.makeBox(size, size, size, self.freecad.Vector(x, y, z))
+                with time_operation("makeBox"):
+                    shape = self.part.makeBox(size, size, size, self.freecad.Vector(x, y, z))
                 obj_name = f"Cube_{size}mm_{x}_{y}_{z}"
             elif shape_type.lower() == "sphere":
                 # Для сферы координаты указывают центр
-                shape = self.part.makeSphere(size/2, self.freecad.Vector(x, y, z))
+                with time_operation("makeSphere"):
+                    shape = self.part.makeSphere(size/2, self.freecad.Vector(x, y, z))
                 obj_name = f"Sphere_{size}mm_{x}_{y}_{z}"
             elif shape_type.lower() == "cylinder":
                 # Для цилиндра координаты указывают центр основания
-                shape = self.part.makeCylinder(size/2, size, self.freecad.Vector(x, y, z))
+                with time_operation("makeCylinder"):
+                    shape = self.part.makeCylinder(size/2, size, self.freecad.Vector(x, y, z))
                 obj_name = f"Cylinder_{size}mm_{x}_{y}_{z}"
             else:
                 return f"Неизвестный тип фигуры: {shape_type}. Доступно: cube, sphere, cylinder"
@@ -152,7 +165,8 @@ class FreeCADCore:
             # Добавляем объект в документ
             obj = doc.addObject("Part::Feature", obj_name)
             obj.Shape = shape
-            doc.recompute()
+            with time_operation("recompute"):
+                doc.recompute()
             
             return f"Создана {shape_type} размером {size} мм в точке ({x}, {y}, {z}) в документе {doc.Name}."
             
@@ -231,6 +245,7 @@ class FreeCADCore:
 
 # Глобальный экземпляр для простоты
 core = FreeCADCore()
+register_freecad_gauges(core)
 
 if __name__ == "__main__":
     # Если запускаем этот файл отдельно - тестируем
@@ -0,0 +1,309 @@
+"""
+Заглушка FreeCAD для бенчмарков и нагрузочных тестов без установленного FreeCAD.
+
+Реализует ту часть API модулей FreeCAD и Part, которой пользуется проект:
+документы (new/open/save/close, транзакции), примитивы, полигоны,
+экструзию, булевы операции и экспорт. Геометрия не строится — у фигур
+считается только приблизительный объем, а файлы .FCStd пишутся как
+маленький JSON, чтобы open/save работали по-настоящему через диск.
+
+Использование:
+    from helpers import fake_freecad
+    fake_freecad.install()   # ничего не делает, если настоящий FreeCAD доступен
+
+Искусственную задержку операций можно задать через FAKE_FREECAD_LATENCY_MS
+(по умолчанию 0) — полезно, чтобы нагрузочный тест был похож на прод.
+"""
+
+import json
+import math
+import os
+import sys
+import time
+import types
+
+LATENCY_MS = float(os.getenv("FAKE_FREECAD_LATENCY_MS", "0"))
+
+
+def _simulate_work():
+    if LATENCY_MS > 0:
+        time.sleep(LATENCY_MS / 1000)
+
+
+class Vector:
+    def __init__(self, x=0.0, y=0.0, z=0.0):
+        self.x, self.y, self.z = float(x), float(y), float(z)
+
+    def __add__(self, other):
+        return Vector(self.x + other.x, self.y + other.y, self.z + other.z)
+
+    def __sub__(self, other):
+        return Vector(self.x - other.x, self.y - other.y, self.z - other.z)
+
+    def __mul__(self, k):
+        return Vector(self.x * k, self.y * k, self.z * k)
+
+    def __eq__(self, other):
+        return isinstance(other, Vector) and (self.x, self.y, self.z) == (other.x, other.y, other.z)
+
+    def __repr__(self):
+        return f"Vector ({self.x}, {self.y}, {self.z})"
+
+
+class Shape:
+    """Фигура с приблизительным объемом и положением."""
+
+    def __init__(self, kind, volume, placement=None):
+        self.kind = kind
+        self.Volume = float(volume)
+        self.placement = placement or Vector()
+
+    def isValid(self):
+        return True
+
+    def copy(self):
+        return Shape(self.kind, self.Volume, Vector(self.placement.x, self.placement.y, self.placement.z))
+
+    def translate(self, vector):
+        self.placement = self.placement + vector
+        return self
+
+    def rotate(self, base, axis, degree):
+        # Поворот вокруг оси Z через base (другие оси заглушке не нужны)
+        angle = math.radians(degree)
+        dx, dy = self.placement.x - base.x, self.placement.y - base.y
+        self.placement = Vector(
+            base.x + dx * math.cos(angle) - dy * math.sin(angle),
+            base.y + dx * math.sin(angle) + dy * math.cos(angle),
+            self.placement.z
+        )
+        return self
+
+    def fuse(self, other):
+        _simulate_work()
+        return Shape("Fusion", self.Volume + other.Volume, self.placement)
+
+    def cut(self, other):
+        _simulate_work()
+        return Shape("Cut", max(self.Volume - other.Volume, 0.0), self.placement)
+
+    def common(self, other):
+        _simulate_work()
+        return Shape("Common", min(self.Volume, other.Volume), self.placement)
+
+    def extrude(self, vector):
+        _simulate_work()
+        return Shape("Extrusion", self.Volume * abs(vector.z or 1.0), self.placement)
+
+    def exportStep(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(f"ISO-10303-21; /* fake {self.kind} volume={self.Volume} */\n")
+
+    def exportStl(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(f"solid fake_{self.kind}\nendsolid fake_{self.kind}\n")
+
+
+class DocumentObject:
+    def __init__(self, doc, type_name, name):
+        self.Document = doc
+        self.TypeId = type_name
+        self.Name = name
+        self.Label = name
+        self.Shape = None
+
+
+class Document:
+    def __init__(self, name):
+        self.Name = name
+        self.Label = name
+        self.FileName = ""
+        self.Objects = []
+        self._transaction = None
+
+    def addObject(self, type_name, name):
+        # FreeCAD делает имена уникальными и заменяет недопустимые символы
+        base = "".join(c if c.isalnum() or c == "_" else "_" for c in name) or "Unnamed"
+        existing = {obj.Name for obj in self.Objects}
+        unique, index = base, 1
+        while unique in existing:
+            unique = f"{base}{index:03d}"
+            index += 1
+        obj = DocumentObject(self, type_name, unique)
+        self.Objects.append(obj)
+        if self._transaction is not None:
+            self._transaction.append(("add", obj))
+        return obj
+
+    def getObject(self, name):
+        for obj in self.Objects:
+            if obj.Name == name:
+                return obj
+        return None
+
+    def removeObject(self, name):
+        obj = self.getObject(name)
+        if obj is not None:
+            self.Objects.remove(obj)
+
+    def recompute(self):
+        _simulate_work()
+        return len(self.Objects)
+
+    def openTransaction(self, name=""):
+        self._transaction = []
+
+    def commitTransaction(self):
+        self._transaction = None
+
+    def abortTransaction(self):
+        for action, obj in reversed(self._transaction or []):
+            if action == "add" and obj in self.Objects:
+                self.Objects.remove(obj)
+        self._transaction = None
+
+    def save(self):
+        if not self.FileName:
+            raise RuntimeError("Document has no file name, use saveAs")
+        self._write(self.FileName)
+
+    def saveAs(self, path):
+        self.FileName = path
+        self._write(path)
+
+    def _write(self, path):
+        _simulate_work()
+        payload = {
+            "name": self.Name,
+            "objects": [
+                {"name": o.Name, "type": o.TypeId, "volume": o.Shape.Volume if o.Shape else 0.0}
+                for o in self.Objects
+            ],
+        }
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(payload, f)
+
+
+_documents = {}
+
+
+def _unique_doc_name(name):
+    base = "".join(c if c.isalnum() or c == "_" else "_" for c in name) or "Unnamed"
+    unique, index = base, 1
+    while unique in _documents:
+        unique = f"{base}{index}"
+        index += 1
+    return unique
+
+
+def newDocument(name="Unnamed"):
+    doc = Document(_unique_doc_name(name))
+    _documents[doc.Name] = doc
+    return doc
+
+
+def openDocument(path):
+    if not os.path.exists(path):
+        raise IOError(f"File '{path}' does not exist")
+    with open(path, encoding="utf-8") as f:
+        try:
+            payload = json.load(f)
+        except ValueError:
+            payload = {"objects": []}
+    doc = newDocument(os.path.splitext(os.path.basename(path))[0])
+    doc.FileName = path
+    for item in payload.get("objects", []):
+        obj = doc.addObject(item.get("type", "Part::Feature"), item["name"])
+        obj.Shape = Shape("Loaded", item.get("volume", 0.0))
+    return doc
+
+
+def closeDocument(name):
+    if name not in _documents:
+        raise NameError(f"Unknown document '{name}'")
+    del _documents[name]
+
+
+def getDocument(name):
+    if name not in _documents:
+        raise NameError(f"Unknown document '{name}'")
+    return _documents[name]
+
+
+def listDocuments():
+    return dict(_documents)
+
+
+def Version():
+    return ["0", "0", "0", "stand-in"]
+
+
+# ============ Part ============
+
+def makeBox(length, width, height, pnt=None, direction=None):
+    _simulate_work()
+    return Shape("Box", length * width * height, pnt)
+
+
+def makeSphere(radius, pnt=None, direction=None, *args):
+    _simulate_work()
+    return Shape("Sphere", 4.0 / 3.0 * math.pi * radius ** 3, pnt)
+
+
+def makeCylinder(radius, height, pnt=None, direction=None, *args):
+    _simulate_work()
+    return Shape("Cylinder", math.pi * radius ** 2 * height, pnt)
+
+
+def makeCone(radius1, radius2, height, pnt=None, direction=None, *args):
+    _simulate_work()
+    volume = math.pi * height * (radius1 ** 2 + radius1 * radius2 + radius2 ** 2) / 3.0
+    return Shape("Cone", volume, pnt)
+
+
+def makeTorus(radius1, radius2, pnt=None, direction=None, *args):
+    _simulate_work()
+    return Shape("Torus", 2 * math.pi ** 2 * radius1 * radius2 ** 2, pnt)
+
+
+def makePolygon(points):
+    # Площадь многоугольника по формуле шнурков (для объема экструзии)
+    area = 0.0
+    for a, b in zip(points, points[1:]):
+        area += a.x * b.y - b.x * a.y
+    wire = Shape("Wire", 0.0)
+    wire.area = abs(area) / 2.0
+    return wire
+
+
+def Face(wire):
+    return Shape("Face", getattr(wire, "area", 0.0))
+
+
+def install():
+    """
+    Зарегистрировать заглушку как модули FreeCAD и Part.
+
+    Если настоящий FreeCAD импортируется, ничего не делает и возвращает False.
+    """
+    if "FreeCAD" in sys.modules and getattr(sys.modules["FreeCAD"], "__fake__", False):
+        return True
+    try:
+        import FreeCAD  # noqa: F401
+        return False
+    except ImportError:
+        pass
+
+    freecad_module = types.ModuleType("FreeCAD")
+    freecad_module.__fake__ = True
+    for name in ("Vector", "newDocument", "openDocument", "closeDocument", "getDocument", "listDocuments", "Version"):
+        setattr(freecad_module, name, globals()[name])
+
+    part_module = types.ModuleType("Part")
+    part_module.__fake__ = True
+    for name in ("Shape", "makeBox", "makeSphere", "makeCylinder", "makeCone", "makeTorus", "makePolygon", "Face"):
+        setattr(part_module, name, globals()[name])
+
+    sys.modules["FreeCAD"] = freecad_module
+    sys.modules["Part"] = part_module
+    return True
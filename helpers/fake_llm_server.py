@@ -0,0 +1,261 @@
+"""
+Локальная заглушка LLM с OpenAI-совместимым API (chat completions).
+
+Нужна, чтобы гонять агента без интернета и платного ключа: бенчмарки,
+нагрузочные тесты, профилирование собственных накладных расходов агента,
+конкурентности и памяти. Агент подключается к ней через LLM_BASE_URL.
+
+Ответы:
+    - сценарий (--script, JSON): список правил {"match": "регулярка",
+      "tool_calls": [{"name": ..., "args": {...}}]} или {"match": ..., "content": "..."};
+      правила проверяются по последнему сообщению пользователя;
+    - иначе грамматика быстрого пути агента (ai_agent/fast_path.py):
+      "создай куб 20мм" -> make_part, "покажи документы" -> get_documents,
+      перечисления ("куб, сферу и цилиндр по 10мм") -> несколько make_part за ход;
+    - после результатов инструментов — короткий итоговый ответ;
+    - все остальное — текстовый ответ-заглушка.
+Вызываются только инструменты, переданные в запросе.
+
+Задержки: время до первого токена и скорость генерации; поддерживаются
+stream=true (SSE) и stream_options.include_usage.
+
+Примеры:
+    python helpers/fake_llm_server.py --port 8010 --latency-ms 300 --tokens-per-sec 50
+    LLM_BASE_URL=http://127.0.0.1:8010/v1 API_KEY=dummy python ai_agent/agent.py
+
+Настройки окружения (значения по умолчанию для ключей CLI):
+    FAKE_LLM_LATENCY_MS     — задержка до первого токена, мс (по умолчанию 200)
+    FAKE_LLM_TOKENS_PER_SEC — скорость генерации, токенов в секунду (по умолчанию 50)
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from ai_agent.fast_path import parse_command  # noqa: E402
+from ai_agent.session_memory import estimate_tokens  # noqa: E402
+
+LATENCY_MS = float(os.getenv("FAKE_LLM_LATENCY_MS", "200"))
+TOKENS_PER_SEC = float(os.getenv("FAKE_LLM_TOKENS_PER_SEC", "50"))
+
+# "куб, сферу и цилиндр по 10мм": общий размер для всех перечисленных фигур
+_COMMON_SIZE = re.compile(r"\bпо\s+(\d+(?:[.,]\d+)?\s*(?:мм|см|mm|cm)?)", re.IGNORECASE)
+_ENUMERATION = re.compile(r",|\bи\b|\band\b", re.IGNORECASE)
+# Статус MCP агент получает из get_health
+_INTENT_TOOLS = {"get_documents": "get_documents", "get_health": "get_health", "get_mcp_status": "get_health"}
+
+
+class FakeLLM:
+    """Генератор ответов: сценарий, грамматика команд или текст."""
+
+    def __init__(self, latency_ms: float = LATENCY_MS, tokens_per_sec: float = TOKENS_PER_SEC,
+                 script: Optional[List[Dict[str, Any]]] = None):
+        self.latency_ms = latency_ms
+        self.tokens_per_sec = tokens_per_sec
+        self.script = script or []
+        self.requests = 0
+
+    def _intent_call(self, query: str, tools: set) -> Optional[Dict[str, Any]]:
+        intent = parse_command(query)
+        if intent is None:
+            return None
+        if intent.action == "create_shape":
+            args = intent.args
+            part = {k: args[k] for k in ("shape_type", "size", "x", "y", "z")}
+            if "make_part" in tools:
+                call = {"name": "make_part", "args": {"parts": [part]}}
+                if args["file_name"]:
+                    call["args"]["file_name"] = args["file_name"]
+                return call
+            if "create_shape" in tools:
+                return {"name": "create_shape", "args": part}
+            return None
+        name = _INTENT_TOOLS.get(intent.action)
+        return {"name": name, "args": {}} if name in tools else None
+
+    def _grammar_calls(self, query: str, tools: set) -> List[Dict[str, Any]]:
+        call = self._intent_call(query, tools)
+        if call is not None:
+            return [call]
+        common = _COMMON_SIZE.search(query)
+        text = _COMMON_SIZE.sub(" ", query) if common else query
+        pieces = [p for p in _ENUMERATION.split(text) if p.strip()]
+        if len(pieces) < 2:
+            return []
+        calls = []
+        for piece in pieces:
+            call = self._intent_call(f"{piece} {common.group(1)}" if common else piece, tools)
+            if call is None:
+                return []
+            calls.append(call)
+        return calls
+
+    def respond(self, messages: List[Dict[str, Any]], tools: set) -> Dict[str, Any]:
+        """Ответ модели: {"content": str} или {"tool_calls": [...]}."""
+        self.requests += 1
+        last = messages[-1] if messages else {}
+        if last.get("role") == "tool":
+            # Итог по результатам инструментов текущего хода
+            results = []
+            for message in reversed(messages):
+                if message.get("role") != "tool":
+                    break
+                results.append(_short_result(message.get("content")))
+            return {"content": "Готово. " + "; ".join(reversed(results))}
+
+        query = next((str(m.get("content", "")) for m in reversed(messages) if m.get("role") == "user"), "")
+        for rule in self.script:
+            if re.search(rule.get("match", ""), query, re.IGNORECASE):
+                if rule.get("tool_calls") and tools:
+                    return {"tool_calls": [c for c in rule["tool_calls"] if c["name"] in tools]}
+                return {"content": rule.get("content", "")}
+        if tools:
+            calls = self._grammar_calls(query, tools)
+            if calls:
+                return {"tool_calls": calls}
+        return {"content": f"Заглушка LLM получила запрос: {query[:200]}"}
+
+
+def _short_result(content) -> str:
+    """Короткая строка из результата инструмента (JSON или текст)."""
+    text = str(content or "").strip()
+    try:
+        data = json.loads(text)
+        if isinstance(data, dict):
+            text = str(data.get("result") or data.get("error") or text)
+    except ValueError:
+        pass
+    return (text.splitlines() or [""])[0][:120]
+
+
+def _usage(messages, tools, completion: str) -> Dict[str, int]:
+    prompt = estimate_tokens(json.dumps(messages, ensure_ascii=False) + json.dumps(tools or [], ensure_ascii=False))
+    completion_tokens = estimate_tokens(completion)
+    return {"prompt_tokens": prompt, "completion_tokens": completion_tokens, "total_tokens": prompt + completion_tokens}
+
+
+def _tool_calls(calls: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [
+        {"index": i, "id": f"call_{uuid.uuid4().hex[:12]}", "type": "function",
+         "function": {"name": call["name"], "arguments": json.dumps(call.get("args", {}), ensure_ascii=False)}}
+        for i, call in enumerate(calls)
+    ]
+
+
+def create_app(llm: FakeLLM) -> FastAPI:
+    app = FastAPI(title="Fake OpenAI-compatible LLM")
+
+    @app.get("/v1/models")
+    async def models():
+        return {"object": "list", "data": [{"id": "fake-llm", "object": "model", "owned_by": "local"}]}
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        messages = body.get("messages", [])
+        tools = {t["function"]["name"] for t in body.get("tools") or [] if t.get("type") == "function"}
+        answer = llm.respond(messages, tools)
+        calls = _tool_calls(answer["tool_calls"]) if answer.get("tool_calls") else None
+        content = answer.get("content") or ""
+        completion = content or json.dumps([c["function"] for c in calls or []], ensure_ascii=False)
+        usage = _usage(messages, body.get("tools"), completion)
+        finish_reason = "tool_calls" if calls else "stop"
+        model = body.get("model", "fake-llm")
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        created = int(time.time())
+        per_token = 1.0 / llm.tokens_per_sec if llm.tokens_per_sec > 0 else 0.0
+
+        if not body.get("stream"):
+            await asyncio.sleep(llm.latency_ms / 1000 + usage["completion_tokens"] * per_token)
+            message = {"role": "assistant", "content": content or None}
+            if calls:
+                message["tool_calls"] = [{k: v for k, v in c.items() if k != "index"} for c in calls]
+            return {
+                "id": completion_id, "object": "chat.completion", "created": created, "model": model,
+                "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}],
+                "usage": usage,
+            }
+
+        include_usage = (body.get("stream_options") or {}).get("include_usage", False)
+
+        def chunk(delta, finish=None, chunk_usage=None):
+            data = {
+                "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish}] if delta is not None else [],
+            }
+            if chunk_usage is not None:
+                data["usage"] = chunk_usage
+            return f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+        async def stream():
+            await asyncio.sleep(llm.latency_ms / 1000)
+            yield chunk({"role": "assistant", "content": ""})
+            if calls:
+                await asyncio.sleep(usage["completion_tokens"] * per_token)
+                yield chunk({"tool_calls": calls})
+            else:
+                for piece in re.findall(r"\S+\s*", content):
+                    await asyncio.sleep(estimate_tokens(piece) * per_token)
+                    yield chunk({"content": piece})
+            yield chunk({}, finish_reason)
+            if include_usage:
+                yield chunk(None, chunk_usage=usage)
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(stream(), media_type="text/event-stream")
+
+    return app
+
+
+def start_fake_llm(port: int, llm: Optional[FakeLLM] = None) -> str:
+    """Поднять заглушку в фоновом потоке и вернуть base_url для LLM_BASE_URL."""
+    import uvicorn
+
+    server = uvicorn.Server(uvicorn.Config(create_app(llm or FakeLLM()), host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    deadline = time.time() + 15
+    while time.time() < deadline:
+        if server.started:
+            return f"http://127.0.0.1:{port}/v1"
+        time.sleep(0.05)
+    raise RuntimeError("Заглушка LLM не запустилась за 15 секунд")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Локальная OpenAI-совместимая заглушка LLM")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8010)
+    parser.add_argument("--latency-ms", type=float, default=LATENCY_MS, help="Задержка до первого токена, мс")
+    parser.add_argument("--tokens-per-sec", type=float, default=TOKENS_PER_SEC, help="Скорость генерации (0 — мгновенно)")
+    parser.add_argument("--script", help="JSON файл со сценарием ответов")
+    args = parser.parse_args()
+
+    script = None
+    if args.script:
+        with open(args.script, encoding="utf-8") as f:
+            script = json.load(f)
+
+    import uvicorn
+
+    print(f"🤖 Заглушка LLM: http://{args.host}:{args.port}/v1 "
+          f"(задержка {args.latency_ms:g} мс, {args.tokens_per_sec:g} ток/с)")
+    print(f"   LLM_BASE_URL=http://{args.host}:{args.port}/v1 API_KEY=dummy")
+    uvicorn.run(create_app(FakeLLM(args.latency_ms, args.tokens_per_sec, script)), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
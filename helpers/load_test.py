@@ -0,0 +1,362 @@
+"""
+Нагрузочный тест CAD API Gateway и MCP сервера.
+
+Гоняет смесь запросов к /api/cad/* и вызовов MCP инструментов по
+streamable-http с заданной конкурентностью (закрытая модель) или частотой
+(открытая модель) и считает p50/p95/p99, пропускную способность и долю
+ошибок по каждой операции.
+
+Примеры:
+    # локальная заглушка FreeCAD, 20 параллельных пользователей, 30 секунд
+    python helpers/load_test.py --stand-in --concurrency 20 --duration 30
+
+    # 50 запросов в секунду к уже запущенному main.py, отчет в HTML
+    python helpers/load_test.py --rate 50 --mix "api:create-shape=5,mcp:create_cube=1" --report load.html
+
+Операции смеси задаются как <транспорт>:<имя>=<вес>:
+    api:documents, api:create-shape, api:create-complex-shape, api:create-test-shape, api:status
+    mcp:<любой инструмент>, например mcp:create_cube, mcp:get_documents
+"""
+
+import argparse
+import asyncio
+import html
+import itertools
+import json
+import os
+import random
+import socket
+import sys
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+DEFAULT_MIX = "api:create-shape=4,api:documents=2,api:create-complex-shape=1,mcp:create_cube=2,mcp:get_documents=1"
+
+_file_counter = itertools.count()
+
+
+def _api_operations() -> Dict[str, Tuple[str, callable]]:
+    """Имя операции -> (путь, фабрика параметров)."""
+    return {
+        "documents": ("/api/cad/documents", dict),
+        "status": ("/api/mcp/status", dict),
+        "create-shape": ("/api/cad/create-shape", lambda: {
+            "shape_type": random.choice(["cube", "sphere", "cylinder"]),
+            "size": random.choice([5, 10, 20]),
+            "x": random.randint(-50, 50), "y": random.randint(-50, 50), "z": 0,
+        }),
+        "create-complex-shape": ("/api/cad/create-complex-shape", lambda: random.choice([
+            {"shape_type": "star", "num_points": 5, "inner_radius": 10, "outer_radius": 20, "height": 5},
+            {"shape_type": "gear", "teeth": 20, "module": 2, "outer_radius": 22, "height": 8},
+            {"shape_type": "torus", "major_radius": 20, "minor_radius": 4},
+        ])),
+        "create-test-shape": ("/api/cad/create-test-shape", lambda: {
+            "shape_type": "cube", "size": 10,
+            "file_name": f"load_{os.getpid()}_{next(_file_counter)}.FCStd",
+        }),
+    }
+
+
+def _mcp_arguments(tool: str) -> dict:
+    """Аргументы по умолчанию для MCP инструментов."""
+    if tool in ("create_cube", "create_sphere", "create_cylinder"):
+        return {"size": random.choice([5, 10, 20])}
+    if tool == "create_shape":
+        return {"shape_type": random.choice(["cube", "sphere", "cylinder"]), "size": 10}
+    if tool == "create_test_shape":
+        return {"shape_type": "cube", "size": 10, "file_name": f"load_mcp_{os.getpid()}_{next(_file_counter)}.FCStd"}
+    return {}
+
+
+def parse_mix(spec: str) -> List[Tuple[str, str, float]]:
+    """'api:create-shape=4,mcp:create_cube=1' -> [(транспорт, имя, вес), ...]."""
+    mix = []
+    api_operations = _api_operations()
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, weight = item.partition("=")
+        transport, _, operation = name.partition(":")
+        if transport not in ("api", "mcp") or not operation:
+            raise ValueError(f"Неверная операция смеси: {item!r} (ожидается api:<имя> или mcp:<инструмент>)")
+        if transport == "api" and operation not in api_operations:
+            raise ValueError(f"Неизвестная API операция {operation!r}. Доступно: {', '.join(api_operations)}")
+        mix.append((transport, operation, float(weight or 1)))
+    if not mix:
+        raise ValueError("Пустая смесь операций")
+    return mix
+
+
+class Stats:
+    """Латентности и ошибки по операциям."""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+        self.error_samples: Dict[str, str] = {}
+
+    def record(self, name: str, latency: float, error: Optional[str]):
+        self.latencies.setdefault(name, []).append(latency)
+        if error:
+            self.errors[name] = self.errors.get(name, 0) + 1
+            self.error_samples.setdefault(name, error[:300])
+
+    @staticmethod
+    def _percentile(values: List[float], q: float) -> float:
+        if not values:
+            return 0.0
+        index = min(len(values) - 1, max(0, int(round(q * (len(values) - 1)))))
+        return values[index]
+
+    def summary(self, elapsed: float) -> Dict:
+        operations = {}
+        all_latencies = []
+        total_errors = 0
+        for name, values in sorted(self.latencies.items()):
+            ordered = sorted(values)
+            all_latencies.extend(ordered)
+            errors = self.errors.get(name, 0)
+            total_errors += errors
+            operations[name] = self._row(ordered, errors, elapsed)
+            if name in self.error_samples:
+                operations[name]["error_sample"] = self.error_samples[name]
+        return {
+            "total": self._row(sorted(all_latencies), total_errors, elapsed),
+            "operations": operations,
+        }
+
+    def _row(self, ordered: List[float], errors: int, elapsed: float) -> Dict:
+        count = len(ordered)
+        return {
+            "requests": count,
+            "errors": errors,
+            "error_rate": round(errors / count, 4) if count else 0.0,
+            "throughput_rps": round(count / elapsed, 2) if elapsed else 0.0,
+            "p50_ms": round(self._percentile(ordered, 0.50) * 1000, 2),
+            "p95_ms": round(self._percentile(ordered, 0.95) * 1000, 2),
+            "p99_ms": round(self._percentile(ordered, 0.99) * 1000, 2),
+            "max_ms": round(ordered[-1] * 1000, 2) if ordered else 0.0,
+        }
+
+
+class LoadRunner:
+    def __init__(self, args):
+        self.args = args
+        self.mix = parse_mix(args.mix)
+        self.weights = [weight for _, _, weight in self.mix]
+        self.api_operations = _api_operations()
+        self.stats = Stats()
+        self.http: Optional[httpx.AsyncClient] = None
+        self.mcp = None
+
+    async def _call(self, transport: str, operation: str):
+        name = f"{transport}:{operation}"
+        start = time.perf_counter()
+        error = None
+        try:
+            if transport == "api":
+                path, params_factory = self.api_operations[operation]
+                response = await self.http.get(path, params=params_factory())
+                if response.status_code >= 400:
+                    error = f"HTTP {response.status_code}: {response.text}"
+            else:
+                result = await self.mcp.call_tool(operation, _mcp_arguments(operation), raise_on_error=False)
+                if result.is_error:
+                    error = str(result.content)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        self.stats.record(name, time.perf_counter() - start, error)
+
+    def _pick(self) -> Tuple[str, str]:
+        transport, operation, _ = random.choices(self.mix, weights=self.weights)[0]
+        return transport, operation
+
+    async def _closed_loop(self, deadline: float):
+        async def user():
+            while time.perf_counter() < deadline:
+                await self._call(*self._pick())
+
+        await asyncio.gather(*(user() for _ in range(self.args.concurrency)))
+
+    async def _open_loop(self, deadline: float):
+        # Открытая модель: запросы запускаются по расписанию независимо от ответов
+        interval = 1.0 / self.args.rate
+        in_flight = set()
+        next_start = time.perf_counter()
+        while next_start < deadline:
+            await asyncio.sleep(max(0.0, next_start - time.perf_counter()))
+            task = asyncio.create_task(self._call(*self._pick()))
+            in_flight.add(task)
+            task.add_done_callback(in_flight.discard)
+            next_start += interval
+        if in_flight:
+            await asyncio.gather(*in_flight)
+
+    async def run(self) -> Dict:
+        limits = httpx.Limits(max_connections=max(self.args.concurrency, 100), max_keepalive_connections=max(self.args.concurrency, 100))
+        async with httpx.AsyncClient(base_url=self.args.api_url, timeout=self.args.timeout, limits=limits) as http:
+            self.http = http
+            if self.args.open_document:
+                response = await http.get("/api/cad/open-document", params={"file_path": self.args.open_document})
+                response.raise_for_status()
+
+            uses_mcp = any(transport == "mcp" for transport, _, _ in self.mix)
+            if uses_mcp:
+                from fastmcp import Client
+                self.mcp = Client(self.args.mcp_url, timeout=self.args.timeout)
+                await self.mcp.__aenter__()
+            try:
+                started = time.perf_counter()
+                deadline = started + self.args.duration
+                if self.args.rate:
+                    await self._open_loop(deadline)
+                else:
+                    await self._closed_loop(deadline)
+                elapsed = time.perf_counter() - started
+            finally:
+                if self.mcp is not None:
+                    await self.mcp.__aexit__(None, None, None)
+
+        return {
+            "config": {
+                "api_url": self.args.api_url,
+                "mcp_url": self.args.mcp_url,
+                "mix": self.args.mix,
+                "mode": "rate" if self.args.rate else "concurrency",
+                "rate": self.args.rate,
+                "concurrency": None if self.args.rate else self.args.concurrency,
+                "duration_s": self.args.duration,
+                "stand_in": self.args.stand_in,
+            },
+            "elapsed_s": round(elapsed, 3),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            **self.stats.summary(elapsed),
+        }
+
+
+# ============ ЛОКАЛЬНАЯ ЗАГЛУШКА ============
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_stand_in(port: Optional[int] = None):
+    """
+    Поднять main.app (REST API и MCP на /mcp) в фоновом потоке с заглушкой FreeCAD.
+
+    Порт по умолчанию — свободный, чтобы не столкнуться с запущенным
+    dev-сервером. Файлы .FCStd пишутся во временную папку.
+    Возвращает (uvicorn.Server, поток сервера, адрес API).
+    """
+    import tempfile
+    import uvicorn
+    from helpers import fake_freecad
+
+    fake_freecad.install()
+    os.chdir(tempfile.mkdtemp(prefix="cad_load_"))
+    os.environ.setdefault("TRACING_ENABLED", "0")
+
+    import main
+
+    port = port or _free_port()
+    server = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+
+    deadline = time.time() + 15
+    while time.time() < deadline:
+        if server.started:
+            return server, thread, f"http://127.0.0.1:{port}"
+        time.sleep(0.1)
+    raise RuntimeError("Заглушка не запустилась за 15 секунд")
+
+
+# ============ ОТЧЕТ ============
+
+def render_html(report: Dict) -> str:
+    columns = ["requests", "errors", "error_rate", "throughput_rps", "p50_ms", "p95_ms", "p99_ms", "max_ms"]
+    rows = []
+    for name, row in [("ИТОГО", report["total"])] + list(report["operations"].items()):
+        cells = "".join(f"<td>{html.escape(str(row.get(c, '')))}</td>" for c in columns)
+        rows.append(f"<tr><th>{html.escape(name)}</th>{cells}</tr>")
+    header = "".join(f"<th>{c}</th>" for c in columns)
+    config = html.escape(json.dumps(report["config"], ensure_ascii=False, indent=2))
+    return f"""<!DOCTYPE html>
+<html lang="ru"><head><meta charset="utf-8"><title>CAD load test {report['timestamp']}</title>
+<style>body{{font-family:sans-serif}}table{{border-collapse:collapse}}td,th{{border:1px solid #ccc;padding:4px 8px;text-align:right}}</style>
+</head><body>
+<h1>Нагрузочный тест CAD gateway</h1>
+<p>{report['timestamp']}, длительность {report['elapsed_s']} с</p>
+<table><tr><th>операция</th>{header}</tr>{''.join(rows)}</table>
+<h2>Конфигурация</h2><pre>{config}</pre>
+</body></html>
+"""
+
+
+def save_report(report: Dict, path: str):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        if path.lower().endswith((".html", ".htm")):
+            f.write(render_html(report))
+        else:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+def print_summary(report: Dict):
+    print("=" * 100)
+    print(f"{'операция':<32}{'запросов':>10}{'ошибок':>8}{'rps':>10}{'p50 мс':>10}{'p95 мс':>10}{'p99 мс':>10}")
+    print("-" * 100)
+    for name, row in list(report["operations"].items()) + [("ИТОГО", report["total"])]:
+        print(f"{name:<32}{row['requests']:>10}{row['errors']:>8}{row['throughput_rps']:>10}"
+              f"{row['p50_ms']:>10}{row['p95_ms']:>10}{row['p99_ms']:>10}")
+    print("=" * 100)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Нагрузочный тест CAD API Gateway и MCP сервера")
+    parser.add_argument("--api-url", default="http://localhost:8001", help="Адрес FastAPI")
+    parser.add_argument("--mcp-url", default="http://localhost:8001/mcp", help="Адрес MCP streamable-http")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Смесь операций, например api:create-shape=4,mcp:create_cube=1")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--concurrency", type=int, default=10, help="Число параллельных пользователей (закрытая модель)")
+    mode.add_argument("--rate", type=float, help="Запросов в секунду (открытая модель)")
+    parser.add_argument("--duration", type=float, default=30.0, help="Длительность теста в секундах")
+    parser.add_argument("--timeout", type=float, default=30.0, help="Таймаут одного запроса")
+    parser.add_argument("--open-document", default="load_test.FCStd", help="Документ, открываемый перед тестом ('' — не открывать)")
+    parser.add_argument("--report", default=os.path.join("load_reports", f"load_{time.strftime('%Y%m%d-%H%M%S')}.json"),
+                        help="Файл отчета (.json или .html)")
+    parser.add_argument("--stand-in", action="store_true",
+                        help="Поднять локальную заглушку FreeCAD + API + MCP на свободном порту (вместо --api-url/--mcp-url)")
+    args = parser.parse_args(argv)
+
+    stand_in = None
+    report_path = os.path.abspath(args.report)
+    if args.stand_in:
+        stand_in = start_stand_in()
+        args.api_url = stand_in[2]
+        args.mcp_url = f"{args.api_url}/mcp"
+
+    try:
+        report = asyncio.run(LoadRunner(args).run())
+    finally:
+        if stand_in is not None:
+            server, thread, _ = stand_in
+            server.should_exit = True
+            thread.join(timeout=10)
+    save_report(report, report_path)
+    print_summary(report)
+    print(f"📄 Отчет: {report_path}")
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -1,38 +1,179 @@
 # main.py
-from fastapi import FastAPI, HTTPException
-import httpx
-import uvicorn
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Header, Request
+from fastapi.responses import Response, FileResponse, JSONResponse
+from pydantic import BaseModel
+from typing import Any, Dict, List, Optional
+from dotenv import load_dotenv
+
+# .env загружаем до импорта модулей, которые читают настройки при импорте
+load_dotenv()
+
 from common_logic import core
+import cad_service
+from ai_agent.agent_router import router as agent_router
+from cad_service import CADServiceError
 import asyncio
-from mcp_instance import mcp
-import threading
-import math
-from dotenv import load_dotenv
+import importlib
 import os
-import json
+from metrics import PrometheusMiddleware, generate_latest, CONTENT_TYPE_LATEST
+from middleware.custom_middleware import (
+    RequestContextMiddleware, ProfilingMiddleware, PROFILE_TOKEN_HEADER,
+    verify_profiling_token, list_profiles, get_profile_path
+)
+from tracing import TracingMiddleware
+from tools.http_client import bind_local_gateway, unbind_local_gateway, aclose_client
 
-load_dotenv()
+HOST = os.getenv("HOST", "0.0.0.0")
+PORT = int(os.getenv("PORT", "8001"))
+# Число процессов uvicorn; у каждого свой FreeCAD и свой открытый документ
+WORKERS = int(os.getenv("WEB_CONCURRENCY", "1"))
+# С несколькими воркерами MCP сессия не переживет переход на другой процесс,
+# поэтому по умолчанию каждый MCP запрос самодостаточен (stateless)
+MCP_STATELESS_HTTP = os.getenv("MCP_STATELESS_HTTP", "1" if WORKERS > 1 else "0") == "1"
+# Подключиться к FreeCAD при старте, а не на первом запросе
+CAD_WARMUP = os.getenv("CAD_WARMUP", "1") == "1"
+# Загрузить модули агента (LangChain) в фоне после старта, а не на первом запросе
+AGENT_WARMUP = os.getenv("AGENT_WARMUP", "1") == "1"
+
+
+def _build_mcp_app():
+    """Импортировать fastmcp и инструменты, собрать ASGI приложение MCP."""
+    import tools
+    from mcp_instance import mcp
+
+    tools.register_all()
+    return mcp.http_app(path="/mcp", stateless_http=MCP_STATELESS_HTTP)
+
+
+class LazyMCPApp:
+    """
+    MCP (streamable-http) на /mcp в том же приложении и event loop.
+
+    fastmcp и модули инструментов импортируются в фоне после старта
+    gateway, поэтому REST API начинает отвечать сразу. Запросы к /mcp,
+    пришедшие раньше, ждут окончания загрузки.
+    """
+
+    def __init__(self):
+        self.app = None
+        self._ready: Optional[asyncio.Event] = None
+        self._stop: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self, parent: FastAPI):
+        self._ready, self._stop = asyncio.Event(), asyncio.Event()
+        self._task = asyncio.create_task(self._run(parent))
+
+    async def _run(self, parent: FastAPI):
+        try:
+            mcp_app = await asyncio.to_thread(_build_mcp_app)
+            # Смонтированные приложения Starlette не получают lifespan сами —
+            # менеджер MCP сессий живет в этой задаче до остановки FastAPI
+            async with mcp_app.lifespan(parent):
+                self.app = mcp_app
+                self._ready.set()
+                await self._stop.wait()
+        except Exception as e:
+            print(f"⚠️ MCP не запущен: {e}")
+        finally:
+            self.app = None
+            self._ready.set()
 
+    async def stop(self):
+        if self._task is not None:
+            self._stop.set()
+            await self._task
+            self._task = None
 
-# Импорт всех инструментов для регистрации MCP
-from tools import tool_create_cube, tool_create_cylinder, tool_create_shapes, tool_create_sphere, tool_documents, tool_status, tool_open_document, tool_save_document, tool_close_document, tool_create_complex_shape, tool_test_shape
+    async def __call__(self, scope, receive, send):
+        if self._ready is not None:
+            await self._ready.wait()
+        if self.app is None:
+            response = JSONResponse(status_code=503, content={"detail": "MCP сервер недоступен"})
+            await response(scope, receive, send)
+            return
+        await self.app(scope, receive, send)
 
-app = FastAPI(title="CAD API Gateway")
+
+mcp_app = LazyMCPApp()
+
+
+def _warm_up_agent():
+    agent_module = importlib.import_module("ai_agent.agent")
+    try:
+        agent_module.warm_up()
+    except Exception as e:
+        print(f"⚠️ Прогрев агента не удался: {e}")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if CAD_WARMUP and not core.freecad:
+        result = core.connect()
+        if not result["success"]:
+            print(f"⚠️ FreeCAD не подключен при старте: {result.get('error')}")
+    # MCP инструменты этого процесса вызывают сервисный слой напрямую, без HTTP
+    bind_local_gateway(cad_service.ROUTES, asyncio.get_running_loop())
+    mcp_app.start(app)
+    # Ссылка на задачу, чтобы ее не собрал сборщик мусора до завершения
+    agent_warmup = asyncio.create_task(asyncio.to_thread(_warm_up_agent)) if AGENT_WARMUP else None
+    try:
+        yield
+    finally:
+        # Поток прогрева не прервать, но его результат при остановке уже не ждем
+        if agent_warmup is not None and not agent_warmup.done():
+            agent_warmup.cancel()
+        await mcp_app.stop()
+        unbind_local_gateway()
+        await aclose_client()
+
+app = FastAPI(title="CAD API Gateway", lifespan=lifespan)
+# Профилирование — самый внутренний слой, в профиль попадает только обработка запроса
+app.add_middleware(ProfilingMiddleware)
+app.add_middleware(PrometheusMiddleware)
+# Request id и Server-Timing — внешний слой, чтобы учесть всё время запроса
+app.add_middleware(RequestContextMiddleware)
+# Серверный спан с учетом входящего traceparent (агент / MCP инструмент)
+app.add_middleware(TracingMiddleware)
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Метрики в формате Prometheus."""
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+def _require_profiling_token(token: str):
+    if not verify_profiling_token(token):
+        raise HTTPException(status_code=403, detail="Профилирование выключено или неверный токен")
+
+@app.get("/api/admin/profiles", include_in_schema=False)
+async def get_profiles(x_profile_token: str = Header(None, alias=PROFILE_TOKEN_HEADER)):
+    """Список сохраненных профилей запросов (нужен заголовок X-Profile-Token)."""
+    _require_profiling_token(x_profile_token)
+    return {"profiles": list_profiles()}
+
+@app.get("/api/admin/profiles/{name}", include_in_schema=False)
+async def download_profile(name: str, x_profile_token: str = Header(None, alias=PROFILE_TOKEN_HEADER)):
+    """Скачать профиль (.pstats) или его текстовую сводку (.txt)."""
+    _require_profiling_token(x_profile_token)
+    path = get_profile_path(name)
+    if not path:
+        raise HTTPException(status_code=404, detail="Профиль не найден")
+    return FileResponse(path, filename=name)
+
+@app.exception_handler(CADServiceError)
+async def cad_service_error_handler(request: Request, exc: CADServiceError):
+    return JSONResponse(status_code=exc.status_code, content={"detail": exc.detail})
 
 @app.get("/api/mcp/status")
 async def get_mcp_status():
     """Получить статус MCP сервера."""
-    return {
-        "status": "running",
-        "tools": ["get_mcp_status", "get_documents", "create_shape", "create_cube", "create_sphere", "create_cylinder", "open_document", "save_document", "close_document", "create_complex_shape", "create_test_shape"],
-        "description": "CAD MCP Server for FreeCAD operations"
-    }
+    return await cad_service.mcp_status()
 
 @app.get("/api/cad/documents")
 async def get_documents():
     """Получить документы из FreeCAD."""
-    result = await core.get_onshape_documents()
-    return {"result": result}
+    return await cad_service.get_documents()
 
 @app.get("/api/cad/create-shape")
 async def create_shape(
@@ -50,39 +191,7 @@ async def create_shape(
     - size: Размер фигуры в мм
     - x, y, z: Координаты центра фигуры (в мм)
     """
-    # Валидация параметров
-    if size <= 0:
-        raise HTTPException(
-            status_code=400, 
-            detail="Размер должен быть положительным числом"
-        )
-    
-    valid_shapes = ["cube", "sphere", "cylinder"]
-    if shape_type.lower() not in valid_shapes:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Неподдерживаемый тип фигуры. Доступно: {', '.join(valid_shapes)}"
-        )
-    
-    # Вызов метода из common_logic с координатами
-    result = await core.create_simple_shape(
-        shape_type.lower(), 
-        size,
-        x,
-        y,
-        z
-    )
-    
-    return {
-        "result": result,
-        "parameters": {
-            "shape_type": shape_type,
-            "size": size,
-            "x": x,
-            "y": y,
-            "z": z
-        }
-    }
+    return await cad_service.create_shape(shape_type, size, x, y, z)
 
 @app.get("/api/cad/create-complex-shape")
 async def create_complex_shape(
@@ -104,168 +213,29 @@ async def create_complex_shape(
     - gear (шестеренка): требуется teeth, module, outer_radius, height
     - torus (тор): требуется major_radius, minor_radius
     """
-    # Валидация типа фигуры
-    valid_shapes = ["star", "gear", "torus"]
-    if shape_type.lower() not in valid_shapes:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Неподдерживаемый тип фигуры. Доступно: {', '.join(valid_shapes)}"
-        )
-    
-    # Проверяем подключение к FreeCAD
-    if not core.freecad:
-        result = core.connect()
-        if not result["success"]:
-            raise HTTPException(
-                status_code=500,
-                detail=f"Ошибка подключения к FreeCAD: {result.get('error', 'Неизвестная ошибка')}"
-            )
-    
-    # Проверяем наличие открытого документа
-    if not core.current_doc:
-        raise HTTPException(
-            status_code=400,
-            detail="Нет открытого документа. Сначала откройте документ с помощью /api/cad/open-document"
-        )
-    
-    try:
-        doc = core.current_doc
-        
-        if shape_type.lower() == "torus":
-            # Проверка параметров
-            if major_radius is None or minor_radius is None:
-                raise HTTPException(
-                    status_code=400,
-                    detail="Для тора требуются major_radius и minor_radius"
-                )
-            if major_radius <= 0 or minor_radius <= 0:
-                raise HTTPException(
-                    status_code=400,
-                    detail="Радиусы должны быть положительными"
-                )
-            if minor_radius >= major_radius:
-                raise HTTPException(
-                    status_code=400,
-                    detail="minor_radius должен быть меньше major_radius"
-                )
-            
-            # Создание тора
-            torus = core.part.makeTorus(major_radius, minor_radius)
-            obj = doc.addObject("Part::Feature", f"Torus_{major_radius}x{minor_radius}")
-            obj.Shape = torus
-            doc.recompute()
-            
-            result_message = f"Тор создан с большим радиусом {major_radius} мм и малым радиусом {minor_radius} мм"
-            
-        elif shape_type.lower() == "star":
-            if num_points is None or inner_radius is None or outer_radius is None or height is None:
-                raise HTTPException(
-                    status_code=400,
-                    detail="Для звезды требуются num_points, inner_radius, outer_radius, height"
-                )
-            if num_points < 5 or num_points % 2 == 0:
-                raise HTTPException(
-                    status_code=400,
-                    detail="num_points для звезды должно быть нечетным числом >=5"
-                )
-            if inner_radius <= 0 or outer_radius <= 0 or height <= 0:
-                raise HTTPException(
-                    status_code=400,
-                    detail="Радиусы и высота должны быть положительными"
-                )
-            if inner_radius >= outer_radius:
-                raise HTTPException(
-                    status_code=400,
-                    detail="inner_radius должен быть меньше outer_radius"
-                )
-            
-            # Создание звезды
-            import math
-            points = []
-            for i in range(num_points * 2):
-                angle = i * math.pi / num_points
-                radius = inner_radius if i % 2 == 0 else outer_radius
-                x = radius * math.cos(angle)
-                y = radius * math.sin(angle)
-                points.append(core.freecad.Vector(x, y, 0))
-            
-            # Замыкаем контур
-            points.append(points[0])
-            
-            # Создаем полигон
-            wire = core.part.makePolygon(points)
-            face = core.part.Face(wire)
-            
-            extruded = face.extrude(core.freecad.Vector(0, 0, height))
-            obj = doc.addObject("Part::Feature", f"Star_{num_points}pts")
-            obj.Shape = extruded
-            doc.recompute()
-            
-            result_message = f"Звезда создана с {num_points} лучами, высотой {height} мм"
-            
-        elif shape_type.lower() == "gear":
-            if teeth is None or module is None or outer_radius is None or height is None:
-                raise HTTPException(
-                    status_code=400,
-                    detail="Для шестеренки требуются teeth, module, outer_radius, height"
-                )
-            if teeth < 3:
-                raise HTTPException(
-                    status_code=400,
-                    detail="teeth должно быть >=3"
-                )
-            if module <= 0 or outer_radius <= 0 or height <= 0:
-                raise HTTPException(
-                    status_code=400,
-                    detail="module, outer_radius и height должны быть положительными"
-                )
-            # В реальном проекте нужно использовать более сложную геометрию
-            cylinder = core.part.makeCylinder(outer_radius, height)
-            obj = doc.addObject("Part::Feature", f"Gear_{teeth}teeth")
-            obj.Shape = cylinder
-            doc.recompute()
-            
-            result_message = f"Упрощенная шестеренка создана с {teeth} зубьями, высотой {height} мм. Для точной геометрии используйте специализированные библиотеки."
-        
-        return {
-            "result": result_message,
-            "parameters": {
-                "shape_type": shape_type,
-                "num_points": num_points,
-                "inner_radius": inner_radius,
-                "outer_radius": outer_radius,
-                "height": height,
-                "teeth": teeth,
-                "module": module,
-                "major_radius": major_radius,
-                "minor_radius": minor_radius
-            }
-        }
-        
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Ошибка создания сложной фигуры: {str(e)}"
-        )
+    return await cad_service.create_complex_shape(
+        shape_type,
+        num_points=num_points,
+        inner_radius=inner_radius,
+        outer_radius=outer_radius,
+        height=height,
+        teeth=teeth,
+        module=module,
+        major_radius=major_radius,
+        minor_radius=minor_radius
+    )
 
 @app.get("/api/cad/open-document")
 async def open_document(file_path: str):
-    if not file_path:
-        raise HTTPException(status_code=400, detail="Путь к файлу обязателен")
-    result = await core.open_document(file_path)
-    return {"result": result}
+    return await cad_service.open_document(file_path)
 
 @app.get("/api/cad/save-document")
 async def save_document(file_path: str = None):
-    result = await core.save_document(file_path)
-    return {"result": result}
+    return await cad_service.save_document(file_path)
 
 @app.get("/api/cad/close-document")
 async def close_document():
-    result = await core.close_document()
-    return {"result": result}
+    return await cad_service.close_document()
 
 @app.get("/api/cad/create-test-shape")
 async def create_test_shape_endpoint(
@@ -285,76 +255,48 @@ async def create_test_shape_endpoint(
     - x, y, z: Координаты центра фигуры (в мм)
     - file_name: Имя файла (если None, будет сгенерировано автоматически)
     """
-    # Валидация параметров
-    if size <= 0:
-        raise HTTPException(
-            status_code=400, 
-            detail="Размер должен быть положительным числом"
-        )
-    valid_shapes = ["cube", "sphere", "cylinder"]
-    if shape_type.lower() not in valid_shapes:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Неподдерживаемый тип фигуры. Доступно: {', '.join(valid_shapes)}"
-        )
-    if not file_name:
-        import uuid
-        file_name = f"test_{shape_type}_{size}mm_{uuid.uuid4().hex[:8]}.FCStd"
-    elif not file_name.lower().endswith('.fcstd'):
-        raise HTTPException(
-            status_code=400,
-            detail="Файл должен иметь расширение .FCStd"
-        )
-    
-    try:
-        open_result = await core.open_document(file_name)
-        create_result = await core.create_simple_shape(
-            shape_type.lower(), 
-            size,
-            x,
-            y,
-            z
-        )
-        save_result = await core.save_document(file_name)
-        close_result = await core.close_document()
-        return {
-            "success": True,
-            "result": "Тестовая фигура создана и сохранена успешно",
-            "details": {
-                "file": file_name,
-                "shape_type": shape_type,
-                "size": size,
-                "coordinates": {"x": x, "y": y, "z": z},
-                "open_result": open_result,
-                "create_result": create_result,
-                "save_result": save_result,
-                "close_result": close_result
-            },
-            "message": (
-                f"✅ Файл создан: {file_name}\n"
-                f"📐 Тип фигуры: {shape_type}\n"
-                f"📏 Размер: {size} мм\n"
-                f"📍 Координаты: ({x}, {y}, {z}) мм\n"
-                f"📄 Открытие документа: {open_result}\n"
-                f"🎯 Создание фигуры: {create_result}\n"
-                f"💾 Сохранение: {save_result}\n"
-                f"🚪 Закрытие: {close_result}"
-            )
-        }
-        
-    except Exception as e:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Ошибка при создании тестовой фигуры: {str(e)}"
-        )
-
-@app.get("/reward")
-async def process_reward(
-    request: Request,
-    user_id: int = Query(...),
-    _: bool = Depends(verify_by_ip)
-):
-    ...
+    return await cad_service.create_test_shape(shape_type, size, x, y, z, file_name)
+
+class RunScriptRequest(BaseModel):
+    operations: List[Dict[str, Any]]
+
+@app.post("/api/cad/run-script")
+async def run_script(request: RunScriptRequest):
+    """
+    Выполнить список операций одной транзакцией.
+
+    Операции: open, create, boolean, pattern, save, export, close.
+    Шаги выполняются по порядку; при ошибке до первой записи на диск сценарий откатывается.
+    Возвращает результат каждого шага.
+    """
+    return await cad_service.run_script(request.operations)
+
+class MakePartRequest(BaseModel):
+    parts: List[Dict[str, Any]]
+    file_name: Optional[str] = None
+    fuse: bool = False
+    export: Optional[str] = None
+
+@app.post("/api/cad/make-part")
+async def make_part(request: MakePartRequest):
+    """
+    Создать файл детали по описанию одной транзакцией.
+
+    Открывает документ, создает фигуры (subtract — вычесть), при необходимости
+    объединяет их, сохраняет, экспортирует и закрывает документ.
+    """
+    return await cad_service.make_part(request.parts, request.file_name, request.fuse, request.export)
+
+class PrefetchRequest(BaseModel):
+    files: List[str] = []
+
+@app.post("/api/cad/prefetch")
+async def prefetch(request: PrefetchRequest):
+    """
+    Прогреть CAD до запроса: подключить FreeCAD, прогреть ядро геометрии,
+    прочитать файлы .FCStd в кэш. Вызывает AI агент, пока ждет модель.
+    """
+    return await cad_service.prefetch(request.files)
 
 @app.get("/")
 async def root():
@@ -374,23 +316,31 @@ async def root():
             "create_test_cube": "/api/cad/create-test-shape?shape_type=cube&size=15",
             "create_test_sphere": "/api/cad/create-test-shape?shape_type=sphere&size=20",
             "create_test_cylinder": "/api/cad/create-test-shape?shape_type=cylinder&size=10&size=30",
+            "run_script": "/api/cad/run-script (POST)",
+            "make_part": "/api/cad/make-part (POST)",
+            "prefetch": "/api/cad/prefetch (POST)",
+            "metrics": "/metrics",
+            "mcp": "/mcp (MCP streamable-http)",
             "agent_query": "/api/agent/query (POST)",
+            "agent_batch": "/api/agent/batch (POST)",
             "agent_status": "/api/agent/status",
             "agent_help": "/api/agent/help"
         },
         "notes": "Размер указывается в миллиметрах. Для test_shape можно указать имя файла или оно будет сгенерировано автоматически"
     }
 
-# УДАЛЕНО: старый эндпоинт /api/agent/query (перенесен в agent_router)
+app.include_router(agent_router)
+
+# MCP endpoint. Добавляется маршрутом, а не mount, чтобы /mcp отвечал без
+# редиректа на /mcp/; запросы проходят те же middleware, что и REST API.
+app.add_route("/mcp", mcp_app, include_in_schema=False)
 
 if __name__ == "__main__":
-    # Запуск MCP сервера в отдельном потоке
-    mcp_thread = threading.Thread(target=lambda: mcp.run(transport="streamable-http", host="0.0.0.0", port=8000), daemon=True)
-    mcp_thread.start()
+    import uvicorn
 
     print("=" * 60)
     print("FreeCAD FastAPI Server запущен")
-    print("MCP Server запущен на порту 8000")
+    print(f"MCP Server: http://localhost:{PORT}/mcp (воркеров: {WORKERS})")
     print("AI Agent (LangChain) инициализирован")
     print("=" * 60)
     print("Swagger UI: http://localhost:8001/docs")
@@ -398,8 +348,15 @@ if __name__ == "__main__":
     print("Создать куб 15мм: http://localhost:8001/api/cad/create-shape?shape_type=cube&size=15")
     print("Создать тестовый куб: http://localhost:8001/api/cad/create-test-shape?shape_type=cube&size=15")
     print("AI Agent запрос: POST http://localhost:8001/api/agent/query")
+    print("AI Agent пакет запросов: POST http://localhost:8001/api/agent/batch")
     print("AI Agent статус: GET http://localhost:8001/api/agent/status")
     print("Пример запроса к агенту:")
     print('curl -X POST http://localhost:8001/api/agent/query -H "Content-Type: application/json" -d \'{"query": "Создай куб размером 20мм"}\'')
+    print("Стриминг ответа (SSE):")
+    print('curl -N -X POST http://localhost:8001/api/agent/query -H "Content-Type: application/json" -d \'{"query": "Создай куб размером 20мм", "stream": true}\'')
     print("=" * 60)
-    uvicorn.run(app, host="0.0.0.0", port=8001)
\ No newline at end of file
+    if WORKERS > 1:
+        # Несколько воркеров uvicorn умеет запускать только по строке импорта
+        uvicorn.run("main:app", host=HOST, port=PORT, workers=WORKERS)
+    else:
+        uvicorn.run(app, host=HOST, port=PORT)
\ No newline at end of file
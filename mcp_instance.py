@@ -2,6 +2,18 @@
 
 # Импорт из fastmcp, как в требованиях
 from fastmcp import FastMCP
+from metrics import tool_metrics_middleware
+from middleware.custom_middleware import request_id_tool_middleware
+from tracing import tracing_tool_middleware
 
 # Создаем единый экземпляр FastMCP
-mcp = FastMCP("CAD-Server")
\ No newline at end of file
+mcp = FastMCP("CAD-Server")
+
+# Замер длительности каждого вызова инструмента для /metrics
+mcp.add_middleware(tool_metrics_middleware())
+
+# Request id на вызов инструмента, пробрасывается в запросы к FastAPI
+mcp.add_middleware(request_id_tool_middleware())
+
+# Спан на вызов инструмента, связывается с агентом через traceparent
+mcp.add_middleware(tracing_tool_middleware())
\ No newline at end of file
@@ -1 +1,539 @@
-# тут основной файл для prometheus штуки
\ No newline at end of file
+"""
+Метрики Prometheus для CAD API Gateway.
+
+Реализация без внешних зависимостей: счетчики, гистограммы и gauge'и
+хранятся в памяти процесса и отдаются в текстовом формате Prometheus
+через эндпоинт /metrics.
+
+На горячем пути выполняется только поиск дочерней метрики в словаре и
+пара арифметических операций под локом. Всё, что требует обхода
+документов FreeCAD (число документов, объектов), считается лениво
+в момент сбора метрик.
+"""
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+CONTENT_TYPE_LATEST = "text/plain; version=0.0.4; charset=utf-8"
+
+# Бакеты подобраны под диапазон от быстрых проверок статуса до долгих recompute
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape_label(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Iterable[str], values: Iterable[str]) -> str:
+    pairs = [f'{name}="{_escape_label(value)}"' for name, value in zip(names, values)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    """Базовый класс метрики с набором меток."""
+
+    type_name = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def labels(self, *values):
+        """Получить дочернюю метрику для конкретного набора значений меток."""
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name}: ожидается {len(self.labelnames)} меток, получено {len(key)}")
+            with self._lock:
+                child = self._children.get(key)
+                if child is None:
+                    child = self._new_child()
+                    self._children[key] = child
+        return child
+
+    def _default(self):
+        return self.labels()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def collect(self) -> List[str]:
+        raise NotImplementedError
+
+    def _header(self) -> List[str]:
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type_name}",
+        ]
+
+
+class _CounterChild:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+
+class Counter(_Metric):
+    """Монотонно растущий счетчик."""
+
+    type_name = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0):
+        self._default().inc(amount)
+
+    def collect(self) -> List[str]:
+        lines = self._header()
+        for key, child in list(self._children.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(child.value)}")
+        return lines
+
+
+class _GaugeChild:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def set(self, value: float):
+        self.value = value
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        with self._lock:
+            self.value -= amount
+
+
+class Gauge(_Metric):
+    """
+    Значение, которое может расти и убывать.
+
+    Если передан callback, значения вычисляются только при сборе метрик:
+    функция возвращает словарь {кортеж_меток: значение}.
+    """
+
+    type_name = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Tuple[str, ...] = (),
+        callback: Optional[Callable[[], Dict[Tuple[str, ...], float]]] = None,
+        registry=None
+    ):
+        super().__init__(name, documentation, labelnames, registry)
+        self._callback = callback
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value: float):
+        self._default().set(value)
+
+    def inc(self, amount: float = 1.0):
+        self._default().inc(amount)
+
+    def dec(self, amount: float = 1.0):
+        self._default().dec(amount)
+
+    def collect(self) -> List[str]:
+        lines = self._header()
+        if self._callback is not None:
+            try:
+                values = self._callback() or {}
+            except Exception:
+                # Сбор метрик не должен ронять /metrics из-за сломанного callback
+                values = {}
+            items = [(tuple(str(v) for v in key), value) for key, value in values.items()]
+        else:
+            items = [(key, child.value) for key, child in list(self._children.items())]
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class _HistogramChild:
+    __slots__ = ("upper_bounds", "counts", "sum", "_lock")
+
+    def __init__(self, upper_bounds: Tuple[float, ...]):
+        self.upper_bounds = upper_bounds
+        # Последний элемент — бакет +Inf
+        self.counts = [0] * (len(upper_bounds) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.upper_bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+
+class Histogram(_Metric):
+    """Гистограмма распределения значений (обычно длительностей в секундах)."""
+
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS,
+        registry=None
+    ):
+        self.upper_bounds = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self):
+        return _HistogramChild(self.upper_bounds)
+
+    def observe(self, value: float):
+        self._default().observe(value)
+
+    def collect(self) -> List[str]:
+        lines = self._header()
+        for key, child in list(self._children.items()):
+            with child._lock:
+                counts = list(child.counts)
+                total_sum = child.sum
+            cumulative = 0
+            for bound, count in zip(self.upper_bounds + (float("inf"),), counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames + ("le",), key + (_format_value(bound),))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total_sum)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    """Реестр всех метрик процесса."""
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric):
+        with self._lock:
+            if any(m.name == metric.name for m in self._metrics):
+                raise ValueError(f"Метрика {metric.name} уже зарегистрирована")
+            self._metrics.append(metric)
+
+    def generate_latest(self) -> str:
+        lines: List[str] = []
+        for metric in list(self._metrics):
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def generate_latest() -> str:
+    """Отрендерить все метрики в текстовом формате Prometheus."""
+    return REGISTRY.generate_latest()
+
+
+# ============ МЕТРИКИ ПРИЛОЖЕНИЯ ============
+
+HTTP_REQUEST_DURATION = Histogram(
+    "cad_http_request_duration_seconds",
+    "Длительность HTTP запросов к CAD API Gateway",
+    ("method", "route", "status")
+)
+
+MCP_TOOL_DURATION = Histogram(
+    "cad_mcp_tool_duration_seconds",
+    "Длительность вызовов MCP инструментов",
+    ("tool", "status")
+)
+
+FREECAD_OPERATION_DURATION = Histogram(
+    "cad_freecad_operation_duration_seconds",
+    "Длительность отдельных операций FreeCADCore (connect, makeBox, recompute, saveAs, ...)",
+    ("operation",)
+)
+
+QUEUE_DEPTH = Gauge(
+    "cad_queue_depth",
+    "Количество CAD запросов, ожидающих или выполняющихся на единственном экземпляре FreeCAD"
+)
+
+CACHE_REQUESTS = Counter(
+    "cad_cache_requests_total",
+    "Обращения к кэшам по результату (hit/miss)",
+    ("cache", "result")
+)
+
+
+def _cache_hit_ratios() -> Dict[Tuple[str, ...], float]:
+    totals: Dict[str, List[float]] = {}
+    for (cache, result), child in list(CACHE_REQUESTS._children.items()):
+        hits_and_total = totals.setdefault(cache, [0.0, 0.0])
+        if result == "hit":
+            hits_and_total[0] += child.value
+        hits_and_total[1] += child.value
+    return {(cache,): hits / total for cache, (hits, total) in totals.items() if total}
+
+
+CACHE_HIT_RATIO = Gauge(
+    "cad_cache_hit_ratio",
+    "Доля попаданий в кэш",
+    ("cache",),
+    callback=_cache_hit_ratios
+)
+
+
+def record_cache(cache: str, hit: bool):
+    """Зафиксировать обращение к кэшу."""
+    CACHE_REQUESTS.labels(cache, "hit" if hit else "miss").inc()
+
+
+# ============ МЕТРИКИ AI АГЕНТА ============
+
+AGENT_QUERY_DURATION = Histogram(
+    "cad_agent_query_duration_seconds",
+    "Длительность запросов к AI агенту по способу обработки (fast_path, cached_plan, llm)",
+    ("route", "status")
+)
+
+AGENT_LLM_CALLS = Counter(
+    "cad_agent_llm_calls_total",
+    "Вызовы LLM агентом",
+    ("model",)
+)
+
+AGENT_LLM_DURATION = Histogram(
+    "cad_agent_llm_duration_seconds",
+    "Длительность одного вызова LLM",
+    ("model",)
+)
+
+AGENT_TOKENS = Counter(
+    "cad_agent_tokens_total",
+    "Токены LLM по типу (prompt, completion)",
+    ("model", "kind")
+)
+
+AGENT_COST = Counter(
+    "cad_agent_cost_total",
+    "Оценка стоимости запросов к LLM (в единицах цены AGENT_PRICE_*)",
+    ("model",)
+)
+
+AGENT_TOOL_DURATION = Histogram(
+    "cad_agent_tool_duration_seconds",
+    "Длительность вызовов инструментов агента",
+    ("tool", "status")
+)
+
+AGENT_PROMPT_TOKENS = Histogram(
+    "cad_agent_prompt_tokens",
+    "Оценка размера промпта запроса к LLM в токенах по частям (system, tools, history, input, total)",
+    ("part",),
+    buckets=(50, 100, 250, 500, 1000, 2000, 4000, 8000)
+)
+
+AGENT_PREFETCH = Counter(
+    "cad_agent_prefetch_total",
+    "Спекулятивный прогрев CAD на время ответа модели по исходу (completed, cancelled, error)",
+    ("outcome",)
+)
+
+AGENT_ITERATIONS = Histogram(
+    "cad_agent_iterations",
+    "Число итераций (вызовов модели) на запрос к агенту",
+    buckets=(0, 1, 2, 3, 4, 5, 8)
+)
+
+
+def record_agent_query(usage: Dict):
+    """Зафиксировать итоги запроса к агенту (см. ai_agent/usage.py)."""
+    AGENT_QUERY_DURATION.labels(usage["route"], usage["status"]).observe(usage["total_seconds"])
+    AGENT_ITERATIONS.observe(usage["iterations"])
+    if usage["llm_calls"]:
+        model = usage["model"]
+        AGENT_LLM_CALLS.labels(model).inc(usage["llm_calls"])
+        AGENT_TOKENS.labels(model, "prompt").inc(usage["prompt_tokens"])
+        AGENT_TOKENS.labels(model, "completion").inc(usage["completion_tokens"])
+        AGENT_COST.labels(model).inc(usage["cost"])
+    for part, tokens in usage.get("prompt", {}).items():
+        AGENT_PROMPT_TOKENS.labels(part).observe(tokens)
+
+
+# Подписчики на завершение операций FreeCADCore: fn(operation, start, duration)
+_operation_listeners: List[Callable[[str, float, float], None]] = []
+
+
+def add_operation_listener(listener: Callable[[str, float, float], None]):
+    """
+    Подписаться на замеры операций FreeCADCore.
+
+    Используется middleware (Server-Timing) и трассировкой, чтобы не
+    расставлять по коду ядра отдельные замеры для каждой подсистемы.
+    start — значение time.perf_counter() в момент начала операции.
+    """
+    if listener not in _operation_listeners:
+        _operation_listeners.append(listener)
+
+
+@contextmanager
+def time_operation(operation: str):
+    """
+    Контекстный менеджер для замера операции FreeCADCore.
+
+    Пример:
+        with time_operation("recompute"):
+            doc.recompute()
+    """
+    child = FREECAD_OPERATION_DURATION.labels(operation)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - start
+        child.observe(duration)
+        for listener in _operation_listeners:
+            listener(operation, start, duration)
+
+
+def register_freecad_gauges(core):
+    """
+    Зарегистрировать gauge'и состояния FreeCAD для экземпляра ядра.
+
+    Значения считаются лениво при запросе /metrics, поэтому не влияют
+    на время обработки CAD запросов.
+    """
+    def _documents():
+        if not core.freecad:
+            return {(): 0}
+        return {(): len(core.freecad.listDocuments())}
+
+    def _objects():
+        if not core.freecad:
+            return {}
+        return {
+            (doc.Name,): len(doc.Objects)
+            for doc in core.freecad.listDocuments().values()
+        }
+
+    Gauge(
+        "cad_open_documents",
+        "Количество открытых документов FreeCAD",
+        callback=_documents
+    )
+    Gauge(
+        "cad_document_objects",
+        "Количество объектов в открытых документах FreeCAD",
+        ("document",),
+        callback=_objects
+    )
+
+
+# ============ ASGI И MCP MIDDLEWARE ============
+
+class PrometheusMiddleware:
+    """
+    ASGI middleware: гистограмма латентности по шаблону маршрута
+    и глубина очереди CAD запросов.
+
+    Метка route берется из шаблона маршрута FastAPI (например
+    /api/cad/create-shape), а не из сырого пути, чтобы не плодить
+    кардинальность.
+    """
+
+    def __init__(self, app, queue_prefix: str = "/api/cad/"):
+        self.app = app
+        self.queue_prefix = queue_prefix
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_holder = {"status": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status_holder["status"] = message["status"]
+            await send(message)
+
+        queued = scope["path"].startswith(self.queue_prefix)
+        if queued:
+            QUEUE_DEPTH.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            duration = time.perf_counter() - start
+            if queued:
+                QUEUE_DEPTH.dec()
+            route = scope.get("route")
+            route_label = getattr(route, "path", None) or "unmatched"
+            HTTP_REQUEST_DURATION.labels(
+                scope.get("method", ""), route_label, status_holder["status"]
+            ).observe(duration)
+
+
+def tool_metrics_middleware():
+    """
+    Создать FastMCP middleware, замеряющий длительность вызовов инструментов.
+
+    fastmcp импортируется здесь, чтобы metrics.py оставался легким
+    модулем для FastAPI и FreeCADCore.
+    """
+    from fastmcp.server.middleware import Middleware
+
+    class ToolMetricsMiddleware(Middleware):
+        async def on_call_tool(self, context, call_next):
+            start = time.perf_counter()
+            status = "error"
+            try:
+                result = await call_next(context)
+                status = "ok"
+                return result
+            finally:
+                MCP_TOOL_DURATION.labels(context.message.name, status).observe(
+                    time.perf_counter() - start
+                )
+
+    return ToolMetricsMiddleware()
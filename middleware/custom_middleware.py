@@ -1 +1,320 @@
-# тут надо кастомный middleware сделать
\ No newline at end of file
+"""
+ASGI middleware для CAD API Gateway: request id, Server-Timing и slow-log.
+
+Каждый запрос получает идентификатор (из заголовка X-Request-ID или новый),
+который доступен через contextvar и пробрасывается в исходящие httpx
+запросы MCP инструментов. Время обработки раскладывается на фазы:
+
+- validation — от входа в приложение до первой операции FreeCAD
+  (если операций не было — всё время обработчика);
+- freecad    — операции FreeCADCore, кроме recompute и save;
+- recompute  — doc.recompute();
+- save       — doc.save() / doc.saveAs().
+
+Фазы отдаются в заголовке Server-Timing, а медленные запросы пишутся
+в структурированный slow-log (JSON на строку).
+
+Отдельный запрос можно прогнать под профилировщиком (ProfilingMiddleware),
+если сервер запущен с PROFILING_TOKEN.
+"""
+
+import asyncio
+import cProfile
+import hmac
+import io
+import json
+import logging
+import os
+import pstats
+import re
+import threading
+import time
+import uuid
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs
+
+from metrics import add_operation_listener
+
+REQUEST_ID_HEADER = "X-Request-ID"
+
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "1000"))
+SLOW_LOG_PATH = os.getenv("SLOW_LOG_PATH", "slow_requests.log")
+
+# Принимаем только «безопасные» входящие id, чтобы не тащить мусор в логи
+_VALID_REQUEST_ID = re.compile(r"^[A-Za-z0-9._\-]{1,128}$")
+
+# Соответствие операций FreeCADCore фазам Server-Timing
+_OPERATION_PHASES = {
+    "recompute": "recompute",
+    "save": "save",
+    "saveAs": "save",
+}
+
+request_id_var: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+_timings_var: ContextVar[Optional[Dict]] = ContextVar("server_timings", default=None)
+
+
+def get_request_id() -> Optional[str]:
+    """Текущий request id (None вне обработки запроса)."""
+    return request_id_var.get()
+
+
+def ensure_request_id() -> str:
+    """Вернуть текущий request id или назначить новый."""
+    request_id = request_id_var.get()
+    if request_id is None:
+        request_id = uuid.uuid4().hex
+        request_id_var.set(request_id)
+    return request_id
+
+
+def _record_operation(operation: str, start: float, duration: float):
+    """Подписчик metrics.time_operation: раскладывает время по фазам запроса."""
+    timings = _timings_var.get()
+    if timings is None:
+        return
+    if timings["first_operation"] is None:
+        timings["first_operation"] = start
+    phase = _OPERATION_PHASES.get(operation, "freecad")
+    timings["phases"][phase] += duration
+
+
+add_operation_listener(_record_operation)
+
+
+def _get_slow_logger() -> logging.Logger:
+    slow_logger = logging.getLogger("cad.slowlog")
+    if not slow_logger.handlers:
+        handler = logging.FileHandler(SLOW_LOG_PATH, encoding="utf-8")
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        slow_logger.addHandler(handler)
+        slow_logger.setLevel(logging.INFO)
+        slow_logger.propagate = False
+    return slow_logger
+
+
+def _server_timing(phases: Dict[str, float]) -> str:
+    return ", ".join(f"{name};dur={value * 1000:.2f}" for name, value in phases.items())
+
+
+class RequestContextMiddleware:
+    """
+    Назначает request id, считает фазы Server-Timing и пишет slow-log.
+
+    Middleware «чистый» ASGI (не BaseHTTPMiddleware), поэтому contextvars,
+    выставленные здесь, видны в обработчике FastAPI и в ядре FreeCAD.
+    """
+
+    def __init__(self, app, slow_request_ms: float = SLOW_REQUEST_MS):
+        self.app = app
+        self.slow_request_ms = slow_request_ms
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        incoming = None
+        for name, value in scope.get("headers", []):
+            if name == b"x-request-id":
+                incoming = value.decode("latin-1")
+                break
+        request_id = incoming if incoming and _VALID_REQUEST_ID.match(incoming) else uuid.uuid4().hex
+
+        start = time.perf_counter()
+        timings = {
+            "first_operation": None,
+            "phases": {"freecad": 0.0, "recompute": 0.0, "save": 0.0},
+        }
+        request_token = request_id_var.set(request_id)
+        timings_token = _timings_var.set(timings)
+        status_holder = {"status": 500}
+
+        def _phases(now: float) -> Dict[str, float]:
+            first = timings["first_operation"]
+            validation = (first if first is not None else now) - start
+            return {
+                "validation": validation,
+                **timings["phases"],
+                "total": now - start,
+            }
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status_holder["status"] = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((REQUEST_ID_HEADER.lower().encode(), request_id.encode()))
+                headers.append((b"server-timing", _server_timing(_phases(time.perf_counter())).encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            phases = _phases(time.perf_counter())
+            request_id_var.reset(request_token)
+            _timings_var.reset(timings_token)
+            total_ms = phases["total"] * 1000
+            if total_ms >= self.slow_request_ms:
+                route = scope.get("route")
+                _get_slow_logger().info(json.dumps({
+                    "ts": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                    "request_id": request_id,
+                    "method": scope.get("method"),
+                    "path": scope.get("path"),
+                    "route": getattr(route, "path", None),
+                    "query": scope.get("query_string", b"").decode("latin-1"),
+                    "status": status_holder["status"],
+                    "total_ms": round(total_ms, 2),
+                    "phases_ms": {name: round(value * 1000, 2) for name, value in phases.items() if name != "total"},
+                }, ensure_ascii=False))
+
+
+async def inject_request_id(request):
+    """
+    httpx event hook: добавляет X-Request-ID в исходящий запрос.
+
+    Используется клиентом MCP инструментов, чтобы запрос к FastAPI
+    логировался под тем же id, что и вызов инструмента.
+    """
+    if REQUEST_ID_HEADER not in request.headers:
+        request.headers[REQUEST_ID_HEADER] = ensure_request_id()
+
+
+def request_id_tool_middleware():
+    """
+    FastMCP middleware: один request id на вызов инструмента.
+
+    Все HTTP запросы, которые делает инструмент (например create_test_shape
+    делает четыре), получают одинаковый X-Request-ID.
+    """
+    from fastmcp.server.middleware import Middleware
+
+    class RequestIdToolMiddleware(Middleware):
+        async def on_call_tool(self, context, call_next):
+            token = request_id_var.set(uuid.uuid4().hex)
+            try:
+                return await call_next(context)
+            finally:
+                request_id_var.reset(token)
+
+    return RequestIdToolMiddleware()
+
+
+# ============ ПРОФИЛИРОВАНИЕ ПО ЗАПРОСУ ============
+
+PROFILING_TOKEN = os.getenv("PROFILING_TOKEN")
+PROFILES_DIR = os.getenv("PROFILES_DIR", "profiles")
+
+PROFILE_TOKEN_HEADER = "X-Profile-Token"
+
+_profile_lock = threading.Lock()
+
+
+def verify_profiling_token(token: Optional[str]) -> bool:
+    """Проверить токен доступа к профилированию (выключено, если PROFILING_TOKEN не задан)."""
+    if not PROFILING_TOKEN or not token:
+        return False
+    return hmac.compare_digest(token.encode(), PROFILING_TOKEN.encode())
+
+
+def list_profiles() -> List[Dict]:
+    """Список сохраненных профилей, новые первыми."""
+    if not os.path.isdir(PROFILES_DIR):
+        return []
+    profiles = []
+    for name in os.listdir(PROFILES_DIR):
+        path = os.path.join(PROFILES_DIR, name)
+        if not name.endswith(".pstats") or not os.path.isfile(path):
+            continue
+        stat = os.stat(path)
+        profiles.append({
+            "name": name,
+            "size": stat.st_size,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(stat.st_mtime)),
+            "summary": name[:-len(".pstats")] + ".txt",
+        })
+    profiles.sort(key=lambda p: p["created"], reverse=True)
+    return profiles
+
+
+def get_profile_path(name: str) -> Optional[str]:
+    """Путь к файлу профиля или None (защита от выхода за пределы PROFILES_DIR)."""
+    if os.path.basename(name) != name or not name.endswith((".pstats", ".txt")):
+        return None
+    path = os.path.join(PROFILES_DIR, name)
+    return path if os.path.isfile(path) else None
+
+
+def _wants_profile(scope) -> Optional[str]:
+    """Вернуть токен, если запрос просит профилирование (заголовок X-Profile или ?profile=1)."""
+    query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+    requested = "1" in query.get("profile", [])
+    token = None
+    for name, value in scope.get("headers", []):
+        if name == b"x-profile" and value in (b"1", b"true"):
+            requested = True
+        elif name == b"x-profile-token":
+            token = value.decode("latin-1")
+    return token if requested else None
+
+
+class ProfilingMiddleware:
+    """
+    Прогоняет отдельный запрос под cProfile по заголовку X-Profile: 1
+    (или параметру ?profile=1) с корректным X-Profile-Token.
+
+    Если PROFILING_TOKEN не задан, middleware сразу передает запрос дальше.
+    Профиль (pstats + текстовая сводка) сохраняется в PROFILES_DIR, имя
+    файла возвращается в заголовке X-Profile-File.
+
+    cProfile профилирует поток целиком, поэтому в профиль попадут и
+    конкурентные корутины того же event loop. Одновременно профилируется
+    не больше одного запроса; остальные выполняются как обычно.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if PROFILING_TOKEN is None or scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        token = _wants_profile(scope)
+        if token is None or not verify_profiling_token(token) or not _profile_lock.acquire(blocking=False):
+            await self.app(scope, receive, send)
+            return
+
+        request_id = get_request_id() or uuid.uuid4().hex
+        slug = re.sub(r"[^A-Za-z0-9]+", "_", scope.get("path", "")).strip("_") or "root"
+        base_name = f"{time.strftime('%Y%m%d-%H%M%S')}_{slug}_{request_id[:12]}"
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"x-profile-file", f"{base_name}.pstats".encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                profiler.disable()
+            # Запись pstats и сводки — в потоке, чтобы не держать event loop
+            await asyncio.to_thread(_save_profile, profiler, base_name)
+        finally:
+            _profile_lock.release()
+
+
+def _save_profile(profiler: "cProfile.Profile", base_name: str):
+    os.makedirs(PROFILES_DIR, exist_ok=True)
+    profiler.dump_stats(os.path.join(PROFILES_DIR, f"{base_name}.pstats"))
+    summary = io.StringIO()
+    pstats.Stats(profiler, stream=summary).sort_stats("cumulative").print_stats(40)
+    with open(os.path.join(PROFILES_DIR, f"{base_name}.txt"), "w", encoding="utf-8") as f:
+        f.write(summary.getvalue())
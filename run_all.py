@@ -41,7 +41,7 @@ if __name__ == "__main__":
     # Выводим информацию о запуске
     print("\n✅ Система запущена:")
     print("1. FastAPI сервер: http://localhost:8001")
-    print("2. MCP сервер: порт 8000")
+    print("2. MCP сервер: http://localhost:8001/mcp")
     print("3. Swagger UI: http://localhost:8001/docs")
     print("4. Agent API: POST http://localhost:8001/api/agent/query")
     print("\nВыберите опцию:")
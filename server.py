@@ -4,7 +4,7 @@ from tools import (
     tool_create_cube, tool_create_cylinder, tool_create_shapes,
     tool_create_sphere, tool_documents, tool_status, tool_open_document,
     tool_save_document, tool_close_document, tool_create_complex_shape,
-    tool_test_shape
+    tool_test_shape, tool_run_cad_script
 )
 
 if __name__ == "__main__":
@@ -0,0 +1,210 @@
+"""
+Общие фикстуры бенчмарков CAD gateway.
+
+Если FreeCAD не установлен, подключается заглушка helpers/fake_freecad.py,
+так что бенчмарки измеряют накладные расходы самого gateway.
+
+Результаты всех бенчмарков сессии сохраняются в JSON:
+    BENCH_RESULTS_DIR  — папка для результатов (по умолчанию test/bench_results)
+    BENCH_BASELINE     — JSON прошлого прогона; тест падает, если медиана
+                         операции выросла больше чем в BENCH_TOLERANCE раз
+    BENCH_TOLERANCE    — допустимый рост медианы (по умолчанию 1.5)
+    BENCH_ITERATIONS   — число замеров на операцию (по умолчанию 30)
+"""
+
+import asyncio
+import json
+import os
+import platform
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+# Трассировку в бенчмарках не пишем, чтобы не мерить запись файла спанов
+os.environ.setdefault("TRACING_ENABLED", "0")
+
+from helpers import fake_freecad  # noqa: E402
+
+USING_STAND_IN = fake_freecad.install()
+
+BENCH_ITERATIONS = int(os.getenv("BENCH_ITERATIONS", "30"))
+BENCH_WARMUP = int(os.getenv("BENCH_WARMUP", "3"))
+# Пути из окружения — относительно папки запуска, до перехода во временную
+BENCH_RESULTS_DIR = os.path.abspath(os.getenv("BENCH_RESULTS_DIR", os.path.join(ROOT, "test", "bench_results")))
+BENCH_BASELINE = os.getenv("BENCH_BASELINE") and os.path.abspath(os.getenv("BENCH_BASELINE"))
+BENCH_TOLERANCE = float(os.getenv("BENCH_TOLERANCE", "1.5"))
+
+_results = {}
+
+
+def _percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(q * (len(sorted_values) - 1)))))
+    return sorted_values[index]
+
+
+def summarize(latencies):
+    """Сводка по списку длительностей (в секундах) -> миллисекунды и ops/s."""
+    values = sorted(latencies)
+    total = sum(values)
+    return {
+        "iterations": len(values),
+        "mean_ms": round(statistics.mean(values) * 1000, 4),
+        "p50_ms": round(_percentile(values, 0.50) * 1000, 4),
+        "p95_ms": round(_percentile(values, 0.95) * 1000, 4),
+        "p99_ms": round(_percentile(values, 0.99) * 1000, 4),
+        "min_ms": round(values[0] * 1000, 4),
+        "max_ms": round(values[-1] * 1000, 4),
+        "throughput_ops": round(len(values) / total, 2) if total else None,
+    }
+
+
+def _load_baseline():
+    if not BENCH_BASELINE or not os.path.exists(BENCH_BASELINE):
+        return {}
+    with open(BENCH_BASELINE, encoding="utf-8") as f:
+        return json.load(f).get("results", {})
+
+
+class Bench:
+    """Запуск и учет бенчмарков внутри теста."""
+
+    def __init__(self, baseline):
+        self.baseline = baseline
+
+    def run(self, name, func, iterations=None, warmup=None, setup=None):
+        """
+        Замерить асинхронную операцию func() iterations раз.
+
+        setup() (синхронный или асинхронный) вызывается перед каждым замером
+        и в замер не попадает.
+        """
+        iterations = iterations or BENCH_ITERATIONS
+        warmup = BENCH_WARMUP if warmup is None else warmup
+
+        async def _measure():
+            latencies = []
+            for i in range(warmup + iterations):
+                if setup is not None:
+                    prepared = setup()
+                    if asyncio.iscoroutine(prepared):
+                        await prepared
+                start = time.perf_counter()
+                await func()
+                elapsed = time.perf_counter() - start
+                if i >= warmup:
+                    latencies.append(elapsed)
+            return latencies
+
+        summary = summarize(asyncio.run(_measure()))
+        _results[name] = summary
+        self._check_regression(name, summary)
+        return summary
+
+    def record(self, name, latencies):
+        """Сохранить уже измеренные длительности (когда замер идет вне run)."""
+        summary = summarize(latencies)
+        _results[name] = summary
+        self._check_regression(name, summary)
+        return summary
+
+    def _check_regression(self, name, summary):
+        previous = self.baseline.get(name)
+        if not previous:
+            return
+        limit = previous["p50_ms"] * BENCH_TOLERANCE
+        assert summary["p50_ms"] <= limit, (
+            f"Регрессия {name}: p50 {summary['p50_ms']} мс > {limit:.4f} мс "
+            f"(база {previous['p50_ms']} мс x {BENCH_TOLERANCE})"
+        )
+
+
+@pytest.fixture(scope="session")
+def bench():
+    return Bench(_load_baseline())
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """Рабочая папка для .FCStd файлов бенчмарка."""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture(scope="session")
+def live_server():
+    """Поднять main.app на свободном порту (настоящий HTTP через сокет)."""
+    import uvicorn
+    import main
+
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    deadline = time.time() + 10
+    while not server.started:
+        if time.time() > deadline:
+            raise RuntimeError("Сервер бенчмарка не запустился за 10 секунд")
+        time.sleep(0.05)
+    yield f"http://127.0.0.1:{port}"
+    server.should_exit = True
+    thread.join(timeout=5)
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT, capture_output=True, text=True, timeout=10
+        ).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def pytest_configure(config):
+    # Тесты и импортируемые модули пишут файлы относительно текущей папки
+    # (agent.log, *.FCStd, базы SQLite) — вся сессия идет во временной папке
+    config.session_dir = tempfile.mkdtemp(prefix="cad-tests-")
+    os.chdir(config.session_dir)
+
+
+def pytest_sessionfinish(session, exitstatus):
+    os.chdir(ROOT)
+    shutil.rmtree(session.config.session_dir, ignore_errors=True)
+    if not _results:
+        return
+    commit = _git_commit()
+    report = {
+        "meta": {
+            "commit": commit,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "freecad": "stand-in" if USING_STAND_IN else "real",
+            "iterations": BENCH_ITERATIONS,
+        },
+        "results": dict(sorted(_results.items())),
+    }
+    os.makedirs(BENCH_RESULTS_DIR, exist_ok=True)
+    path = os.path.join(BENCH_RESULTS_DIR, f"bench_{time.strftime('%Y%m%d-%H%M%S')}_{commit or 'nogit'}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n📊 Результаты бенчмарков: {path}")
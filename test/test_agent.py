@@ -0,0 +1,174 @@
+"""
+Бенчмарки AI агента с локальной заглушкой LLM (helpers/fake_llm_server.py).
+
+Заглушка отвечает без задержки, поэтому замер показывает собственные
+накладные расходы агента: промпт, разбор tool calls, исполнитель,
+инструменты, память сессии — без времени модели и сети до облака.
+"""
+
+import asyncio
+import socket
+import time
+
+import httpx
+
+import pytest
+
+from helpers.fake_llm_server import FakeLLM, start_fake_llm
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture(scope="module")
+def fake_llm_url():
+    return start_fake_llm(_free_port(), FakeLLM(latency_ms=0, tokens_per_sec=0))
+
+
+@pytest.fixture
+def agent(workdir, fake_llm_url, monkeypatch):
+    monkeypatch.setenv("API_KEY", "dummy")
+    import ai_agent.agent as agent_module
+
+    monkeypatch.setattr(agent_module, "LLM_BASE_URL", fake_llm_url)
+    # Меряем путь через модель: без быстрого пути и кэша планов
+    monkeypatch.setattr(agent_module, "FAST_PATH_ENABLED", False)
+    monkeypatch.setattr(agent_module, "PLAN_CACHE_ENABLED", False)
+    return agent_module.FullCADAgent()
+
+
+def test_agent_query_overhead(bench, agent, live_server):
+    async def query():
+        result = await agent.aprocess("Создай куб 20мм", session_id="bench")
+        assert result["success"] and "Деталь сохранена" in result["response"], result
+
+    bench.run("agent.query.make_part.fake_llm", query, iterations=10)
+
+
+def test_agent_prompt_size(agent, live_server):
+    from ai_agent.agent import SYSTEM_PROMPT
+    from ai_agent.tool_schemas import prompt_size
+
+    result = asyncio.run(agent.aprocess("Создай куб 20мм", session_id="prompt", include_usage=True))
+    usage = result["usage"]
+    full = prompt_size(SYSTEM_PROMPT, agent.tools, [], "Создай куб 20мм")
+    # Модели передан только make_part, промпт заметно меньше, чем со всеми инструментами
+    assert usage["tools"] == ["make_part"], usage
+    assert usage["prompt"]["tools"] < full["tools"] / 2, (usage["prompt"], full)
+
+
+def test_agent_prefetch_while_llm_thinks(workdir, live_server, monkeypatch):
+    import cad_service
+    import ai_agent.agent as agent_module
+    from common_logic import core
+
+    # Модель "думает" 100 мс — за это время CAD должен успеть прогреться
+    monkeypatch.setenv("API_KEY", "dummy")
+    monkeypatch.setattr(agent_module, "LLM_BASE_URL", start_fake_llm(_free_port(), FakeLLM(latency_ms=100, tokens_per_sec=0)))
+    monkeypatch.setattr(agent_module, "FAST_PATH_ENABLED", False)
+    monkeypatch.setattr(agent_module, "PLAN_CACHE_ENABLED", False)
+    # Холодный CAD: FreeCAD не подключен, ядро не прогрето
+    monkeypatch.setattr(core, "freecad", None)
+    monkeypatch.setattr(cad_service, "_primitives_warm", False)
+
+    agent = agent_module.FullCADAgent()
+    result = asyncio.run(agent.aprocess("Создай куб 20мм, файл warm.FCStd", session_id="prefetch", include_usage=True))
+    assert result["success"], result
+    assert result["usage"]["prefetch"] == "completed", result["usage"]
+    assert core.freecad is not None and cad_service._primitives_warm
+
+
+def test_agent_prefetch_cancelled_without_cad_tool(workdir, live_server, monkeypatch):
+    import threading
+
+    import cad_service
+    import ai_agent.agent as agent_module
+
+    # Модель отвечает текстом, пока прогрев еще держит блокировку записи
+    monkeypatch.setenv("API_KEY", "dummy")
+    monkeypatch.setattr(agent_module, "LLM_BASE_URL", start_fake_llm(_free_port(), FakeLLM(latency_ms=200, tokens_per_sec=0)))
+    monkeypatch.setattr(agent_module, "FAST_PATH_ENABLED", False)
+    monkeypatch.setattr(agent_module, "PLAN_CACHE_ENABLED", False)
+    started, release = threading.Event(), threading.Event()
+
+    def slow_warm():
+        started.set()
+        release.wait(10)
+
+    monkeypatch.setattr(cad_service, "_warm_core", slow_warm)
+
+    agent = agent_module.FullCADAgent()
+    try:
+        result = asyncio.run(agent.aprocess("Привет, что ты умеешь?", session_id="no-cad", include_usage=True))
+        assert result["success"], result
+        assert result["usage"]["tool_calls"] == 0, result["usage"]
+        assert result["usage"]["prefetch"] == "cancelled", result["usage"]
+        # Поток ядра не прервать: пока он идет, блокировка еще занята
+        assert started.is_set()
+        assert any(lock.locked() for lock in list(cad_service._write_locks.values()))
+    finally:
+        release.set()
+
+    # Отмененный прогрев отпускает блокировку, как только поток ядра закончил
+    deadline = time.monotonic() + 5
+    while any(lock.locked() for lock in list(cad_service._write_locks.values())):
+        assert time.monotonic() < deadline, "прогрев не отпустил блокировку записи"
+        time.sleep(0.01)
+
+
+def test_fast_path_tool_time_in_usage(agent, live_server, monkeypatch):
+    import ai_agent.agent as agent_module
+
+    monkeypatch.setattr(agent_module, "FAST_PATH_ENABLED", True)
+    result = asyncio.run(agent.aprocess("Создай куб 20мм, файл fast.FCStd", session_id="fast", include_usage=True))
+    usage = result["usage"]
+    # Быстрый путь идет мимо callbacks, но его вызов учитывается
+    assert usage["route"] == "fast_path" and usage["llm_calls"] == 0, usage
+    assert (usage["tool_calls"], usage["tool_errors"]) == (1, 0), usage
+    assert 0 < usage["tool_seconds"] <= usage["total_seconds"], usage
+
+
+def test_agent_creation_does_not_block_gateway(workdir, live_server, monkeypatch):
+    import ai_agent.agent as agent_module
+
+    monkeypatch.setenv("API_KEY", "dummy")
+    monkeypatch.setattr(agent_module, "_agent_instance", None)
+
+    async def check():
+        async with httpx.AsyncClient(base_url=live_server, timeout=10.0) as client:
+            # Блокировку держит "фоновый прогрев" — агент еще создается
+            with agent_module._agent_lock:
+                status = asyncio.create_task(client.get("/api/agent/status"))
+                await asyncio.sleep(0.1)
+                started = time.perf_counter()
+                response = await client.get("/api/mcp/status")
+                assert response.status_code == 200
+                assert time.perf_counter() - started < 1.0
+                assert not status.done()
+            assert (await status).status_code == 200
+
+    asyncio.run(check())
+
+
+def test_agent_batch(bench, workdir, live_server, monkeypatch):
+    import ai_agent.agent as agent_module
+    from ai_agent.batch import run_batch
+
+    # Своя заглушка: клиент модели привязан к event loop, в котором создан
+    monkeypatch.setenv("API_KEY", "dummy")
+    monkeypatch.setattr(agent_module, "LLM_BASE_URL", start_fake_llm(_free_port(), FakeLLM(latency_ms=50, tokens_per_sec=0)))
+    monkeypatch.setattr(agent_module, "FAST_PATH_ENABLED", False)
+    monkeypatch.setattr(agent_module, "PLAN_CACHE_ENABLED", False)
+    agent = agent_module.FullCADAgent()
+    prompts = [f"Создай куб {size}мм" for size in (10, 20, 30, 40, 50, 60, 70, 80)]
+
+    async def batch():
+        events = [event async for event in run_batch(agent, prompts, concurrency=4)]
+        summary = events[-1]["data"]
+        assert events[-1]["event"] == "summary" and summary["succeeded"] == len(prompts), summary
+        assert sorted(event["data"]["index"] for event in events[:-1]) == list(range(len(prompts)))
+
+    bench.run("agent.batch.8_parts.fake_llm_50ms", batch, iterations=3, warmup=1)
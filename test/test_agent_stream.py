@@ -0,0 +1,79 @@
+"""
+Стриминг /api/agent/query: порядок событий SSE и отмена при отключении клиента.
+"""
+
+import asyncio
+import json
+
+import httpx
+from fastapi import FastAPI
+
+from ai_agent import agent_router
+from ai_agent.agent_router import AgentQuery
+
+
+class ScriptedAgent:
+    """Агент без модели: отдает события и ответ по сценарию."""
+
+    def __init__(self, hold=None):
+        self.hold = hold
+        self.cancelled = False
+
+    async def aprocess(self, query, session_id, on_event=None, include_usage=None):
+        on_event("queued", {"position": 1})
+        on_event("tool_start", {"tool": "make_part", "input": {"shape_type": "cube"}})
+        if self.hold is not None:
+            try:
+                await self.hold.wait()
+            except asyncio.CancelledError:
+                self.cancelled = True
+                raise
+        on_event("tool_end", {"tool": "make_part", "output": "ok"})
+        on_event("token", {"text": "Готово"})
+        return {"success": True, "response": "Готово", "session_id": session_id}
+
+
+def parse_sse(text):
+    events = []
+    for block in text.replace("\r\n", "\n").split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines() if ": " in line)
+        if "event" in fields:
+            events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+
+def test_stream_events_in_order(monkeypatch):
+    agent = ScriptedAgent()
+
+    async def get_agent():
+        return agent
+
+    monkeypatch.setattr(agent_router, "_get_agent", get_agent)
+    app = FastAPI()
+    app.include_router(agent_router.router)
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            return await client.post("/api/agent/query", json={"query": "куб", "session_id": "s", "stream": True})
+
+    response = asyncio.run(run())
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = parse_sse(response.text)
+    assert [name for name, _ in events] == ["start", "queued", "tool_start", "tool_end", "token", "done"]
+    assert events[0][1] == {"query": "куб", "session_id": "s"}
+    assert events[-1][1]["response"] == "Готово"
+
+
+def test_disconnect_cancels_agent_query():
+    async def run():
+        agent = ScriptedAgent(hold=asyncio.Event())
+        stream = agent_router._stream(agent, AgentQuery(query="куб", session_id="s"))
+        names = [(await stream.__anext__())["event"] for _ in range(3)]
+        # Клиент отключился посреди вызова инструмента — генератор закрывается
+        await stream.aclose()
+        await asyncio.sleep(0)
+        return names, agent.cancelled
+
+    names, cancelled = asyncio.run(run())
+    assert names == ["start", "queued", "tool_start"]
+    assert cancelled
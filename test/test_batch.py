@@ -0,0 +1,44 @@
+"""
+Пакетная обработка: досрочное закрытие пакета отменяет и дожидается обработчиков.
+"""
+
+import asyncio
+
+from ai_agent.batch import run_batch
+
+
+class SlowAgent:
+    """Агент, у которого каждый запрос, кроме первого, выполняется долго."""
+
+    def __init__(self):
+        self.cancelled = []
+        self.cleared = []
+        self.memory = self
+
+    async def aprocess(self, prompt, session_id, include_usage=False):
+        try:
+            await asyncio.sleep(0 if prompt == "fast" else 10)
+        except asyncio.CancelledError:
+            self.cancelled.append(session_id)
+            raise
+        return {"success": True, "response": prompt, "usage": {}}
+
+    async def aclear(self, session_id):
+        self.cleared.append(session_id)
+
+
+def test_closed_batch_awaits_cancelled_workers():
+    agent = SlowAgent()
+
+    async def run():
+        events = run_batch(agent, ["fast", "slow", "slow"], concurrency=3, batch_id="b")
+        first = await events.__anext__()
+        assert first["data"]["response"] == "fast"
+        await events.aclose()
+        # После закрытия генератора не осталось ни одной задачи обработчика
+        assert asyncio.all_tasks() == {asyncio.current_task()}
+
+    asyncio.run(run())
+    assert sorted(agent.cancelled) == ["b-1", "b-2"]
+    # История отмененных запросов тоже очищена
+    assert sorted(agent.cleared) == ["b-0", "b-1", "b-2"]
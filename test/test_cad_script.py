@@ -0,0 +1,169 @@
+"""
+Поведение run_script: порядок шагов, входы булевых операций и откат.
+
+Содержимое .FCStd проверяется через формат заглушки FreeCAD (JSON со
+списком объектов), поэтому с настоящим FreeCAD тесты пропускаются.
+"""
+
+import asyncio
+import json
+import os
+
+import pytest
+
+from common_logic import core
+from conftest import USING_STAND_IN
+import cad_service
+
+pytestmark = pytest.mark.skipif(not USING_STAND_IN, reason="проверяет файлы заглушки FreeCAD")
+
+
+def run(operations):
+    return asyncio.run(cad_service.run_script(operations))
+
+
+def saved_objects(path):
+    with open(path, encoding="utf-8") as f:
+        return [o["name"] for o in json.load(f)["objects"]]
+
+
+@pytest.fixture(autouse=True)
+def no_open_document(workdir):
+    yield
+    if core.current_doc is not None:
+        asyncio.run(core.close_document())
+
+
+def test_steps_run_in_given_order(workdir):
+    result = run([
+        {"op": "open", "file_path": "part.FCStd"},
+        {"op": "create", "shape_type": "cube", "size": 10.0, "name": "a"},
+        {"op": "save"},
+        {"op": "export", "file_path": "a.step"},
+        {"op": "create", "shape_type": "cube", "size": 2.0, "name": "b"},
+        {"op": "save", "file_path": "part_ab.FCStd"},
+        {"op": "export", "file_path": "ab.step"},
+        {"op": "close"},
+    ])
+    assert result["success"], result["result"]
+    a, b = result["steps"][1]["object"], result["steps"][4]["object"]
+    # Каждая запись — состояние модели на своем шаге
+    assert saved_objects("part.FCStd") == [a]
+    assert saved_objects("part_ab.FCStd") == [a, b]
+    assert "volume=1000.0" in open("a.step").read()
+    assert "volume=1008.0" in open("ab.step").read()
+
+
+def test_boolean_inputs_kept_while_referenced(workdir):
+    result = run([
+        {"op": "open", "file_path": "part.FCStd"},
+        {"op": "create", "shape_type": "cube", "size": 10.0, "name": "base"},
+        {"op": "create", "shape_type": "cube", "size": 2.0, "name": "hole"},
+        {"op": "boolean", "operation": "cut", "base": "base", "tool": "hole", "name": "result"},
+        {"op": "save"},
+        {"op": "export", "file_path": "hole.stl", "objects": ["hole"]},
+        {"op": "save", "file_path": "final.FCStd"},
+    ])
+    assert result["success"], result["result"]
+    hole = result["steps"][2]["object"]
+    # base больше не нужен к первой записи, hole — нужен экспорту
+    assert saved_objects("part.FCStd") == [hole, "result"]
+    assert saved_objects("final.FCStd") == ["result"]
+    assert [o.Name for o in core.current_doc.Objects] == ["result"]
+
+
+def test_rollback_removes_new_file(workdir):
+    result = run([
+        {"op": "open", "file_path": "part.FCStd"},
+        {"op": "create", "shape_type": "cube", "size": 10.0},
+        {"op": "create", "shape_type": "pyramid", "size": 10.0},
+        {"op": "save"},
+    ])
+    assert not result["success"] and result["rolled_back"]
+    assert [s["status"] for s in result["steps"]] == ["ok", "ok", "error", "skipped"]
+    assert core.current_doc is None
+    assert not os.path.exists("part.FCStd")
+
+
+def test_rollback_restores_existing_document(workdir):
+    asyncio.run(core.open_document("existing.FCStd"))
+    asyncio.run(core.create_simple_shape("cube", 10.0))
+    base = core.current_doc.Objects[0].Name
+    result = run([
+        {"op": "create", "shape_type": "cube", "size": 2.0, "name": "hole"},
+        {"op": "boolean", "operation": "cut", "base": base, "tool": "hole"},
+        {"op": "export", "file_path": "part.obj"},
+    ])
+    assert not result["success"] and result["rolled_back"]
+    # Входы удалены перед export, но откат возвращает документ к исходному
+    assert [o.Name for o in core.current_doc.Objects] == [base]
+    assert os.path.exists("existing.FCStd")
+
+
+def test_no_rollback_after_write(workdir):
+    result = run([
+        {"op": "open", "file_path": "part.FCStd"},
+        {"op": "create", "shape_type": "cube", "size": 10.0},
+        {"op": "save"},
+        {"op": "create", "shape_type": "pyramid", "size": 10.0},
+    ])
+    assert not result["success"] and not result["rolled_back"]
+    assert saved_objects("part.FCStd") == [result["steps"][1]["object"]]
+
+
+# Допустимое значение каждого параметра из реестра фигур
+SHAPE_PARAM_VALUES = {
+    "size": 10.0, "x": 1.0, "y": 2.0, "z": 3.0,
+    "num_points": 5, "inner_radius": 4.0, "outer_radius": 10.0, "height": 5.0,
+    "teeth": 20, "module": 2.0, "major_radius": 10.0, "minor_radius": 2.0,
+}
+
+
+@pytest.mark.parametrize("shape_type", list(cad_service.SHAPES))
+def test_every_registered_shape_builds_from_its_params(workdir, shape_type):
+    # Только параметры, которые реестр (и схемы агента) объявляют для фигуры
+    params = {name: SHAPE_PARAM_VALUES[name] for name in cad_service.SHAPES[shape_type]}
+    result = run([
+        {"op": "open", "file_path": "part.FCStd"},
+        {"op": "create", "shape_type": shape_type, **params},
+        {"op": "save"},
+        {"op": "close"},
+    ])
+    assert result["success"], result["result"]
+    assert saved_objects("part.FCStd") == [result["steps"][1]["object"]]
+
+
+def test_numeric_strings_coerced(workdir):
+    # Так аргументы приходят от модели; по HTTP их привел бы FastAPI
+    result = run([
+        {"op": "open", "file_path": "part.FCStd"},
+        {"op": "create", "shape_type": "cube", "size": "10", "x": "1.5"},
+        {"op": "create", "shape_type": "gear", "teeth": "20.0", "module": "2", "outer_radius": "10", "height": 5},
+        {"op": "close"},
+    ])
+    assert result["success"], result["result"]
+    assert "10.0" in result["steps"][1]["result"] and "20 зубьями" in result["steps"][2]["result"]
+
+
+@pytest.mark.parametrize("param, value", [("size", "big"), ("size", [10]), ("teeth", 2.5), ("x", "nan")])
+def test_bad_numeric_params_rejected(workdir, param, value):
+    step = {"op": "create", "shape_type": "gear" if param == "teeth" else "cube", param: value}
+    with pytest.raises(cad_service.CADServiceError) as error:
+        run([{"op": "open", "file_path": "part.FCStd"}, step])
+    assert error.value.status_code == 400 and f"параметр {param}" in error.value.detail
+    assert not os.path.exists("part.FCStd")
+
+
+def test_rollback_reopens_document_replaced_by_open(workdir):
+    asyncio.run(core.open_document("existing.FCStd"))
+    asyncio.run(core.create_simple_shape("cube", 10.0))
+    asyncio.run(core.save_document())
+    saved = [o.Name for o in core.current_doc.Objects]
+    result = run([
+        {"op": "open", "file_path": "part.FCStd"},
+        {"op": "create", "shape_type": "pyramid", "size": 10.0},
+    ])
+    assert not result["success"] and result["rolled_back"]
+    # Документ, закрытый шагом open, снова текущий — в сохраненном состоянии
+    assert core.current_doc is not None and core.current_doc.FileName == "existing.FCStd"
+    assert [o.Name for o in core.current_doc.Objects] == saved
@@ -0,0 +1,128 @@
+"""
+ParallelAgentExecutor: независимые инструменты хода выполняются одновременно,
+зависимые — по очереди в порядке вызова моделью.
+
+Исполнитель переопределяет внутренние методы AgentExecutor, поэтому тесты
+запускают его целиком с агентом-сценарием вместо модели.
+"""
+
+import asyncio
+import time
+from typing import Any, List
+
+import pytest
+from langchain_classic.agents import BaseMultiActionAgent
+from langchain_core.agents import AgentAction, AgentFinish
+from langchain_core.tools import StructuredTool
+
+from ai_agent.executor import ParallelAgentExecutor
+
+SEQUENTIAL = {"open_document", "create_shape", "save_document", "close_document"}
+
+
+class ScriptedAgent(BaseMultiActionAgent):
+    """Первый ход — заданные вызовы инструментов, второй — ответ."""
+
+    calls: List[str]
+
+    @property
+    def input_keys(self):
+        return ["input"]
+
+    def plan(self, intermediate_steps, callbacks=None, **kwargs):
+        raise NotImplementedError
+
+    async def aplan(self, intermediate_steps, callbacks=None, **kwargs) -> Any:
+        if intermediate_steps:
+            return AgentFinish({"output": "готово"}, "")
+        return [AgentAction(name, {}, "") for name in self.calls]
+
+
+@pytest.fixture
+def run_turn():
+    log = []
+
+    def make_tool(name, fail=False):
+        async def call() -> str:
+            log.append((name, "start", time.perf_counter()))
+            await asyncio.sleep(0.05)
+            log.append((name, "end", time.perf_counter()))
+            if fail:
+                raise RuntimeError(f"{name} упал")
+            return name
+
+        return StructuredTool.from_function(coroutine=call, name=name, description=name)
+
+    def run(calls, failing=()):
+        names = dict.fromkeys(calls)
+        executor = ParallelAgentExecutor(
+            agent=ScriptedAgent(calls=calls),
+            tools=[make_tool(name, name in failing) for name in names],
+            sequential_tools=SEQUENTIAL,
+            document_tools={"make_part"},
+        )
+
+        async def go():
+            try:
+                return await executor.ainvoke({"input": "запрос"})
+            finally:
+                # Дать досчитаться вызовам, которые ждали упавший
+                await asyncio.sleep(0.3)
+
+        return asyncio.run(go())
+
+    def spans():
+        result = {}
+        for name, event, at in log:
+            result.setdefault(name, {})[event] = at
+        return result
+
+    run.log = log
+    run.spans = spans
+    return run
+
+
+def overlap(a, b):
+    return a["start"] < b["end"] and b["start"] < a["end"]
+
+
+def test_independent_tools_overlap(run_turn):
+    run_turn(["make_part", "get_documents", "get_health"])
+    spans = run_turn.spans()
+    assert overlap(spans["make_part"], spans["get_documents"])
+    assert overlap(spans["get_documents"], spans["get_health"])
+
+
+def test_make_part_calls_overlap_without_session_chain(run_turn):
+    run_turn(["make_part", "make_part"])
+    starts = [at for name, event, at in run_turn.log if event == "start"]
+    ends = [at for name, event, at in run_turn.log if event == "end"]
+    assert max(starts) < min(ends)
+
+
+def test_session_chain_keeps_order(run_turn):
+    calls = ["open_document", "create_shape", "save_document", "close_document"]
+    run_turn(calls + ["get_documents"])
+    log = [(name, event) for name, event, _ in run_turn.log if name != "get_documents"]
+    assert log == [(name, event) for name in calls for event in ("start", "end")]
+    # Чтение состояния не ждет цепочку
+    spans = run_turn.spans()
+    assert overlap(spans["get_documents"], spans["open_document"])
+
+
+def test_make_part_joins_session_chain(run_turn):
+    run_turn(["open_document", "make_part", "create_shape", "close_document"])
+    order = [name for name, event, _ in run_turn.log if event == "start"]
+    spans = run_turn.spans()
+    # make_part не закрывает документ цепочки посередине: все по очереди
+    assert order == ["open_document", "make_part", "create_shape", "close_document"]
+    assert all(spans[a]["end"] <= spans[b]["start"] for a, b in zip(order, order[1:]))
+
+
+def test_order_kept_when_dependent_tool_raises(run_turn):
+    with pytest.raises(RuntimeError, match="create_shape упал"):
+        run_turn(["open_document", "create_shape", "save_document"], failing={"create_shape"})
+    spans = run_turn.spans()
+    # Следующий зависимый вызов не зависает и стартует только после упавшего
+    assert spans["save_document"]["start"] >= spans["create_shape"]["end"]
+    assert "end" in spans["save_document"]
@@ -0,0 +1,80 @@
+"""
+Грамматика быстрого пути агента: какие команды выполняются без LLM.
+
+Быстрый путь выполняет CAD команды без модели, поэтому неоднозначный
+запрос должен уходить в LLM (parse_command -> None), а не разбираться
+наугад.
+"""
+
+import pytest
+
+from ai_agent.fast_path import Intent, parse_command
+from ai_agent.plan_cache import is_contextual_query
+
+
+def shape(shape_type, size=10.0, x=0.0, y=0.0, z=0.0, file_name=None):
+    return Intent("create_shape", {
+        "shape_type": shape_type, "size": size, "x": x, "y": y, "z": z, "file_name": file_name,
+    })
+
+
+@pytest.mark.parametrize("query, intent", [
+    ("Создай куб 20мм", shape("cube", 20.0)),
+    ("создай куб", shape("cube")),
+    ("make a box 15 mm", shape("cube", 15.0)),
+    ("куб 2 см", shape("cube", 20.0)),
+    ("куб 2 дюйма", shape("cube", 50.8)),
+    ("куб 1 м", shape("cube", 1000.0)),
+    ("куб 5000", shape("cube", 5000.0)),
+    ('cube 2"', shape("cube", 50.8)),
+    ("сфера 15 в точке 10,0,0", shape("sphere", 15.0, 10.0)),
+    ("sphere 15 at point (1, 2, 3)", shape("sphere", 15.0, 1.0, 2.0, 3.0)),
+    ("цилиндр диаметром 2,5 см", shape("cylinder", 25.0)),
+    ("цилиндр радиусом 4", shape("cylinder", 8.0)),
+    ("куб 10 x=5 y: 3", shape("cube", 10.0, 5.0, 3.0)),
+    ("создай куб 10 в файл Part.FCStd", shape("cube", 10.0, file_name="Part.FCStd")),
+    ("покажи документы", Intent("get_documents", {})),
+    ("health check", Intent("get_health", {})),
+    ("статус mcp", Intent("get_mcp_status", {})),
+])
+def test_accepted(query, intent):
+    assert parse_command(query) == intent
+
+
+@pytest.mark.parametrize("query", [
+    # "in" — предлог, а не дюймы
+    "sphere 15 in point 10,0,0",
+    "box 5 in",
+    "куб 5in",
+    # Размеры N x M, а не координата
+    "создай куб 10 x 5",
+    "куб 10x5",
+    "куб 10 x 5 x 2",
+    # Несколько фигур, противоречия, лишние слова
+    "куб и сфера",
+    "куб x=1 x=2",
+    "цилиндр диаметром 4 радиусом 2",
+    "куб радиусом 5",
+    "куб 0",
+    "создай красивый куб",
+    "сделай шестеренку",
+    "",
+    # Перевод единиц дал слишком большой размер — скорее опечатка
+    "куб 5 м",
+    "sphere 2 meters",
+    "цилиндр диаметром 50 дюймов",
+])
+def test_rejected(query):
+    assert parse_command(query) is None
+
+
+@pytest.mark.parametrize("query", [
+    "make it a cube 10",
+    "сделай его кубом 10",
+    "create the same cube",
+    "еще куб 10",
+])
+def test_contextual_goes_to_llm(query):
+    # Тот же список слов, по которому кэш планов не кэширует запрос
+    assert is_contextual_query(query)
+    assert parse_command(query) is None
@@ -0,0 +1,182 @@
+"""
+Клиент MCP инструментов: повторы, circuit breaker и прямые вызовы сервисного слоя.
+"""
+
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from tools import http_client
+from tools.http_client import APIError, CircuitBreaker, CircuitOpenError
+
+
+@pytest.fixture
+def mock_api(monkeypatch):
+    """Ответы FastAPI по очереди из списка: статус или исключение транспорта."""
+    calls = []
+
+    def use(*outcomes):
+        outcomes = list(outcomes)
+
+        def handler(request):
+            calls.append(request)
+            outcome = outcomes.pop(0)
+            if isinstance(outcome, Exception):
+                raise outcome
+            return httpx.Response(outcome, json={"ok": outcome < 400})
+
+        client = httpx.AsyncClient(base_url="http://cad", transport=httpx.MockTransport(handler))
+        monkeypatch.setattr(http_client, "get_client", lambda: client)
+        return calls
+
+    monkeypatch.setattr(http_client, "breaker", CircuitBreaker(failure_threshold=5, reset_timeout=60))
+    monkeypatch.setattr(http_client, "HTTP_RETRIES", 2)
+    monkeypatch.setattr(http_client, "HTTP_RETRY_BACKOFF", 0.0)
+    return use
+
+
+def request(idempotent, method="GET"):
+    return asyncio.run(http_client.api_request(method, "/api/cad/documents", idempotent=idempotent))
+
+
+def test_idempotent_request_retried_on_503(mock_api):
+    calls = mock_api(503, 503, 200)
+    assert request(idempotent=True).status_code == 200
+    assert len(calls) == 3
+    assert http_client.breaker.failures == 0
+
+
+def test_retries_are_limited(mock_api):
+    calls = mock_api(503, 503, 503, 200)
+    assert request(idempotent=True).status_code == 503
+    assert len(calls) == 1 + http_client.HTTP_RETRIES
+
+
+def test_non_idempotent_request_not_retried(mock_api):
+    calls = mock_api(503, 200)
+    assert request(idempotent=False, method="POST").status_code == 503
+    assert len(calls) == 1
+
+
+def test_non_idempotent_request_retried_on_connect_error(mock_api):
+    # Запрос не дошел до сервера — повтор безопасен
+    calls = mock_api(httpx.ConnectError("refused"), 200)
+    assert request(idempotent=False, method="POST").status_code == 200
+    assert len(calls) == 2
+
+
+def test_non_idempotent_request_not_retried_on_read_timeout(mock_api):
+    calls = mock_api(httpx.ReadTimeout("slow"), 200)
+    with pytest.raises(httpx.ReadTimeout):
+        request(idempotent=False, method="POST")
+    assert len(calls) == 1
+
+
+def test_backoff_grows_with_full_jitter(monkeypatch):
+    monkeypatch.setattr(http_client, "HTTP_RETRY_BACKOFF", 0.1)
+    for attempt in range(4):
+        delays = [http_client._backoff(attempt) for _ in range(200)]
+        assert 0 <= min(delays) and max(delays) <= 0.1 * 2 ** attempt
+        assert max(delays) > 0.1 * 2 ** attempt / 2
+
+
+def test_breaker_open_half_open_closed():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+    for _ in range(2):
+        breaker.before_request()
+        breaker.record_failure()
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError, match="еще на"):
+        breaker.before_request()
+
+    time.sleep(0.06)
+    assert breaker.state == "half-open"
+    breaker.before_request()  # пробный запрос
+    # Пока пробный запрос не завершен, остальные ждут, а не получают "еще на 0.0 с"
+    with pytest.raises(CircuitOpenError, match="пробный запрос"):
+        breaker.before_request()
+
+    breaker.record_success()
+    assert breaker.state == "closed"
+    breaker.before_request()
+
+
+def test_breaker_failed_trial_reopens():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+    breaker.before_request()
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+
+def test_cancelled_trial_releases_breaker(mock_api):
+    mock_api(200)
+
+    async def cancelled_send(request):
+        raise asyncio.CancelledError()
+
+    breaker = http_client.breaker
+    breaker.opened_at = time.monotonic() - breaker.reset_timeout
+    client = http_client.get_client()
+    client.send = cancelled_send
+    with pytest.raises(asyncio.CancelledError):
+        request(idempotent=True)
+    # Отмененный пробный запрос не блокирует breaker навсегда
+    breaker.before_request()
+
+
+def test_trial_released_when_request_not_built(mock_api, monkeypatch):
+    breaker = http_client.breaker
+    breaker.opened_at = time.monotonic() - breaker.reset_timeout
+
+    def broken_client():
+        raise RuntimeError("loop закрыт")
+
+    monkeypatch.setattr(http_client, "get_client", broken_client)
+    with pytest.raises(RuntimeError):
+        request(idempotent=True)
+    # Запрос не ушел, но следующий снова может стать пробным
+    assert breaker.state == "half-open"
+    assert breaker.before_request() is True
+
+
+@pytest.fixture
+def local_route(monkeypatch):
+    # После теста возвращается привязка gateway, которую сделал live_server
+    for name in ("_local_routes", "_local_signatures", "_local_loop"):
+        monkeypatch.setattr(http_client, name, getattr(http_client, name))
+
+    def bind(handler):
+        http_client.bind_local_gateway({"/api/test": handler}, asyncio.get_running_loop())
+
+    return bind
+
+
+def test_local_call_rejects_bad_arguments(local_route):
+    async def handler(size: float, x: float = 0.0):
+        return {"size": size, "x": x}
+
+    async def run():
+        local_route(handler)
+        assert await http_client.api_call("/api/test", {"size": 2, "x": None}) == {"size": 2, "x": 0.0}
+        with pytest.raises(APIError) as error:
+            await http_client.api_call("/api/test", {"size": 2, "depth": 1})
+        assert error.value.status_code == 422
+
+    asyncio.run(run())
+
+
+def test_local_call_propagates_service_type_error(local_route):
+    async def handler(size: float):
+        return {"area": size * None}
+
+    async def run():
+        local_route(handler)
+        # Ошибка в коде сервиса — это 500, а не "неверные аргументы"
+        with pytest.raises(TypeError):
+            await http_client.api_call("/api/test", {"size": 2})
+
+    asyncio.run(run())
@@ -1 +1,166 @@
-# здесь должны быть тесты
\ No newline at end of file
+"""
+Бенчмарки CAD gateway через HTTP (uvicorn на локальном порту).
+
+Та же матрица операций, что и в test_tools.py, но с полным путем запроса:
+сокет, middleware, валидация FastAPI, сериализация JSON. Разница с прямыми
+вызовами — накладные расходы HTTP слоя.
+"""
+
+import asyncio
+import itertools
+import time
+
+import httpx
+import pytest
+
+from conftest import BENCH_ITERATIONS, BENCH_WARMUP
+
+_counter = itertools.count()
+
+
+def _unique_file(prefix):
+    return f"{prefix}_{next(_counter)}.FCStd"
+
+
+def _run(coro):
+    return asyncio.run(coro)
+
+
+async def _get(base_url, path, **params):
+    async with httpx.AsyncClient(base_url=base_url, timeout=30.0) as client:
+        response = await client.get(path, params=params)
+        response.raise_for_status()
+        return response.json()
+
+
+class _HttpBench:
+    """Один keep-alive клиент на замер, как у долгоживущего MCP клиента."""
+
+    def __init__(self, bench, base_url):
+        self.bench = bench
+        self.base_url = base_url
+
+    def run(self, name, path, params_factory, setup=None, check=None):
+        async def measure():
+            latencies = []
+            async with httpx.AsyncClient(base_url=self.base_url, timeout=30.0) as client:
+                for i in range(BENCH_WARMUP + BENCH_ITERATIONS):
+                    if setup is not None:
+                        await setup(client)
+                    start = time.perf_counter()
+                    response = await client.get(path, params=params_factory())
+                    elapsed = time.perf_counter() - start
+                    response.raise_for_status()
+                    if check is not None:
+                        check(response.json())
+                    if i >= BENCH_WARMUP:
+                        latencies.append(elapsed)
+            return latencies
+
+        return self.bench.record(name, _run(measure()))
+
+
+@pytest.fixture
+def http_bench(bench, live_server):
+    return _HttpBench(bench, live_server)
+
+
+@pytest.fixture
+def open_doc(workdir, live_server):
+    _run(_get(live_server, "/api/cad/open-document", file_path=_unique_file("http_doc")))
+    yield
+    _run(_get(live_server, "/api/cad/close-document"))
+
+
+@pytest.mark.parametrize("shape_type", ["cube", "sphere", "cylinder"])
+def test_http_primitive(http_bench, open_doc, shape_type):
+    def check(data):
+        assert "Ошибка" not in data["result"]
+
+    http_bench.run(
+        f"http.create_shape.{shape_type}",
+        "/api/cad/create-shape",
+        lambda: {"shape_type": shape_type, "size": 10, "x": 1, "y": 2, "z": 3},
+        check=check
+    )
+
+
+COMPLEX_SHAPES = {
+    "star": {"num_points": 5, "inner_radius": 10, "outer_radius": 20, "height": 5},
+    "gear": {"teeth": 20, "module": 2, "outer_radius": 22, "height": 8},
+    "torus": {"major_radius": 20, "minor_radius": 4},
+}
+
+
+@pytest.mark.parametrize("shape_type", sorted(COMPLEX_SHAPES))
+def test_http_complex_shape(http_bench, open_doc, shape_type):
+    http_bench.run(
+        f"http.create_complex_shape.{shape_type}",
+        "/api/cad/create-complex-shape",
+        lambda: {"shape_type": shape_type, **COMPLEX_SHAPES[shape_type]}
+    )
+
+
+def test_http_open_document(http_bench, workdir):
+    async def close(client):
+        await client.get("/api/cad/close-document")
+
+    http_bench.run(
+        "http.open_document.new",
+        "/api/cad/open-document",
+        lambda: {"file_path": _unique_file("http_open")},
+        setup=close
+    )
+
+
+def test_http_save_document(http_bench, open_doc):
+    http_bench.run("http.save_document", "/api/cad/save-document", dict)
+
+
+def test_http_close_document(http_bench, workdir):
+    async def open_new(client):
+        await client.get("/api/cad/open-document", params={"file_path": _unique_file("http_close")})
+
+    def check(data):
+        assert data["result"] == "Документ закрыт"
+
+    http_bench.run("http.close_document", "/api/cad/close-document", dict, setup=open_new, check=check)
+
+
+def test_http_create_test_shape(http_bench, workdir):
+    def check(data):
+        assert data["success"] is True
+
+    http_bench.run(
+        "http.create_test_shape",
+        "/api/cad/create-test-shape",
+        lambda: {"shape_type": "cube", "size": 10, "file_name": _unique_file("http_flow")},
+        check=check
+    )
+
+
+@pytest.mark.parametrize("mode", ["inprocess", "http"])
+def test_tool_dispatch(bench, open_doc, live_server, monkeypatch, mode):
+    """MCP инструмент -> gateway: прямой вызов сервисного слоя против loopback HTTP."""
+    from tools import http_client
+
+    monkeypatch.setattr(http_client, "CAD_API_URL", live_server)
+    monkeypatch.setattr(http_client, "INPROCESS_ENABLED", mode == "inprocess")
+    assert http_client.is_local("/api/cad/create-shape") == (mode == "inprocess")
+
+    async def create():
+        data = await http_client.api_call(
+            "/api/cad/create-shape",
+            params={"shape_type": "cube", "size": 10, "x": 1, "y": 2, "z": 3}
+        )
+        assert "Ошибка" not in data["result"]
+
+    bench.run(f"tool_dispatch.create_shape.{mode}", create)
+
+    async def invalid():
+        with pytest.raises(http_client.APIError) as error:
+            await http_client.api_call("/api/cad/create-shape", params={"shape_type": "cone"})
+        assert error.value.status_code == 400
+        assert "Неподдерживаемый тип фигуры" in error.value.detail
+
+    _run(invalid())
@@ -0,0 +1,44 @@
+"""
+Короткий прогон нагрузочного теста (helpers/load_test.py) против заглушки.
+"""
+
+import json
+
+import pytest
+
+from helpers import load_test
+
+
+def test_stand_in_smoke_run(tmp_path, monkeypatch, capsys):
+    # Заглушка переходит во временную папку — после теста вернемся обратно
+    monkeypatch.chdir(tmp_path)
+    # Остановка заглушки отвязывает gateway; возвращаем привязку live_server
+    from tools import http_client
+    for name in ("_local_routes", "_local_signatures", "_local_loop"):
+        monkeypatch.setattr(http_client, name, getattr(http_client, name))
+    report_path = tmp_path / "reports" / "load.json"
+    report = load_test.main([
+        "--stand-in", "--concurrency", "2", "--duration", "0.5",
+        "--mix", "api:create-shape=2,api:documents=1,mcp:get_documents=1",
+        "--report", str(report_path),
+    ])
+
+    assert json.loads(report_path.read_text(encoding="utf-8")) == report
+    config = report["config"]
+    # Свободный порт, а не 8001 запущенного dev-сервера
+    assert config["stand_in"] and not config["api_url"].endswith(":8001")
+    assert config["mcp_url"] == config["api_url"] + "/mcp"
+    assert set(report["operations"]) == {"api:create-shape", "api:documents", "mcp:get_documents"}
+    row_keys = {"requests", "errors", "error_rate", "throughput_rps", "p50_ms", "p95_ms", "p99_ms", "max_ms"}
+    for row in [report["total"], *report["operations"].values()]:
+        assert row_keys <= set(row)
+    assert report["total"]["requests"] > 0 and report["total"]["errors"] == 0, report
+    assert "ИТОГО" in capsys.readouterr().out
+
+
+def test_parse_mix_rejects_unknown_operation():
+    assert load_test.parse_mix("api:documents=2, mcp:create_cube") == [
+        ("api", "documents", 2.0), ("mcp", "create_cube", 1.0)
+    ]
+    with pytest.raises(ValueError, match="nope"):
+        load_test.parse_mix("api:nope=1")
@@ -0,0 +1,70 @@
+"""
+make_part с аргументами в том виде, в каком их передает модель: числа
+строками, флаги строками, каждая фигура из реестра.
+
+Содержимое .FCStd проверяется через формат заглушки FreeCAD, поэтому
+с настоящим FreeCAD тесты пропускаются.
+"""
+
+import asyncio
+import json
+
+import pytest
+
+import cad_service
+from conftest import USING_STAND_IN
+
+pytestmark = pytest.mark.skipif(not USING_STAND_IN, reason="проверяет файлы заглушки FreeCAD")
+
+# Допустимые значения параметров реестра — строками, как от модели
+LLM_PARAM_VALUES = {
+    "size": "10", "x": "0", "y": "0", "z": "5.5",
+    "num_points": "5", "inner_radius": "4", "outer_radius": "10", "height": "5",
+    "teeth": "20", "module": "2", "major_radius": "10", "minor_radius": "2",
+}
+
+
+def make_part(parts, **kwargs):
+    return asyncio.run(cad_service.make_part(parts, **kwargs))
+
+
+def saved(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)["objects"]
+
+
+@pytest.mark.parametrize("shape_type", list(cad_service.SHAPES))
+def test_every_registered_shape(workdir, shape_type):
+    part = {"shape_type": shape_type, **{name: LLM_PARAM_VALUES[name] for name in cad_service.SHAPES[shape_type]}}
+    result = make_part([part], file_name="part.FCStd")
+    assert result["success"], result["result"]
+    assert len(saved("part.FCStd")) == 1
+
+
+def test_string_flags(workdir):
+    result = make_part([
+        {"shape_type": "cube", "size": "40"},
+        {"shape_type": "cylinder", "size": "10", "subtract": "true"},
+        {"shape_type": "sphere", "size": "5", "subtract": "false"},
+    ], file_name="plate.FCStd", fuse="false")
+    assert result["success"], result["result"]
+    # Сфера не вычитается, а сливается с кубом; цилиндр вырезается из тела
+    assert [o["name"] for o in saved("plate.FCStd")] == ["result"]
+    assert [s["op"] for s in result["steps"]].count("boolean") == 2
+
+
+def test_bad_size_is_validation_error(workdir):
+    with pytest.raises(cad_service.CADServiceError) as error:
+        make_part([{"shape_type": "cube", "size": "двадцать"}], file_name="bad.FCStd")
+    assert error.value.status_code == 400
+
+
+def test_agent_tool_with_llm_arguments(workdir, live_server):
+    from ai_agent.agent import make_part as make_part_tool
+
+    # Инструмент агента идет через клиент сервисного слоя, как при вызове моделью
+    output = asyncio.run(make_part_tool(
+        [{"shape_type": "gear", "teeth": "12", "module": "1.5", "outer_radius": "9", "height": "3"}],
+        file_name="gear.FCStd",
+    ))
+    assert output.startswith("✅ Деталь сохранена в файл gear.FCStd"), output
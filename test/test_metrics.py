@@ -0,0 +1,132 @@
+"""
+Метрики Prometheus: текстовый формат, метки HTTP запросов, очередь CAD,
+gauge'и FreeCAD и доля попаданий в кэш.
+"""
+
+import asyncio
+
+import httpx
+import pytest
+from fastapi import FastAPI
+
+import metrics
+from common_logic import core
+from metrics import Counter, Gauge, Histogram, PrometheusMiddleware, Registry
+
+
+def get(app, *paths):
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            return [await client.get(path) for path in paths]
+
+    return asyncio.run(run())
+
+
+def sample(text, name):
+    """Значение строки метрики name (с метками) из вывода /metrics."""
+    for line in text.splitlines():
+        if line.startswith(name + " "):
+            return float(line.rsplit(" ", 1)[1])
+    return None
+
+
+def test_exposition_format():
+    registry = Registry()
+    requests = Counter("app_requests_total", "Запросы", ("path",), registry=registry)
+    requests.labels('/a"b\\c').inc(2)
+    Gauge("app_temperature", "Температура", registry=registry).set(21.5)
+    latency = Histogram("app_latency_seconds", "Латентность", buckets=(0.1, 1.0), registry=registry)
+    for value in (0.05, 0.5, 0.5, 5):
+        latency.observe(value)
+
+    assert registry.generate_latest() == "\n".join([
+        "# HELP app_requests_total Запросы",
+        "# TYPE app_requests_total counter",
+        'app_requests_total{path="/a\\"b\\\\c"} 2',
+        "# HELP app_temperature Температура",
+        "# TYPE app_temperature gauge",
+        "app_temperature 21.5",
+        "# HELP app_latency_seconds Латентность",
+        "# TYPE app_latency_seconds histogram",
+        'app_latency_seconds_bucket{le="0.1"} 1',
+        'app_latency_seconds_bucket{le="1"} 3',
+        'app_latency_seconds_bucket{le="+Inf"} 4',
+        "app_latency_seconds_sum 6.05",
+        "app_latency_seconds_count 4",
+    ]) + "\n"
+
+
+def test_duplicate_metric_rejected():
+    registry = Registry()
+    Counter("app_total", "x", registry=registry)
+    with pytest.raises(ValueError):
+        Counter("app_total", "y", registry=registry)
+
+
+def test_http_labels_use_route_template():
+    app = FastAPI()
+
+    @app.get("/api/cad/items/{item_id}")
+    async def item(item_id: int):
+        return {"id": item_id}
+
+    before = set(metrics.HTTP_REQUEST_DURATION._children)
+    responses = get(PrometheusMiddleware(app), "/api/cad/items/1", "/api/cad/items/2", "/api/cad/items/x", "/nope/42")
+    assert [r.status_code for r in responses] == [200, 200, 422, 404]
+
+    added = set(metrics.HTTP_REQUEST_DURATION._children) - before
+    # Сырые пути не становятся метками: одна серия на шаблон маршрута и статус
+    assert added <= {
+        ("GET", "/api/cad/items/{item_id}", "200"),
+        ("GET", "/api/cad/items/{item_id}", "422"),
+        ("GET", "unmatched", "404"),
+    }
+    assert not any("/1" in key[1] or "/42" in key[1] for key in metrics.HTTP_REQUEST_DURATION._children)
+    child = metrics.HTTP_REQUEST_DURATION.labels("GET", "/api/cad/items/{item_id}", "200")
+    assert child.counts[-1] + sum(child.counts[:-1]) >= 2
+
+
+def test_queue_depth_counts_cad_requests_in_flight():
+    seen = {}
+
+    async def app(scope, receive, send):
+        seen[scope["path"]] = metrics.QUEUE_DEPTH.labels().value
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    base = metrics.QUEUE_DEPTH.labels().value
+    get(PrometheusMiddleware(app), "/api/cad/documents", "/health")
+    # Запрос к CAD учитывается, пока выполняется; остальные — нет
+    assert seen == {"/api/cad/documents": base + 1, "/health": base}
+    assert metrics.QUEUE_DEPTH.labels().value == base
+
+
+def test_freecad_gauges(workdir):
+    asyncio.run(core.open_document("gauges.FCStd"))
+    try:
+        asyncio.run(core.create_simple_shape("cube", 10.0))
+        asyncio.run(core.create_simple_shape("sphere", 5.0))
+        name = core.current_doc.Name
+        text = metrics.generate_latest()
+        assert sample(text, "cad_open_documents") >= 1
+        assert sample(text, f'cad_document_objects{{document="{name}"}}') == 2
+    finally:
+        asyncio.run(core.close_document())
+    assert f'document="{name}"' not in metrics.generate_latest()
+
+
+def test_cache_hit_ratio():
+    for hit in (True, True, True, False):
+        metrics.record_cache("test_ratio", hit)
+    text = metrics.generate_latest()
+    assert sample(text, 'cad_cache_hit_ratio{cache="test_ratio"}') == 0.75
+    assert sample(text, 'cad_cache_requests_total{cache="test_ratio",result="miss"}') == 1
+
+
+def test_metrics_endpoint():
+    import main
+
+    response, = get(main.app, "/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == metrics.CONTENT_TYPE_LATEST
+    assert "# TYPE cad_http_request_duration_seconds histogram" in response.text
@@ -0,0 +1,116 @@
+"""
+ASGI middleware gateway: request id, Server-Timing, slow-log и профилирование по запросу.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+
+import httpx
+import pytest
+
+from middleware import custom_middleware
+from metrics import time_operation
+from middleware.custom_middleware import ProfilingMiddleware, RequestContextMiddleware, get_request_id
+
+
+async def hello_app(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"text/plain")]})
+    await send({"type": "http.response.body", "body": b"ok"})
+
+
+async def echo_id_app(scope, receive, send):
+    # Операции ядра внутри запроса попадают в свои фазы Server-Timing
+    with time_operation("makeBox"):
+        time.sleep(0.002)
+    with time_operation("save"):
+        time.sleep(0.002)
+    await send({"type": "http.response.start", "status": 201, "headers": []})
+    await send({"type": "http.response.body", "body": get_request_id().encode()})
+
+
+def get(app, path, headers=None):
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            return await client.get(path, headers=headers)
+
+    return asyncio.run(run())
+
+
+def test_request_id_passed_through():
+    response = get(RequestContextMiddleware(echo_id_app), "/", {"X-Request-ID": "client-42"})
+    # Один id в ответе и внутри обработчика
+    assert response.headers["x-request-id"] == "client-42"
+    assert response.text == "client-42"
+
+
+@pytest.mark.parametrize("headers", [None, {"X-Request-ID": "bad id;<script>"}, {"X-Request-ID": "x" * 129}])
+def test_request_id_generated(headers):
+    response = get(RequestContextMiddleware(echo_id_app), "/", headers)
+    request_id = response.headers["x-request-id"]
+    assert len(request_id) == 32 and request_id == response.text
+    assert get_request_id() is None
+
+
+def test_server_timing_phases():
+    response = get(RequestContextMiddleware(echo_id_app), "/")
+    phases = dict(item.split(";dur=") for item in response.headers["server-timing"].split(", "))
+    assert list(phases) == ["validation", "freecad", "recompute", "save", "total"]
+    assert float(phases["freecad"]) >= 2 and float(phases["save"]) >= 2
+    assert float(phases["recompute"]) == 0
+    assert float(phases["total"]) >= float(phases["freecad"]) + float(phases["save"])
+
+
+@pytest.fixture
+def slow_log(tmp_path, monkeypatch):
+    path = tmp_path / "slow.log"
+    monkeypatch.setattr(custom_middleware, "SLOW_LOG_PATH", str(path))
+    # Обработчик создается заново на файл теста и закрывается после него
+    slow_logger = logging.getLogger("cad.slowlog")
+    monkeypatch.setattr(slow_logger, "handlers", [])
+    yield path
+    for handler in slow_logger.handlers:
+        handler.close()
+
+
+def test_slow_request_logged(slow_log):
+    get(RequestContextMiddleware(echo_id_app, slow_request_ms=0), "/api/cad/save?x=1", {"X-Request-ID": "slow-1"})
+    get(RequestContextMiddleware(echo_id_app, slow_request_ms=60_000), "/fast")
+
+    records = [json.loads(line) for line in slow_log.read_text(encoding="utf-8").splitlines()]
+    assert len(records) == 1
+    record = records[0]
+    assert (record["request_id"], record["method"], record["path"], record["query"], record["status"]) == (
+        "slow-1", "GET", "/api/cad/save", "x=1", 201
+    )
+    assert set(record["phases_ms"]) == {"validation", "freecad", "recompute", "save"}
+
+
+@pytest.mark.parametrize("query, requested", [
+    (b"profile=1", True),
+    (b"a=2&profile=1", True),
+    (b"noprofile=1", False),
+    (b"xprofile=10", False),
+    (b"profile=10", False),
+    (b"", False),
+])
+def test_profile_query_parameter(query, requested):
+    scope = {"query_string": query, "headers": [(b"x-profile-token", b"secret")]}
+    assert (custom_middleware._wants_profile(scope) == "secret") is requested
+
+
+def test_profiled_request_saves_profile(tmp_path, monkeypatch):
+    monkeypatch.setattr(custom_middleware, "PROFILING_TOKEN", "secret")
+    monkeypatch.setattr(custom_middleware, "PROFILES_DIR", str(tmp_path))
+    app = ProfilingMiddleware(hello_app)
+
+    response = get(app, "/api/cad/documents?profile=1", {"X-Profile-Token": "secret"})
+    name = response.headers["x-profile-file"]
+    assert response.text == "ok"
+    assert sorted(os.listdir(tmp_path)) == [name, name.replace(".pstats", ".txt")]
+
+    # Неверный токен — запрос выполняется без профилирования
+    response = get(app, "/api/cad/documents?profile=1", {"X-Profile-Token": "wrong"})
+    assert "x-profile-file" not in response.headers
@@ -0,0 +1,108 @@
+"""
+Кэш планов агента: нормализация запросов, TTL и вытеснение старых планов.
+"""
+
+import asyncio
+
+import pytest
+
+from ai_agent import plan_cache
+from ai_agent.plan_cache import PlanCache, is_cacheable_query, normalize_query
+
+PLAN = [{"tool": "make_part", "args": {"shape_type": "cube", "size": 20}}]
+
+
+@pytest.fixture
+def cache(tmp_path):
+    caches = []
+
+    def make(**kwargs):
+        caches.append(PlanCache(path=str(tmp_path / "plans.db"), **kwargs))
+        return caches[-1]
+
+    yield make
+    for c in caches:
+        c.close()
+
+
+@pytest.mark.parametrize("query", [
+    "Создай куб 20мм",
+    "создай, пожалуйста, куб 20 мм!",
+    "Сделай мне куб 20 мм",
+    "Построй куб 20мм",
+])
+def test_equivalent_queries_normalized(query):
+    assert normalize_query(query) == "создай куб 20 мм"
+
+
+def test_different_queries_differ():
+    assert normalize_query("Создай куб 20мм") != normalize_query("Создай куб 25мм")
+    assert normalize_query("Создай куб 20мм") != normalize_query("Создай сферу 20мм")
+
+
+@pytest.mark.parametrize("query, cacheable", [
+    ("Создай куб 20мм", True),
+    ("Сделай его больше", False),
+    ("Ещё один такой же", False),
+    ("make it bigger", False),
+    ("make it a cube 10", False),
+    ("Создай сферу 10", True),
+])
+def test_contextual_queries_not_cached(query, cacheable):
+    assert is_cacheable_query(query) is cacheable
+
+
+def test_hit_for_normalized_query(cache):
+    c = cache()
+    c.put("Создай куб 20мм", PLAN, state="v1")
+    assert c.get("создай, пожалуйста, куб 20 мм!", state="v1") == PLAN
+    # Другой промпт или модель — другой ключ
+    assert c.get("Создай куб 20мм", state="v2") is None
+    assert (c.stats()["hits"], c.stats()["misses"]) == (1, 1)
+
+
+def test_contextual_query_never_stored(cache):
+    c = cache()
+    c.put("Сделай его больше", PLAN)
+    assert c.stats()["entries"] == 0
+
+
+def test_expired_plan_is_miss(cache, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(plan_cache.time, "time", lambda: now[0])
+    c = cache(ttl=60)
+    c.put("Создай куб 20мм", PLAN)
+    now[0] += 59
+    assert c.get("Создай куб 20мм") == PLAN
+    now[0] += 2
+    assert c.get("Создай куб 20мм") is None
+    # Устаревшие планы удаляются при следующей записи
+    c.put("Создай сферу 10", PLAN)
+    assert c.stats()["entries"] == 1
+
+
+def test_least_recently_used_plan_evicted(cache, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(plan_cache.time, "time", lambda: now[0])
+    c = cache(max_entries=2)
+    for query in ("Создай куб 10", "Создай куб 20"):
+        now[0] += 1
+        c.put(query, PLAN)
+    now[0] += 1
+    c.get("Создай куб 10")  # куб 10 использован позже куба 20
+    now[0] += 1
+    c.put("Создай куб 30", PLAN)
+
+    assert c.stats()["entries"] == 2
+    assert c.get("Создай куб 20") is None
+    assert c.get("Создай куб 10") == PLAN and c.get("Создай куб 30") == PLAN
+
+
+def test_async_access(cache):
+    c = cache()
+
+    async def run():
+        await c.aput("Создай куб 20мм", PLAN)
+        return await c.aget("Создай куб 20 мм")
+
+    assert asyncio.run(run()) == PLAN
@@ -0,0 +1,21 @@
+"""
+Прогрев CAD: блокировка записи и чтение файлов в кэш ОС.
+"""
+
+import asyncio
+
+import cad_service
+
+
+def test_prefetch_waits_for_write_lock(workdir):
+    open("part.FCStd", "w").close()
+
+    async def run():
+        async with cad_service._write_lock():
+            task = asyncio.create_task(cad_service.prefetch(["part.FCStd", "notes.txt", "missing.FCStd"]))
+            await asyncio.sleep(0.05)
+            # Пока идет другая операция записи, прогрев ядра не начинается
+            assert not task.done()
+        return await task
+
+    assert asyncio.run(run()) == {"success": True, "files": ["part.FCStd"]}
@@ -0,0 +1,136 @@
+"""
+Память сессий агента: окно последних реплик и свертка старых в резюме.
+"""
+
+import asyncio
+
+import pytest
+
+from ai_agent.session_memory import SessionMemory
+
+
+@pytest.fixture
+def make_memory(tmp_path):
+    memories = []
+
+    def make(**kwargs):
+        memory = SessionMemory(path=str(tmp_path / "memory.db"), **kwargs)
+        memories.append(memory)
+        return memory
+
+    yield make
+    for memory in memories:
+        memory.close()
+
+
+def contents(history):
+    return [m.content for m in history]
+
+
+async def save_turns(memory, session_id, count, start=0):
+    for i in range(start, start + count):
+        await memory.asave_turn(session_id, f"q{i}", f"a{i}")
+    await memory.wait_idle()
+
+
+def test_window_keeps_last_messages(make_memory):
+    memory = make_memory(window=4, max_tokens=1000)
+
+    async def run():
+        await save_turns(memory, "s", 3)
+        return await memory.aload("s")
+
+    history = asyncio.run(run())
+    # Две старые реплики свернуты в резюме, в окне — четыре последних
+    assert contents(history)[1:] == ["q1", "a1", "q2", "a2"]
+    assert history[0].type == "system" and "q0" in history[0].content and "a0" in history[0].content
+
+
+def test_window_respects_token_budget(make_memory):
+    memory = make_memory(window=10, max_tokens=20)
+
+    async def run():
+        await memory.asave_turn("s", "x" * 90, "short")
+        await memory.asave_turn("s", "q", "a")
+        await memory.wait_idle()
+        return await memory.aload("s")
+
+    # Длинная реплика не влезает в бюджет 20 токенов и уходит в резюме
+    history = asyncio.run(run())
+    assert contents(history)[-3:] == ["short", "q", "a"]
+    assert history[0].type == "system"
+
+
+def test_window_keeps_newest_message_over_budget(make_memory):
+    memory = make_memory(window=10, max_tokens=5)
+
+    async def run():
+        await memory.asave_turn("s", "q", "y" * 90)
+        await memory.wait_idle()
+        return await memory.aload("s")
+
+    assert contents(asyncio.run(run()))[-1] == "y" * 90
+
+
+def test_summary_folds_previous_summary(make_memory):
+    calls = []
+
+    async def summarizer(previous, transcript):
+        calls.append((previous, transcript))
+        return f"S{len(calls)}"
+
+    memory = make_memory(window=2, max_tokens=1000, summarizer=summarizer)
+
+    async def run():
+        await save_turns(memory, "s", 2)
+        await save_turns(memory, "s", 1, start=2)
+        return await memory.aload("s")
+
+    history = asyncio.run(run())
+    assert calls == [
+        ("", "Пользователь: q0\nАгент: a0"),
+        ("S1", "Пользователь: q1\nАгент: a1"),
+    ]
+    assert contents(history) == ["Краткое содержание предыдущего разговора: S2", "q2", "a2"]
+
+
+def test_summary_is_capped(make_memory):
+    async def summarizer(previous, transcript):
+        return "z" * 1000
+
+    memory = make_memory(window=2, max_tokens=1000, summary_max_tokens=10, summarizer=summarizer)
+
+    async def run():
+        await save_turns(memory, "s", 2)
+        return await memory.aload("s")
+
+    summary = asyncio.run(run())[0].content
+    assert summary.endswith("z" * 30) and "z" * 31 not in summary
+
+
+def test_failed_summary_keeps_messages(make_memory):
+    async def summarizer(previous, transcript):
+        raise RuntimeError("LLM недоступна")
+
+    memory = make_memory(window=2, max_tokens=1000, summarizer=summarizer)
+
+    async def run():
+        await save_turns(memory, "s", 2)
+        return await memory.aload("s")
+
+    # Без резюме окно то же, а старые реплики остаются в базе до следующей попытки
+    assert contents(asyncio.run(run())) == ["q1", "a1"]
+    assert memory._conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0] == 4
+
+
+def test_sessions_are_isolated(make_memory):
+    memory = make_memory(window=4, max_tokens=1000)
+
+    async def run():
+        await save_turns(memory, "a", 1)
+        await save_turns(memory, "b", 1, start=1)
+        await memory.aclear("a")
+        return await memory.aload("a"), await memory.aload("b")
+
+    history_a, history_b = asyncio.run(run())
+    assert history_a == [] and contents(history_b) == ["q1", "a1"]
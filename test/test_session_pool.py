@@ -0,0 +1,91 @@
+"""
+Пул сессий агента: LRU вытеснение и лимиты запросов к LLM.
+"""
+
+import asyncio
+
+from ai_agent.session_pool import SessionPool
+
+
+def test_least_recently_used_session_evicted():
+    pool = SessionPool(max_sessions=2)
+    first = pool.get("a")
+    pool.get("b")
+    assert pool.get("a") is first  # "a" снова самая свежая
+    pool.get("c")
+    assert list(pool.sessions) == ["a", "c"]
+    assert pool.evicted == 1
+    # Вытесненная сессия создается заново
+    assert pool.get("b") is not pool.sessions.get("a")
+
+
+def test_active_session_not_evicted():
+    pool = SessionPool(max_sessions=1)
+
+    async def run():
+        async with pool.session("busy") as state:
+            pool.get("other")
+            # Занятая сессия остается, пул временно больше лимита
+            assert list(pool.sessions) == ["busy", "other"] and state.active == 1
+        pool.get("third")
+        return list(pool.sessions)
+
+    assert asyncio.run(run()) == ["third"]
+    assert pool.evicted == 2
+
+
+def test_session_requests_to_llm_are_serialized():
+    pool = SessionPool(session_llm_concurrency=1, llm_concurrency=4)
+    order, waited = [], []
+
+    async def query(session_id, name):
+        async with pool.session(session_id) as state:
+            async with pool.llm_slot(state, on_wait=lambda: waited.append(name)):
+                order.append(f"{name}+")
+                await asyncio.sleep(0.01)
+                order.append(f"{name}-")
+
+    async def run():
+        await asyncio.gather(query("s", "q1"), query("s", "q2"), query("other", "q3"))
+
+    asyncio.run(run())
+    # Второй запрос сессии ждет первый, другая сессия не ждет
+    assert order.index("q2+") > order.index("q1-")
+    assert order.index("q3+") < order.index("q1-")
+    assert waited == ["q2"]
+
+
+def test_global_llm_limit_queues():
+    pool = SessionPool(llm_concurrency=1)
+    in_use = []
+
+    async def query(session_id):
+        async with pool.session(session_id) as state:
+            async with pool.llm_slot(state):
+                in_use.append(pool.stats()["llm_in_use"])
+                await asyncio.sleep(0.01)
+
+    async def run():
+        await asyncio.gather(*(query(f"s{i}") for i in range(3)))
+
+    asyncio.run(run())
+    assert in_use == [1, 1, 1]
+    assert pool.stats()["queued_for_llm"] == 2
+
+
+def test_pool_works_across_event_loops():
+    # process() агента запускает каждый запрос в новом asyncio.run
+    pool = SessionPool(session_llm_concurrency=1, llm_concurrency=1)
+
+    async def query(session_id):
+        async with pool.session(session_id) as state:
+            async with pool.llm_slot(state):
+                await asyncio.sleep(0.01)
+
+    async def run():
+        await asyncio.gather(query("s"), query("s"), query("other"))
+
+    asyncio.run(run())
+    asyncio.run(run())
+    assert pool.stats()["llm_in_use"] == 0
+    assert pool.stats()["queued_for_llm"] == 4
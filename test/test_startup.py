@@ -0,0 +1,66 @@
+"""
+Время холодного старта: импорт gateway и агента в чистом процессе.
+
+Время берется из `python -X importtime` (суммарное время импорта модуля
+вместе с зависимостями). Тест падает, если импорт вышел за бюджет или
+при импорте загрузились модули, которые должны грузиться лениво.
+
+Настройки окружения:
+    IMPORT_BUDGET_MAIN_MS   — бюджет импорта main, мс (по умолчанию 1500)
+    IMPORT_BUDGET_AGENT_MS  — бюджет импорта ai_agent.agent, мс (по умолчанию 2500)
+    IMPORT_RUNS             — число запусков на модуль (по умолчанию 3)
+"""
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+from conftest import ROOT
+
+IMPORT_BUDGET_MAIN_MS = float(os.getenv("IMPORT_BUDGET_MAIN_MS", "1500"))
+IMPORT_BUDGET_AGENT_MS = float(os.getenv("IMPORT_BUDGET_AGENT_MS", "2500"))
+IMPORT_RUNS = int(os.getenv("IMPORT_RUNS", "3"))
+
+
+def import_time(module: str):
+    """Импортировать module в новом процессе -> (секунды, множество загруженных модулей)."""
+    env = dict(os.environ, TRACING_ENABLED="0", PYTHONDONTWRITEBYTECODE="1", PYTHONPATH=ROOT)
+    # Запуск из временной папки сессии: agent.log и базы не попадают в репозиторий
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=os.getcwd(), env=env, capture_output=True, text=True, timeout=120
+    )
+    assert result.returncode == 0, result.stderr[-2000:]
+    total_us, loaded = None, set()
+    # Строки вида "import time:  self [us] | cumulative | имя" (вложенность — отступом)
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        loaded.add(name.strip())
+        if name.strip() == module and not name.startswith("  "):
+            total_us = int(cumulative)
+    assert total_us is not None, f"Нет строки importtime для {module}"
+    return total_us / 1_000_000, loaded
+
+
+@pytest.mark.parametrize("module, budget_ms, lazy", [
+    # fastmcp и инструменты MCP грузятся в фоне после старта, агент — при первом запросе
+    ("main", IMPORT_BUDGET_MAIN_MS, ["fastmcp", "tools.tool_create_cube", "ai_agent.agent", "httpx"]),
+    # LangChain (клиент OpenAI, исполнитель, промпты, инструменты) — при создании агента
+    ("ai_agent.agent", IMPORT_BUDGET_AGENT_MS, ["langchain_core", "langchain_openai", "langchain_classic.agents", "fastmcp"]),
+])
+def test_import_time(bench, module, budget_ms, lazy):
+    latencies = []
+    for _ in range(IMPORT_RUNS):
+        seconds, loaded = import_time(module)
+        latencies.append(seconds)
+        eager = [name for name in lazy if name in loaded]
+        assert not eager, f"import {module} загрузил модули, которые должны грузиться лениво: {eager}"
+
+    summary = bench.record(f"startup.import.{module}", latencies)
+    assert summary["p50_ms"] <= budget_ms, (
+        f"Холодный импорт {module}: p50 {summary['p50_ms']} мс > бюджета {budget_ms} мс"
+    )
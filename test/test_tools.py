@@ -1 +1,121 @@
-# здесь должны быть тесты
\ No newline at end of file
+"""
+Бенчмарки прямых вызовов FreeCADCore (без HTTP).
+
+Показывают стоимость самих CAD операций: примитивы, сложные фигуры,
+open/save/close и полный сценарий create-test-shape.
+"""
+
+import asyncio
+import itertools
+
+import pytest
+
+from common_logic import core
+import cad_service
+
+_counter = itertools.count()
+
+
+def _unique_file(prefix):
+    return f"{prefix}_{next(_counter)}.FCStd"
+
+
+@pytest.fixture
+def open_doc(workdir):
+    """Открытый документ на время бенчмарка."""
+    asyncio.run(core.open_document(_unique_file("bench_doc")))
+    yield core.current_doc
+    asyncio.run(core.close_document())
+
+
+@pytest.mark.parametrize("shape_type", ["cube", "sphere", "cylinder"])
+def test_direct_primitive(bench, open_doc, shape_type):
+    async def create():
+        result = await core.create_simple_shape(shape_type, 10.0, 1.0, 2.0, 3.0)
+        assert "Ошибка" not in result
+
+    summary = bench.run(f"direct.create_shape.{shape_type}", create)
+    assert summary["iterations"] > 0
+
+
+COMPLEX_SHAPES = {
+    "star": {"num_points": 5, "inner_radius": 10.0, "outer_radius": 20.0, "height": 5.0},
+    "gear": {"teeth": 20, "module": 2.0, "outer_radius": 22.0, "height": 8.0},
+    "torus": {"major_radius": 20.0, "minor_radius": 4.0},
+}
+
+
+@pytest.mark.parametrize("shape_type", sorted(COMPLEX_SHAPES))
+def test_direct_complex_shape(bench, open_doc, shape_type):
+    # Логика сложных фигур живет в сервисном слое, а не в FreeCADCore
+    async def create():
+        result = await cad_service.create_complex_shape(shape_type, **COMPLEX_SHAPES[shape_type])
+        assert result["result"]
+
+    bench.run(f"direct.create_complex_shape.{shape_type}", create)
+
+
+def test_direct_open_document(bench, workdir):
+    async def open_new():
+        result = await core.open_document(_unique_file("bench_open"))
+        assert "Ошибка" not in result
+
+    bench.run("direct.open_document.new", open_new, setup=core.close_document)
+    asyncio.run(core.close_document())
+
+
+def test_direct_save_document(bench, open_doc):
+    async def save():
+        result = await core.save_document()
+        assert "Ошибка" not in result
+
+    bench.run("direct.save_document", save)
+
+
+def test_direct_close_document(bench, workdir):
+    async def close():
+        assert await core.close_document() == "Документ закрыт"
+
+    bench.run("direct.close_document", close, setup=lambda: core.open_document(_unique_file("bench_close")))
+
+
+def test_direct_create_test_shape_flow(bench, workdir):
+    async def flow():
+        file_name = _unique_file("bench_flow")
+        await core.open_document(file_name)
+        await core.create_simple_shape("cube", 10.0, 0.0, 0.0, 0.0)
+        await core.save_document(file_name)
+        await core.close_document()
+
+    bench.run("direct.create_test_shape_flow", flow)
+
+
+def test_direct_run_script(bench, workdir):
+    # Тот же сценарий create-test-shape одной транзакцией сервисного слоя
+    async def script():
+        result = await cad_service.run_script([
+            {"op": "open", "file_path": _unique_file("bench_script")},
+            {"op": "create", "shape_type": "cube", "size": 10.0, "name": "base"},
+            {"op": "create", "shape_type": "cylinder", "size": 4.0, "x": 5.0, "y": 5.0, "name": "hole"},
+            {"op": "boolean", "operation": "cut", "base": "base", "tool": "hole"},
+            {"op": "save"},
+            {"op": "close"},
+        ])
+        assert result["success"], result["result"]
+
+    bench.run("direct.run_script", script)
+
+
+def test_direct_make_part(bench, workdir):
+    # Та же деталь по описанию — так ее создает агент одним вызовом make_part
+    async def part():
+        result = await cad_service.make_part(
+            [
+                {"shape_type": "cube", "size": 10.0},
+                {"shape_type": "cylinder", "size": 4.0, "x": 5.0, "y": 5.0, "subtract": True},
+            ],
+            _unique_file("bench_part")
+        )
+        assert result["success"], result["result"]
+
+    bench.run("direct.make_part", part)
@@ -0,0 +1,106 @@
+"""
+Трассировка: запись спанов в файл и клиентские спаны исходящих запросов.
+"""
+
+import asyncio
+import json
+import socket
+import threading
+
+import httpx
+import pytest
+
+import tracing
+from tools import http_client
+
+
+def read_spans(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_export_rotates_by_size(tmp_path, monkeypatch):
+    monkeypatch.setattr(tracing, "TRACING_ENABLED", True)
+    monkeypatch.setattr(tracing, "TRACE_MAX_BYTES", 1)
+    monkeypatch.setattr(tracing, "TRACE_BACKUP_COUNT", 2)
+    path = tmp_path / "spans.jsonl"
+    exporter = tracing._FileExporter(str(path))
+
+    for i in range(4):
+        span = tracing.new_span(f"span{i}", "INTERNAL")
+        span.end_ns = span.start_ns
+        exporter.export(span)
+        exporter.flush()
+
+    # Текущий файл и не больше TRACE_BACKUP_COUNT старых
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["spans.jsonl", "spans.jsonl.1", "spans.jsonl.2"]
+    assert [s["name"] for s in read_spans(path)] == ["span3"]
+    assert [s["name"] for s in read_spans(f"{path}.2")] == ["span1"]
+
+
+def test_client_span_ends_on_transport_error(tmp_path, monkeypatch):
+    monkeypatch.setattr(tracing, "TRACING_ENABLED", True)
+    exporter = tracing._FileExporter(str(tmp_path / "spans.jsonl"))
+    monkeypatch.setattr(tracing, "_exporter", exporter)
+    # Порт, на котором никто не слушает: ошибка подключения, ответа нет
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    monkeypatch.setattr(http_client, "CAD_API_URL", f"http://127.0.0.1:{port}")
+    monkeypatch.setattr(http_client, "HTTP_RETRIES", 1)
+    monkeypatch.setattr(http_client, "HTTP_RETRY_BACKOFF", 0.0)
+    monkeypatch.setattr(http_client, "breaker", http_client.CircuitBreaker())
+    monkeypatch.setattr(http_client, "_client", None)
+
+    async def call():
+        try:
+            await http_client.api_request("GET", "/api/cad/documents", idempotent=True)
+        finally:
+            await http_client.aclose_client()
+
+    with pytest.raises(httpx.ConnectError):
+        asyncio.run(call())
+    exporter.flush()
+
+    # Каждая попытка — закрытый спан с ошибкой
+    spans = read_spans(tmp_path / "spans.jsonl")
+    assert [(s["kind"], s["status"], s["attributes"]["error.type"]) for s in spans] == [
+        ("CLIENT", "ERROR", "ConnectError")
+    ] * 2
+
+
+def test_export_error_does_not_stop_exporter(tmp_path, monkeypatch):
+    monkeypatch.setattr(tracing, "TRACING_ENABLED", True)
+    blocker = tmp_path / "file"
+    blocker.write_text("")
+    # Папка для спанов не создается: на ее месте файл
+    exporter = tracing._FileExporter(str(blocker / "spans.jsonl"))
+    span = tracing.new_span("lost", "INTERNAL")
+    span.end_ns = span.start_ns
+    exporter.export(span)
+
+    flushed = threading.Thread(target=exporter.flush, daemon=True)
+    flushed.start()
+    flushed.join(timeout=5)
+    assert not flushed.is_alive(), "flush() завис после ошибки записи"
+
+    # Поток экспорта жив и пишет следующие спаны, когда путь снова доступен
+    exporter.path = str(tmp_path / "spans.jsonl")
+    span = tracing.new_span("written", "INTERNAL")
+    span.end_ns = span.start_ns
+    exporter.export(span)
+    exporter.flush()
+    assert [s["name"] for s in read_spans(exporter.path)] == ["written"]
+
+
+def test_disabled_tracing_creates_no_spans(monkeypatch):
+    monkeypatch.setattr(tracing, "TRACING_ENABLED", False)
+    with tracing.start_span("agent.process", attributes={"query": "q"}) as span:
+        span.set_attribute("agent.fast_path", True)
+        assert tracing.current_span() is None
+        assert tracing.new_span("child", "INTERNAL") is span
+        assert tracing.inject({}) == {}
+
+    request = httpx.Request("GET", "http://cad/api/cad/documents")
+    asyncio.run(tracing.trace_request_start(request))
+    assert "traceparent" not in request.headers and "trace_span" not in request.extensions
@@ -0,0 +1,107 @@
+"""
+Учет пользователей Telegram бота: буфер в памяти и запись пачками с UPSERT.
+"""
+
+import asyncio
+import sqlite3
+from types import SimpleNamespace
+
+import pytest
+
+from tg_user_log import CREATE_USERS_TABLE, UserLog
+
+
+def user(user_id, username="user"):
+    return SimpleNamespace(id=user_id, username=username, first_name="Имя", last_name=None)
+
+
+@pytest.fixture
+def user_log(tmp_path):
+    log = UserLog(str(tmp_path / "users.db"), batch_size=3, flush_seconds=0.05)
+    log.execute(CREATE_USERS_TABLE)
+    yield log
+    log.close()
+
+
+def rows(log):
+    return log.execute("SELECT user_id, username, first_seen, last_seen FROM users ORDER BY user_id")
+
+
+def test_record_only_buffers(user_log):
+    async def run():
+        user_log.record(user(1))
+        user_log.record(user(1, "renamed"))
+        user_log.record(user(2))
+
+    asyncio.run(run())
+    # Повторные визиты схлопнуты, в базу ничего не записано
+    assert rows(user_log) == []
+    assert sorted(user_log._pending) == [1, 2]
+
+
+def test_flush_writes_one_batch(user_log):
+    async def run():
+        user_log.record(user(1))
+        user_log.record(user(2))
+        return await user_log.flush(), await user_log.flush()
+
+    assert asyncio.run(run()) == (2, 0)
+    assert [row[:2] for row in rows(user_log)] == [(1, "user"), (2, "user")]
+
+
+def test_full_buffer_flushes_without_timer(user_log):
+    async def run():
+        for i in range(3):
+            user_log.record(user(i))
+        await user_log._flush_task
+
+    asyncio.run(run())
+    assert len(rows(user_log)) == 3 and user_log._pending == {}
+
+
+def test_repeat_visit_keeps_first_seen(user_log):
+    async def run():
+        user_log.record(user(1))
+        await user_log.flush()
+        first = rows(user_log)[0]
+        await asyncio.sleep(0.01)
+        user_log.record(user(1, "renamed"))
+        await user_log.flush()
+        return first, rows(user_log)
+
+    first, after = asyncio.run(run())
+    assert len(after) == 1
+    user_id, username, first_seen, last_seen = after[0]
+    assert (user_id, username, first_seen) == (1, "renamed", first[2])
+    assert last_seen > first[3]
+
+
+def test_periodic_flush(user_log):
+    async def run():
+        task = asyncio.create_task(user_log.run_periodic_flush())
+        user_log.record(user(7))
+        await asyncio.sleep(0.15)
+        task.cancel()
+
+    asyncio.run(run())
+    assert [row[0] for row in rows(user_log)] == [7]
+
+
+def test_failed_flush_keeps_buffer(user_log):
+    user_log.execute("DROP TABLE users")
+
+    async def run():
+        user_log.record(user(1))
+        with pytest.raises(sqlite3.OperationalError):
+            await user_log.flush()
+
+    asyncio.run(run())
+    assert list(user_log._pending) == [1]
+
+
+def test_close(tmp_path):
+    log = UserLog(str(tmp_path / "users.db"))
+    log.execute(CREATE_USERS_TABLE)
+    log.close()
+    with pytest.raises(sqlite3.ProgrammingError):
+        log.execute("SELECT 1")
@@ -1,11 +1,10 @@
-import asyncio # не знаю, вроде не испольузуется, поправьте меня
+import asyncio # фоновая запись пользователей в бд пачками
 import logging  # библа для логов, чтобы легче дебагать было
 from telegram import Update # сама библа для тг бота
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes # сама библа для тг бота
 import httpx
 from tg_bot_config import TELEGRAM_BOT_TOKEN, FASTAPI_URL # токены и прочее для связи
-import sqlite3 # первичная бд, где храним всякое, пока чисто юзеров
-from datetime import datetime # тип данных, где-то "рядом с" или "в" бд используется
+from tg_user_log import CREATE_USERS_TABLE, UserLog # учет пользователей в SQLite пачками
 
 # Настройка логирования
 logging.basicConfig(
@@ -16,67 +15,43 @@ logger = logging.getLogger(__name__)
 
 DB_NAME = 'bot_users.db'  # Имя файла базы
 
+user_log = None  # создается в init_db
+
+
 # Создание БД при первом запуске
-def init_db():  # создаём функцию для ну, для бд, инициализации бд
-    conn = sqlite3.connect(DB_NAME) # делаем подключение через функцию connect
-    cur = conn.cursor() 
-    # если есть файл с DB_NAME именем, то к нему подрубаемся, если нет, то новый делаем
+def init_db():
+    global user_log
+    user_log = UserLog(DB_NAME)
 
     # Проверяем, есть ли уже таблица
-    cur.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='users'")
-    table_exists = cur.fetchone() # курсор - это объект для выполнения sql команд
-    # как сказал дипсик, и к сожалению лучше я не скажу:
-    # если conn - это тоннель к бд, то cur это грузовик, который возит SQL запросы туда, и
-    # и результаты обратно
+    table_exists = user_log.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='users'")
 
-    if table_exists:  # если таблицы нет, то как бы да, чисто проверка
+    if table_exists:
         print(f"Таблица 'users' уже существует в {DB_NAME}")
     else:
         print(f"Создаю таблицу 'users' в {DB_NAME}")
-        cur.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                user_id INTEGER PRIMARY KEY,
-                username TEXT,
-                first_name TEXT,
-                last_name TEXT,
-                first_seen DATETIME,
-                last_seen DATETIME
-            )
-        ''')
-        conn.commit() # коммит - это физическая запись изменений на диск, на жёсткий полагаю, хз, типо наверн до этого оно хранится в оперативке
-        print("Таблица создана успешно") # тут выполняет SQL-запрос, для создания бд как видите
-    conn.close() # закрывает файловый дескриптор файла DB_NAME, освобождает память занятую объктом Connection
+        user_log.execute(CREATE_USERS_TABLE)
+        print("Таблица создана успешно")
 
 # чисто следить сколько вообще пользователей есть
-# Функция для записи/обновления пользователя
-def log_user(user):  # ну создаём функцию, в аргументе надо отправить Id Или чёто такое как видите
-    # курсор и коннект, как в прошлом буквально
-    conn = sqlite3.connect(DB_NAME)
-    cur = conn.cursor()
-    
-    # Проверяем, есть ли пользователь уже в базе
-    cur.execute('SELECT user_id FROM users WHERE user_id = ?', (user.id,)) # проверяем, мб он уже есть
-    exists = cur.fetchone() # получает первую строку или none
+# Функция для записи/обновления пользователя: только буфер в памяти, в базу пишет UserLog пачками
+def log_user(user):
+    user_log.record(user)
 
-    # логика обновления и вставки
-    
-    if exists:
-        # Обновляем время последнего визита
-        cur.execute('''
-            UPDATE users 
-            SET last_seen = ?, username = ?, first_name = ?, last_name = ?
-            WHERE user_id = ?
-        ''', (datetime.now(), user.username, user.first_name, user.last_name, user.id)) # дейтам время автоматом в строку сохраняет
-    else:
-        # Добавляем нового пользователя
-        cur.execute('''
-            INSERT INTO users (user_id, username, first_name, last_name, first_seen, last_seen)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (user.id, user.username, user.first_name, user.last_name, datetime.now(), datetime.now()))
-    
-    # ну комит клоуз в прошлом разбирали
-    conn.commit()
-    conn.close()
+async def post_init(application: Application):
+    """После запуска бота: фоновая запись пользователей."""
+    application.bot_data["user_log_flusher"] = asyncio.create_task(user_log.run_periodic_flush())
+
+async def post_shutdown(application: Application):
+    """При остановке: дописать буфер пользователей и закрыть базу."""
+    flusher = application.bot_data.pop("user_log_flusher", None)
+    if flusher is not None:
+        flusher.cancel()
+    try:
+        await user_log.flush()
+    finally:
+        # Даже если запись не удалась, соединение (и WAL) закрываем
+        user_log.close()
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик команды /start"""
@@ -335,6 +310,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):  #
     log_user(update.message.from_user) # тут вызывается функция связанна с бд
     # в аргументе как видите, мы берём из Update имя юзера и сохраняем
     # чисто сделано чтобы считать, сколько и кто юзает бота, без доп инфы, чисто имя
+    # в базу это попадет пачкой чуть позже (UserLog), ответ пользователю диск не ждет
 
 
 
@@ -356,7 +332,13 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):  #
 def main():
     """Запуск бота"""
     # Создаем приложение
-    application = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
+    application = (
+        Application.builder()
+        .token(TELEGRAM_BOT_TOKEN)
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+        .build()
+    )
     
     # Регистрируем обработчики команд
     application.add_handler(CommandHandler("start", start))
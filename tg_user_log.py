@@ -0,0 +1,122 @@
+"""
+Учет пользователей Telegram бота в SQLite.
+
+Активность пользователей копится в памяти и пишется в базу пачками:
+раз в BOT_USER_LOG_FLUSH_SECONDS секунд или при BOT_USER_LOG_BATCH_SIZE
+пользователях в буфере. Модуль не зависит от python-telegram-bot: record()
+принимает любой объект с полями id, username, first_name, last_name.
+
+Настройки окружения:
+    BOT_USER_LOG_FLUSH_SECONDS  — период записи буфера, с (по умолчанию 5)
+    BOT_USER_LOG_BATCH_SIZE     — пользователей в буфере до внеочередной записи (100)
+"""
+
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+USER_LOG_FLUSH_SECONDS = float(os.getenv("BOT_USER_LOG_FLUSH_SECONDS", "5"))
+USER_LOG_BATCH_SIZE = int(os.getenv("BOT_USER_LOG_BATCH_SIZE", "100"))
+
+CREATE_USERS_TABLE = '''
+    CREATE TABLE IF NOT EXISTS users (
+        user_id INTEGER PRIMARY KEY,
+        username TEXT,
+        first_name TEXT,
+        last_name TEXT,
+        first_seen DATETIME,
+        last_seen DATETIME
+    )
+'''
+
+# Один запрос и для нового пользователя, и для повторного визита; first_seen не перезаписывается
+UPSERT_USER = '''
+    INSERT INTO users (user_id, username, first_name, last_name, first_seen, last_seen)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT(user_id) DO UPDATE SET
+        username = excluded.username,
+        first_name = excluded.first_name,
+        last_name = excluded.last_name,
+        last_seen = excluded.last_seen
+'''
+
+
+class UserLog:
+    """
+    Учет пользователей бота.
+
+    Одно соединение с SQLite на весь процесс (WAL). record() только
+    обновляет буфер в памяти, повторные сообщения одного пользователя
+    схлопываются в одну запись. flush() пишет буфер одним executemany
+    с UPSERT в отдельном потоке, поэтому обработчики сообщений не ждут диск.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        batch_size: int = USER_LOG_BATCH_SIZE,
+        flush_seconds: float = USER_LOG_FLUSH_SECONDS
+    ):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._flush_task = None
+
+    def execute(self, sql, params=()):
+        with self._lock:
+            cur = self._conn.execute(sql, params)
+            rows = cur.fetchall()
+            self._conn.commit()
+            return rows
+
+    def record(self, user):
+        """Запомнить визит пользователя (без обращения к диску)."""
+        now = datetime.now()
+        previous = self._pending.get(user.id)
+        first_seen = previous[4] if previous else now
+        self._pending[user.id] = (user.id, user.username, user.first_name, user.last_name, first_seen, now)
+        # Буфер переполнен — пишем пачку, не дожидаясь таймера
+        if len(self._pending) >= self.batch_size and (self._flush_task is None or self._flush_task.done()):
+            self._flush_task = asyncio.get_running_loop().create_task(self.flush())
+
+    async def flush(self) -> int:
+        """Записать накопленных пользователей в базу, вернуть их число."""
+        if not self._pending:
+            return 0
+        rows, self._pending = list(self._pending.values()), {}
+        try:
+            await asyncio.to_thread(self._write, rows)
+        except Exception:
+            # Не теряем визиты: вернем в буфер, если пользователь не успел прийти снова
+            for row in rows:
+                self._pending.setdefault(row[0], row)
+            raise
+        return len(rows)
+
+    def _write(self, rows):
+        with self._lock:
+            self._conn.executemany(UPSERT_USER, rows)
+            self._conn.commit()
+
+    async def run_periodic_flush(self):
+        """Фоновая задача: сбрасывать буфер раз в flush_seconds секунд."""
+        while True:
+            await asyncio.sleep(self.flush_seconds)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Ошибка записи пользователей в {self.path}: {e}")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -1,11 +1,43 @@
-from .tool_create_cube import create_cube as tool_create_cube
-from .tool_create_cylinder import create_cylinder as tool_create_cylinder
-from .tool_create_shapes import create_shape as tool_create_shapes
-from .tool_create_sphere import create_sphere as tool_create_sphere
-from .tool_documents import get_documents as tool_documents
-from .tool_status import get_mcp_status as tool_status
-from .tool_open_document import open_document as tool_open_document
-from .tool_save_document import save_document as tool_save_document
-from .tool_close_document import close_document as tool_close_document
-from .tool_create_complex_shape import create_complex_shape as tool_create_complex_shape
-from .tool_test_shape import create_test_shape as tool_test_shape
\ No newline at end of file
+"""
+MCP инструменты CAD сервера.
+
+Модули инструментов импортируются лениво (PEP 562): `from tools import
+http_client` не тянет fastmcp и регистрацию инструментов, а
+`from tools import tool_create_cube` загружает только нужный модуль.
+register_all() импортирует все инструменты и регистрирует их в mcp.
+"""
+
+import importlib
+
+# Имя в пакете -> (модуль, функция инструмента)
+_TOOLS = {
+    "tool_create_cube": ("tool_create_cube", "create_cube"),
+    "tool_create_cylinder": ("tool_create_cylinder", "create_cylinder"),
+    "tool_create_shapes": ("tool_create_shapes", "create_shape"),
+    "tool_create_sphere": ("tool_create_sphere", "create_sphere"),
+    "tool_documents": ("tool_documents", "get_documents"),
+    "tool_status": ("tool_status", "get_mcp_status"),
+    "tool_open_document": ("tool_open_document", "open_document"),
+    "tool_save_document": ("tool_save_document", "save_document"),
+    "tool_close_document": ("tool_close_document", "close_document"),
+    "tool_create_complex_shape": ("tool_create_complex_shape", "create_complex_shape"),
+    "tool_test_shape": ("tool_test_shape", "create_test_shape"),
+    "tool_run_cad_script": ("tool_run_cad_script", "run_cad_script"),
+}
+
+__all__ = list(_TOOLS) + ["register_all"]
+
+
+def __getattr__(name):
+    if name not in _TOOLS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    module_name, attr = _TOOLS[name]
+    value = getattr(importlib.import_module(f".{module_name}", __name__), attr)
+    globals()[name] = value
+    return value
+
+
+def register_all():
+    """Импортировать все инструменты (декораторы регистрируют их в mcp)."""
+    for name in _TOOLS:
+        __getattr__(name)
@@ -0,0 +1,319 @@
+"""
+Общий клиент MCP инструментов для запросов к FastAPI.
+
+Если инструменты работают в одном процессе с gateway (main.py), запросы
+идут напрямую в сервисный слой cad_service без сокета и JSON. Иначе
+(отдельный MCP сервер, server.py) — по HTTP: один пул соединений
+с keep-alive на процесс вместо нового httpx.AsyncClient на каждый вызов,
+раздельные таймауты подключения и чтения, повторы с джиттером для
+идемпотентных запросов и circuit breaker: если FastAPI лежит,
+инструменты сразу получают ошибку, а не ждут таймаут каждый.
+
+Настройки окружения:
+    CAD_API_URL                 — адрес FastAPI (по умолчанию http://localhost:8001)
+    CAD_HTTP_MAX_CONNECTIONS    — максимум соединений в пуле (100)
+    CAD_HTTP_MAX_KEEPALIVE      — максимум keep-alive соединений (20)
+    CAD_HTTP_CONNECT_TIMEOUT    — таймаут подключения, с (2)
+    CAD_HTTP_READ_TIMEOUT       — таймаут чтения ответа, с (30)
+    CAD_HTTP_RETRIES            — число повторов (2)
+    CAD_HTTP_RETRY_BACKOFF      — базовая пауза перед повтором, с (0.1)
+    CAD_BREAKER_FAILURES        — подряд неудач до размыкания (5)
+    CAD_BREAKER_RESET_SECONDS   — через сколько секунд пробовать снова (10)
+    CAD_INPROCESS               — 0, чтобы всегда ходить по HTTP (по умолчанию 1)
+"""
+
+import asyncio
+import inspect
+import os
+import random
+import time
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Dict, Optional
+
+from middleware.custom_middleware import inject_request_id
+from tracing import trace_request_start, trace_request_end, trace_request_error, start_span
+
+if TYPE_CHECKING:
+    # httpx нужен только для HTTP режима — импортируется при первом запросе
+    import httpx
+
+CAD_API_URL = os.getenv("CAD_API_URL", "http://localhost:8001")
+HTTP_MAX_CONNECTIONS = int(os.getenv("CAD_HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("CAD_HTTP_MAX_KEEPALIVE", "20"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("CAD_HTTP_CONNECT_TIMEOUT", "2"))
+HTTP_READ_TIMEOUT = float(os.getenv("CAD_HTTP_READ_TIMEOUT", "30"))
+HTTP_RETRIES = int(os.getenv("CAD_HTTP_RETRIES", "2"))
+HTTP_RETRY_BACKOFF = float(os.getenv("CAD_HTTP_RETRY_BACKOFF", "0.1"))
+BREAKER_FAILURES = int(os.getenv("CAD_BREAKER_FAILURES", "5"))
+BREAKER_RESET_SECONDS = float(os.getenv("CAD_BREAKER_RESET_SECONDS", "10"))
+INPROCESS_ENABLED = os.getenv("CAD_INPROCESS", "1") == "1"
+
+# Ответы, после которых имеет смысл повторить идемпотентный запрос
+_RETRYABLE_STATUSES = {502, 503, 504}
+
+
+class CircuitOpenError(RuntimeError):
+    """FastAPI недоступен: circuit breaker разомкнут, запрос не отправлялся."""
+
+
+class APIError(Exception):
+    """Gateway вернул ошибку (HTTP статус >= 400 или ошибка сервисного слоя)."""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(f"{status_code} - {detail}")
+        self.status_code = status_code
+        self.detail = detail
+
+
+class CircuitBreaker:
+    """
+    Простой circuit breaker: closed -> open после N неудач подряд,
+    через reset_timeout пропускает один пробный запрос (half-open).
+    """
+
+    def __init__(self, failure_threshold: int = BREAKER_FAILURES, reset_timeout: float = BREAKER_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def before_request(self) -> bool:
+        """Пропустить запрос (True — это пробный запрос) или поднять CircuitOpenError."""
+        state = self.state
+        if state == "closed":
+            return False
+        if state == "half-open":
+            if not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            raise CircuitOpenError(
+                f"FastAPI недоступен ({CAD_API_URL}), выполняется пробный запрос — повторите позже"
+            )
+        retry_in = max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+        raise CircuitOpenError(
+            f"FastAPI недоступен ({CAD_API_URL}), запросы приостановлены еще на {retry_in:.1f} с"
+        )
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+
+    def release_trial(self):
+        """Пробный запрос завершился без результата — следующий запрос станет пробным."""
+        self._trial_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._trial_in_flight = False
+        if self.failures >= self.failure_threshold or self.opened_at is not None:
+            self.opened_at = time.monotonic()
+
+
+breaker = CircuitBreaker()
+
+_client: Optional["httpx.AsyncClient"] = None
+_client_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def get_client() -> "httpx.AsyncClient":
+    """
+    Общий клиент для текущего event loop.
+
+    Соединения пула привязаны к loop, поэтому при вызове из другого loop
+    (например, из asyncio.run в скрипте) создается новый клиент.
+    """
+    import httpx
+
+    global _client, _client_loop
+    loop = asyncio.get_running_loop()
+    if _client is None or _client.is_closed or _client_loop is not loop:
+        _client = httpx.AsyncClient(
+            base_url=CAD_API_URL,
+            timeout=httpx.Timeout(HTTP_READ_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE
+            ),
+            event_hooks={
+                "request": [inject_request_id, trace_request_start],
+                "response": [trace_request_end]
+            }
+        )
+        _client_loop = loop
+    return _client
+
+
+async def aclose_client():
+    """Закрыть общий клиент (при остановке сервера)."""
+    global _client, _client_loop
+    if _client is not None and not _client.is_closed:
+        await _client.aclose()
+    _client, _client_loop = None, None
+
+
+def _backoff(attempt: int) -> float:
+    # Экспоненциальная пауза с полным джиттером, чтобы повторы не шли волной
+    return random.uniform(0, HTTP_RETRY_BACKOFF * (2 ** attempt))
+
+
+async def api_request(
+    method: str,
+    path: str,
+    params: Optional[Dict[str, Any]] = None,
+    json: Optional[Dict[str, Any]] = None,
+    *,
+    idempotent: bool = False
+) -> "httpx.Response":
+    """
+    Запрос к FastAPI через общий пул соединений.
+
+    Args:
+        method: HTTP метод (GET, POST)
+        path: Путь эндпоинта, например /api/cad/create-shape
+        params: Query-параметры
+        json: Тело запроса (для POST)
+        idempotent: Можно ли безопасно повторить запрос после таймаута
+            или 502/503/504. Неидемпотентные запросы повторяются только
+            при ошибке подключения, когда запрос заведомо не дошел до сервера.
+
+    Returns:
+        httpx.Response (raise_for_status вызывает вызывающий код)
+
+    Raises:
+        CircuitOpenError: FastAPI признан недоступным, запрос не отправлялся
+        httpx.HTTPError: сетевая ошибка после всех повторов
+    """
+    import httpx
+
+    attempt = 0
+    while True:
+        trial = breaker.before_request()
+        try:
+            client = get_client()
+            request = client.build_request(method, path, params=params, json=json)
+            try:
+                response = await client.send(request)
+            except BaseException as e:
+                # Хук ответа не сработает — клиентский спан закрываем здесь
+                trace_request_error(request, e)
+                if not isinstance(e, httpx.TransportError):
+                    raise
+                breaker.record_failure()
+                safe_to_retry = idempotent or isinstance(e, httpx.ConnectError)
+                if not safe_to_retry or attempt >= HTTP_RETRIES or breaker.state == "open":
+                    raise
+            else:
+                if response.status_code in _RETRYABLE_STATUSES:
+                    breaker.record_failure()
+                    if not idempotent or attempt >= HTTP_RETRIES or breaker.state == "open":
+                        return response
+                else:
+                    breaker.record_success()
+                    return response
+        finally:
+            # Попытка без результата (отмена, ошибка до отправки) не должна
+            # оставить breaker в half-open навсегда
+            if trial:
+                breaker.release_trial()
+        await asyncio.sleep(_backoff(attempt))
+        attempt += 1
+
+
+# Сервисный слой gateway этого процесса: путь -> async функция и loop,
+# в котором gateway работает с FreeCAD. Регистрирует main.py при старте.
+_local_routes: Dict[str, Callable[..., Awaitable[Dict[str, Any]]]] = {}
+_local_signatures: Dict[str, inspect.Signature] = {}
+_local_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def bind_local_gateway(routes: Dict[str, Callable[..., Awaitable[Dict[str, Any]]]], loop: asyncio.AbstractEventLoop):
+    """Включить прямые вызовы сервисного слоя для инструментов этого процесса."""
+    global _local_routes, _local_signatures, _local_loop
+    _local_routes = dict(routes)
+    # Сигнатуры для проверки аргументов, как это делает FastAPI (422)
+    _local_signatures = {path: inspect.signature(handler) for path, handler in _local_routes.items()}
+    _local_loop = loop
+
+
+def unbind_local_gateway():
+    """Выключить прямые вызовы (gateway остановлен)."""
+    global _local_routes, _local_signatures, _local_loop
+    _local_routes = {}
+    _local_signatures = {}
+    _local_loop = None
+
+
+def is_local(path: str) -> bool:
+    """Пойдет ли запрос к path в сервисный слой напрямую."""
+    return INPROCESS_ENABLED and _local_loop is not None and not _local_loop.is_closed() and path in _local_routes
+
+
+async def _call_local(path: str, arguments: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    from cad_service import CADServiceError
+
+    handler = _local_routes[path]
+    kwargs = {k: v for k, v in (arguments or {}).items() if v is not None}
+    try:
+        _local_signatures[path].bind(**kwargs)
+    except TypeError as e:
+        # Неизвестный или недостающий параметр — то же, что 422 от FastAPI.
+        # TypeError из самого сервисного слоя — ошибка сервера, он не перехватывается
+        raise APIError(422, str(e)) from None
+
+    async def run():
+        with start_span(f"cad_service {path}", attributes={"inprocess": True}):
+            try:
+                return await handler(**kwargs)
+            except CADServiceError as e:
+                raise APIError(e.status_code, e.detail) from None
+
+    if asyncio.get_running_loop() is _local_loop:
+        return await run()
+    # FreeCAD не потокобезопасен: все операции выполняются в loop gateway,
+    # как и при вызове по HTTP. Контекст (request id, спан) переносится в задачу.
+    future = asyncio.run_coroutine_threadsafe(run(), _local_loop)
+    return await asyncio.wrap_future(future)
+
+
+def _error_detail(response: "httpx.Response") -> str:
+    try:
+        detail = response.json().get("detail")
+    except Exception:
+        detail = None
+    return detail if isinstance(detail, str) else response.text
+
+
+async def api_call(
+    path: str,
+    params: Optional[Dict[str, Any]] = None,
+    *,
+    json: Optional[Dict[str, Any]] = None,
+    idempotent: bool = False
+) -> Dict[str, Any]:
+    """
+    Вызвать эндпоинт gateway и получить JSON ответа.
+
+    С json отправляется POST, иначе GET с params. В процессе gateway
+    вызывает сервисный слой напрямую, иначе идет по HTTP через api_request
+    (пул соединений, повторы, circuit breaker).
+
+    Raises:
+        APIError: gateway ответил ошибкой
+        CircuitOpenError, httpx.HTTPError: gateway недоступен
+    """
+    if is_local(path):
+        return await _call_local(path, json if json is not None else params)
+    method = "POST" if json is not None else "GET"
+    response = await api_request(method, path, params=params, json=json, idempotent=idempotent)
+    if response.is_error:
+        raise APIError(response.status_code, _error_detail(response))
+    return response.json()
@@ -1,9 +1,9 @@
-import httpx
 from fastmcp import Context
 from pydantic import Field
 from mcp.types import TextContent
 from mcp_instance import mcp
 from .utils import ToolResult
+from .http_client import api_call, APIError
 
 @mcp.tool(
     name="close_document",
@@ -33,21 +33,18 @@ async def close_document(
         await ctx.info("🚪 Закрываем документ")
     
     try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.get("http://localhost:8001/api/cad/close-document")
-            response.raise_for_status()
-            data = response.json()
+        data = await api_call("/api/cad/close-document")
             
-            if ctx:
-                await ctx.info("✅ Документ закрыт успешно")
+        if ctx:
+            await ctx.info("✅ Документ закрыт успешно")
             
-            return ToolResult(
-                content=[TextContent(type="text", text=data.get("result", "успешно"))],
-                structured_content=data,
-                meta={"status": "success"}
-            )
-    except httpx.HTTPStatusError as e:
-        error_msg = f"HTTP ошибка: {e.response.status_code} - {e.response.text}"
+        return ToolResult(
+            content=[TextContent(type="text", text=data.get("result", "успешно"))],
+            structured_content=data,
+            meta={"status": "success"}
+        )
+    except APIError as e:
+        error_msg = f"HTTP ошибка: {e.status_code} - {e.detail}"
         if ctx:
             await ctx.error(f"❌ {error_msg}")
         return ToolResult(
@@ -1,11 +1,11 @@
 """Инструмент для создания сложной 3D-фигуры в CAD системе."""
 
-import httpx
 from fastmcp import Context
 from pydantic import Field
 from mcp.types import TextContent
 from mcp_instance import mcp
 from .utils import ToolResult
+from .http_client import api_call, APIError
 
 async def _create_complex_shape_impl(
     shape_type: str,
@@ -180,34 +180,31 @@ async def _create_complex_shape_impl(
         await ctx.info(f"🔧 Параметры: {params}")
     
     try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.get(
-                "http://localhost:8001/api/cad/create-complex-shape",
-                params=params
-            )
-            response.raise_for_status()
-            data = response.json()
+        data = await api_call(
+            "/api/cad/create-complex-shape",
+            params=params
+        )
             
-            if ctx:
-                await ctx.info("✅ Сложная фигура создана успешно")
+        if ctx:
+            await ctx.info("✅ Сложная фигура создана успешно")
             
-            result_text = (
-                f"✅ Сложная фигура создана успешно!\n"
-                f"📐 Тип: {data.get('parameters', {}).get('shape_type', 'неизвестно')}\n"
-                f"🎯 Результат: {data.get('result', 'успешно')}"
-            )
+        result_text = (
+            f"✅ Сложная фигура создана успешно!\n"
+            f"📐 Тип: {data.get('parameters', {}).get('shape_type', 'неизвестно')}\n"
+            f"🎯 Результат: {data.get('result', 'успешно')}"
+        )
             
-            return ToolResult(
-                content=[TextContent(type="text", text=result_text)],
-                structured_content=data,
-                meta={
-                    "shape_type": shape_type,
-                    "status": "success"
-                }
-            )
+        return ToolResult(
+            content=[TextContent(type="text", text=result_text)],
+            structured_content=data,
+            meta={
+                "shape_type": shape_type,
+                "status": "success"
+            }
+        )
             
-    except httpx.HTTPStatusError as e:
-        error_msg = f"HTTP ошибка: {e.response.status_code} - {e.response.text}"
+    except APIError as e:
+        error_msg = f"HTTP ошибка: {e.status_code} - {e.detail}"
         if ctx:
             await ctx.error(f"❌ {error_msg}")
         return ToolResult(
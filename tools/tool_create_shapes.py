@@ -1,11 +1,11 @@
 """Инструмент для создания 3D-фигуры в CAD системе с указанными координатами."""
 
-import httpx
 from fastmcp import Context
 from pydantic import Field
 from mcp.types import TextContent
 from mcp_instance import mcp
 from .utils import ToolResult, validate_shape_type, validate_size
+from .http_client import api_call, APIError
 
 async def _create_shape_impl(
     shape_type: str,
@@ -57,47 +57,44 @@ async def _create_shape_impl(
         await ctx.info(f"🔧 Параметры: тип={shape_type}, размер={size}мм, координаты=({x}, {y}, {z})")
     
     try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            params = {
-                "shape_type": shape_type.lower(), 
+        params = {
+            "shape_type": shape_type.lower(), 
+            "size": size,
+            "x": x,
+            "y": y,
+            "z": z
+        }
+        data = await api_call(
+            "/api/cad/create-shape",
+            params=params
+        )
+            
+        if ctx:
+            await ctx.info("✅ Фигура создана успешно")
+            
+        result_text = (
+            f"✅ Фигура создана успешно!\n"
+            f"📐 Тип: {data.get('parameters', {}).get('shape_type', 'неизвестно')}\n"
+            f"📏 Размер: {data.get('parameters', {}).get('size', 'неизвестно')} мм\n"
+            f"📍 Координаты: ({x}, {y}, {z}) мм\n"
+            f"🎯 Результат: {data.get('result', 'успешно')}"
+        )
+            
+        return ToolResult(
+            content=[TextContent(type="text", text=result_text)],
+            structured_content=data,
+            meta={
+                "shape_type": shape_type,
                 "size": size,
                 "x": x,
                 "y": y,
-                "z": z
+                "z": z,
+                "status": "success"
             }
-            response = await client.get(
-                "http://localhost:8001/api/cad/create-shape",
-                params=params
-            )
-            response.raise_for_status()
-            data = response.json()
-            
-            if ctx:
-                await ctx.info("✅ Фигура создана успешно")
-            
-            result_text = (
-                f"✅ Фигура создана успешно!\n"
-                f"📐 Тип: {data.get('parameters', {}).get('shape_type', 'неизвестно')}\n"
-                f"📏 Размер: {data.get('parameters', {}).get('size', 'неизвестно')} мм\n"
-                f"📍 Координаты: ({x}, {y}, {z}) мм\n"
-                f"🎯 Результат: {data.get('result', 'успешно')}"
-            )
-            
-            return ToolResult(
-                content=[TextContent(type="text", text=result_text)],
-                structured_content=data,
-                meta={
-                    "shape_type": shape_type,
-                    "size": size,
-                    "x": x,
-                    "y": y,
-                    "z": z,
-                    "status": "success"
-                }
-            )
+        )
             
-    except httpx.HTTPStatusError as e:
-        error_msg = f"HTTP ошибка: {e.response.status_code} - {e.response.text}"
+    except APIError as e:
+        error_msg = f"HTTP ошибка: {e.status_code} - {e.detail}"
         if ctx:
             await ctx.error(f"❌ {error_msg}")
         
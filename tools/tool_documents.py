@@ -6,6 +6,7 @@ from pydantic import Field
 from mcp.types import TextContent
 from mcp_instance import mcp
 from .utils import ToolResult
+from .http_client import api_call
 
 @mcp.tool(
     name="get_documents",
@@ -26,31 +27,26 @@ async def get_documents(
     Returns:
         ToolResult: Результат выполнения инструмента
     """
-    import httpx
-    
     if ctx:
         await ctx.info("🔍 Получаем список документов из CAD системы")
     
     try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.get("http://localhost:8001/api/cad/documents")
-            response.raise_for_status()
-            data = response.json()
+        data = await api_call("/api/cad/documents", idempotent=True)
             
-            documents = data.get('result', [])
-            formatted_result = f"📋 Найдено документов: {len(documents)}\n\n"
+        documents = data.get('result', [])
+        formatted_result = f"📋 Найдено документов: {len(documents)}\n\n"
             
-            for doc in documents:
-                formatted_result += f"• {doc}\n"
+        for doc in documents:
+            formatted_result += f"• {doc}\n"
             
-            if ctx:
-                await ctx.info(f"✅ Получено {len(documents)} документов")
+        if ctx:
+            await ctx.info(f"✅ Получено {len(documents)} документов")
             
-            return ToolResult(
-                content=[TextContent(type="text", text=formatted_result)],
-                structured_content={"documents": documents},
-                meta={"count": len(documents)}
-            )
+        return ToolResult(
+            content=[TextContent(type="text", text=formatted_result)],
+            structured_content={"documents": documents},
+            meta={"count": len(documents)}
+        )
             
     except Exception as e:
         error_msg = f"Ошибка при получении документов: {str(e)}"
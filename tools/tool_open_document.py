@@ -1,11 +1,11 @@
 """Инструмент для открытия документа в CAD системе."""
 
-import httpx
 from fastmcp import Context
 from pydantic import Field
 from mcp.types import TextContent
 from mcp_instance import mcp
 from .utils import ToolResult
+from .http_client import api_call, APIError
 
 @mcp.tool(
     name="open_document",
@@ -53,25 +53,23 @@ async def open_document(
         await ctx.info(f"📂 Открываем или создаем документ: {file_path}")
     
     try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            params = {"file_path": file_path}
-            response = await client.get(
-                "http://localhost:8001/api/cad/open-document",
-                params=params
-            )
-            response.raise_for_status()
-            data = response.json()
+        params = {"file_path": file_path}
+        data = await api_call(
+            "/api/cad/open-document",
+            params=params,
+            idempotent=True
+        )
             
-            if ctx:
-                await ctx.info("✅ Документ открыт или создан успешно")
+        if ctx:
+            await ctx.info("✅ Документ открыт или создан успешно")
             
-            return ToolResult(
-                content=[TextContent(type="text", text=data.get("result", "успешно"))],
-                structured_content=data,
-                meta={"status": "success", "file_path": file_path}
-            )
-    except httpx.HTTPStatusError as e:
-        error_msg = f"HTTP ошибка: {e.response.status_code} - {e.response.text}"
+        return ToolResult(
+            content=[TextContent(type="text", text=data.get("result", "успешно"))],
+            structured_content=data,
+            meta={"status": "success", "file_path": file_path}
+        )
+    except APIError as e:
+        error_msg = f"HTTP ошибка: {e.status_code} - {e.detail}"
         if ctx:
             await ctx.error(f"❌ {error_msg}")
         return ToolResult(
@@ -0,0 +1,107 @@
+"""Инструмент для выполнения сценария CAD операций за один вызов."""
+
+from typing import Any, Dict, List
+from fastmcp import Context
+from pydantic import Field
+from mcp.types import TextContent
+from mcp_instance import mcp
+from .utils import ToolResult
+from .http_client import api_call, APIError
+
+STATUS_ICONS = {"ok": "✅", "error": "❌", "skipped": "⏭️"}
+
+@mcp.tool(
+    name="run_cad_script",
+    description="""
+    Выполнить список CAD операций за один вызов как одну транзакцию.
+    Используйте вместо цепочки open_document -> create_* -> save_document -> close_document.
+    Каждая операция — объект с полем "op":
+    - {"op": "open", "file_path": "part.FCStd"} — только первым шагом
+    - {"op": "create", "shape_type": "cube|sphere|cylinder", "size": 10, "x": 0, "y": 0, "z": 0, "name": "base"}
+    - {"op": "create", "shape_type": "star|gear|torus", ...параметры как у create_complex_shape, "name": "star"}
+    - {"op": "boolean", "operation": "fuse|cut|common", "base": "base", "tool": "hole", "name": "result"}
+    - {"op": "pattern", "source": "hole", "kind": "linear", "count": 4, "step": [20, 0, 0]}
+    - {"op": "pattern", "source": "hole", "kind": "polar", "count": 6, "angle": 360, "center": [0, 0, 0]}
+      копии pattern доступны как <source>_<kind><i>: hole_linear1, hole_linear2, ...
+    - {"op": "save", "file_path": "part.FCStd"}
+    - {"op": "export", "file_path": "part.step"} — .step/.stp/.stl, по умолчанию все фигуры
+    - {"op": "close"}
+    На объекты ссылаются по "name", заданному при создании.
+    Шаги выполняются по порядку: save/export записывают модель в состоянии на этом шаге.
+    Если шаг падает до первой записи (save/export), все изменения сценария откатываются.
+    Возвращает результат каждого шага.
+    """
+)
+async def run_cad_script(
+    operations: List[Dict[str, Any]] = Field(
+        ...,
+        description="Упорядоченный список операций (open, create, boolean, pattern, save, export, close)"
+    ),
+    ctx: Context = None
+) -> ToolResult:
+    """
+    Выполнить сценарий CAD операций на сервере одной транзакцией.
+
+    Args:
+        operations: Список операций, каждая — словарь с полем "op"
+        ctx: Контекст для логирования
+
+    Returns:
+        ToolResult: Итог сценария и результаты по шагам
+
+    Валидация: Структуру сценария проверяет сервер до выполнения первого шага.
+    Обработка ошибок: Ошибка шага до первой записи на диск откатывает весь
+    сценарий, остальные шаги помечаются как пропущенные.
+    """
+    if not operations:
+        error_msg = "Ошибка: сценарий пуст"
+        if ctx:
+            await ctx.error(f"❌ {error_msg}")
+        return ToolResult(
+            content=[TextContent(type="text", text=error_msg)],
+            structured_content={"error": "empty_script"},
+            meta={"status": "validation_error"}
+        )
+
+    if ctx:
+        await ctx.info(f"📜 Выполняем сценарий из {len(operations)} шагов")
+
+    try:
+        data = await api_call("/api/cad/run-script", json={"operations": operations})
+
+        lines = [f"{STATUS_ICONS.get(step['status'], '•')} {step['step']}. {step['op']}: "
+                 f"{step.get('result') or step.get('error') or step['status']}"
+                 for step in data.get("steps", [])]
+        result_text = "\n".join([("✅ " if data.get("success") else "❌ ") + data.get("result", "")] + lines)
+        if data.get("rolled_back"):
+            result_text += "\n↩️ Изменения сценария откачены"
+
+        if ctx:
+            if data.get("success"):
+                await ctx.info("✅ Сценарий выполнен успешно")
+            else:
+                await ctx.error(f"❌ {data.get('result')}")
+
+        return ToolResult(
+            content=[TextContent(type="text", text=result_text)],
+            structured_content=data,
+            meta={"status": "success" if data.get("success") else "script_error"}
+        )
+    except APIError as e:
+        error_msg = f"HTTP ошибка: {e.status_code} - {e.detail}"
+        if ctx:
+            await ctx.error(f"❌ {error_msg}")
+        return ToolResult(
+            content=[TextContent(type="text", text=error_msg)],
+            structured_content={"error": str(e)},
+            meta={"status": "http_error"}
+        )
+    except Exception as e:
+        error_msg = f"Ошибка при выполнении сценария: {str(e)}"
+        if ctx:
+            await ctx.error(f"❌ {error_msg}")
+        return ToolResult(
+            content=[TextContent(type="text", text=error_msg)],
+            structured_content={"error": str(e)},
+            meta={"status": "error"}
+        )
@@ -1,9 +1,9 @@
-import httpx
 from fastmcp import Context
 from pydantic import Field
 from mcp.types import TextContent
 from mcp_instance import mcp
 from .utils import ToolResult
+from .http_client import api_call, APIError
 
 @mcp.tool(
     name="save_document",
@@ -38,27 +38,25 @@ async def save_document(
         await ctx.info(f"💾 Сохраняем документ{' как ' + file_path if file_path else ''}")
     
     try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            params = {}
-            if file_path:
-                params["file_path"] = file_path
-            response = await client.get(
-                "http://localhost:8001/api/cad/save-document",
-                params=params
-            )
-            response.raise_for_status()
-            data = response.json()
+        params = {}
+        if file_path:
+            params["file_path"] = file_path
+        data = await api_call(
+            "/api/cad/save-document",
+            params=params,
+            idempotent=True
+        )
             
-            if ctx:
-                await ctx.info("✅ Документ сохранен успешно")
+        if ctx:
+            await ctx.info("✅ Документ сохранен успешно")
             
-            return ToolResult(
-                content=[TextContent(type="text", text=data.get("result", "успешно"))],
-                structured_content=data,
-                meta={"status": "success", "file_path": file_path}
-            )
-    except httpx.HTTPStatusError as e:
-        error_msg = f"HTTP ошибка: {e.response.status_code} - {e.response.text}"
+        return ToolResult(
+            content=[TextContent(type="text", text=data.get("result", "успешно"))],
+            structured_content=data,
+            meta={"status": "success", "file_path": file_path}
+        )
+    except APIError as e:
+        error_msg = f"HTTP ошибка: {e.status_code} - {e.detail}"
         if ctx:
             await ctx.error(f"❌ {error_msg}")
         return ToolResult(
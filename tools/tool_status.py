@@ -6,6 +6,7 @@ from pydantic import Field
 from mcp.types import TextContent
 from mcp_instance import mcp
 from .utils import ToolResult
+from .http_client import api_call, CAD_API_URL
 
 @mcp.tool(
     name="get_mcp_status",
@@ -25,33 +26,28 @@ async def get_mcp_status(
     Returns:
         ToolResult: Результат выполнения инструмента
     """
-    import httpx
-    
     if ctx:
         await ctx.info("📊 Запрашиваем статус MCP сервера")
     
     try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.get("http://localhost:8001/api/mcp/status")
-            response.raise_for_status()
-            data = response.json()
+        data = await api_call("/api/mcp/status", idempotent=True)
             
-            tools_list = "\n".join([f"  - {tool}" for tool in data.get("tools", [])])
-            result_text = (f"📊 Статус MCP сервера:\n"
-                          f"Состояние: {data.get('status', 'unknown')}\n"
-                          f"Доступные инструменты:\n{tools_list}")
+        tools_list = "\n".join([f"  - {tool}" for tool in data.get("tools", [])])
+        result_text = (f"📊 Статус MCP сервера:\n"
+                      f"Состояние: {data.get('status', 'unknown')}\n"
+                      f"Доступные инструменты:\n{tools_list}")
             
-            if ctx:
-                await ctx.info("✅ Статус получен успешно")
+        if ctx:
+            await ctx.info("✅ Статус получен успешно")
             
-            return ToolResult(
-                content=[TextContent(type="text", text=result_text)],
-                structured_content=data,
-                meta={"status": "success"}
-            )
+        return ToolResult(
+            content=[TextContent(type="text", text=result_text)],
+            structured_content=data,
+            meta={"status": "success"}
+        )
             
     except Exception as e:
-        error_text = f"Не удалось получить статус: {str(e)}\nУбедитесь, что FastAPI сервер запущен на http://localhost:8001"
+        error_text = f"Не удалось получить статус: {str(e)}\nУбедитесь, что FastAPI сервер запущен на {CAD_API_URL}"
         if ctx:
             await ctx.error(f"❌ {error_text}")
         
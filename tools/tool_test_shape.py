@@ -1,13 +1,11 @@
 """Тестовый инструмент для создания 3D-фигуры и сохранения в файл."""
 
-import httpx
-import tempfile
-import os
 from fastmcp import Context
 from pydantic import Field
 from mcp.types import TextContent
 from mcp_instance import mcp
 from .utils import ToolResult, validate_shape_type, validate_size
+from .http_client import api_call, APIError
 
 async def _create_test_shape_impl(
     shape_type: str = "cube",
@@ -69,86 +67,78 @@ async def _create_test_shape_impl(
     
     try:
         # 1. Открываем/создаем документ
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            # Открываем или создаем документ
-            open_response = await client.get(
-                "http://localhost:8001/api/cad/open-document",
-                params={"file_path": file_name}
-            )
-            open_response.raise_for_status()
-            open_result = open_response.json()
+        open_result = await api_call(
+            "/api/cad/open-document",
+            params={"file_path": file_name},
+            idempotent=True
+        )
             
-            if ctx:
-                await ctx.info(f"📄 Документ: {open_result.get('result', 'открыт/создан')}")
+        if ctx:
+            await ctx.info(f"📄 Документ: {open_result.get('result', 'открыт/создан')}")
             
-            # 2. Создаем фигуру
-            params = {
-                "shape_type": shape_type.lower(), 
-                "size": size,
-                "x": x,
-                "y": y,
-                "z": z
-            }
-            create_response = await client.get(
-                "http://localhost:8001/api/cad/create-shape",
-                params=params
-            )
-            create_response.raise_for_status()
-            create_data = create_response.json()
+        # 2. Создаем фигуру
+        params = {
+            "shape_type": shape_type.lower(), 
+            "size": size,
+            "x": x,
+            "y": y,
+            "z": z
+        }
+        create_data = await api_call(
+            "/api/cad/create-shape",
+            params=params
+        )
             
-            # 3. Сохраняем документ
-            save_response = await client.get(
-                "http://localhost:8001/api/cad/save-document",
-                params={"file_path": file_name}
-            )
-            save_response.raise_for_status()
-            save_result = save_response.json()
+        # 3. Сохраняем документ
+        save_result = await api_call(
+            "/api/cad/save-document",
+            params={"file_path": file_name},
+            idempotent=True
+        )
             
-            # 4. Закрываем документ
-            close_response = await client.get(
-                "http://localhost:8001/api/cad/close-document"
-            )
-            close_response.raise_for_status()
-            close_result = close_response.json()
+        # 4. Закрываем документ
+        close_result = await api_call(
+            "/api/cad/close-document"
+        )
             
-            if ctx:
-                await ctx.info("✅ Тестовая фигура создана и сохранена успешно")
+        if ctx:
+            await ctx.info("✅ Тестовая фигура создана и сохранена успешно")
             
-            # Формируем итоговое сообщение
-            result_text = (
-                f"✅ Тестовая фигура создана и сохранена!\n"
-                f"📁 Файл: {file_name}\n"
-                f"📐 Тип фигуры: {shape_type}\n"
-                f"📏 Размер: {size} мм\n"
-                f"📍 Координаты: ({x}, {y}, {z}) мм\n"
-                f"📄 Результат открытия: {open_result.get('result', 'успешно')}\n"
-                f"🎯 Результат создания: {create_data.get('result', 'успешно')}\n"
-                f"💾 Результат сохранения: {save_result.get('result', 'успешно')}\n"
-                f"🚪 Результат закрытия: {close_result.get('result', 'успешно')}"
-            )
+        # Формируем итоговое сообщение
+        result_text = (
+            f"✅ Тестовая фигура создана и сохранена!\n"
+            f"📁 Файл: {file_name}\n"
+            f"📐 Тип фигуры: {shape_type}\n"
+            f"📏 Размер: {size} мм\n"
+            f"📍 Координаты: ({x}, {y}, {z}) мм\n"
+            f"📄 Результат открытия: {open_result.get('result', 'успешно')}\n"
+            f"🎯 Результат создания: {create_data.get('result', 'успешно')}\n"
+            f"💾 Результат сохранения: {save_result.get('result', 'успешно')}\n"
+            f"🚪 Результат закрытия: {close_result.get('result', 'успешно')}"
+        )
             
-            return ToolResult(
-                content=[TextContent(type="text", text=result_text)],
-                structured_content={
-                    "file_name": file_name,
-                    "shape_data": create_data,
-                    "open_result": open_result,
-                    "save_result": save_result,
-                    "close_result": close_result
-                },
-                meta={
-                    "shape_type": shape_type,
-                    "size": size,
-                    "x": x,
-                    "y": y,
-                    "z": z,
-                    "file_name": file_name,
-                    "status": "success"
-                }
-            )
+        return ToolResult(
+            content=[TextContent(type="text", text=result_text)],
+            structured_content={
+                "file_name": file_name,
+                "shape_data": create_data,
+                "open_result": open_result,
+                "save_result": save_result,
+                "close_result": close_result
+            },
+            meta={
+                "shape_type": shape_type,
+                "size": size,
+                "x": x,
+                "y": y,
+                "z": z,
+                "file_name": file_name,
+                "status": "success"
+            }
+        )
             
-    except httpx.HTTPStatusError as e:
-        error_msg = f"HTTP ошибка: {e.response.status_code} - {e.response.text}"
+    except APIError as e:
+        error_msg = f"HTTP ошибка: {e.status_code} - {e.detail}"
         if ctx:
             await ctx.error(f"❌ {error_msg}")
         
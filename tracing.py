@@ -0,0 +1,370 @@
+"""
+Сквозная трассировка запросов: агент -> MCP инструмент -> HTTP -> FastAPI -> FreeCADCore.
+
+Легковесная реализация без OpenTelemetry SDK: контекст передается через
+заголовок W3C `traceparent`, спаны пишутся фоновым потоком в файл
+JSON Lines (по спану на строку, поля в стиле OTLP JSON: traceId, spanId,
+parentSpanId, startTimeUnixNano, ...). Файл можно грузить в любой
+инструмент, понимающий OTLP JSON, или разбирать jq.
+
+Файл ротируется по размеру: при превышении TRACE_MAX_BYTES он
+переименовывается в spans.jsonl.1 (старые копии сдвигаются до
+TRACE_BACKUP_COUNT), так что трассировка не заполняет диск. Ошибки записи
+(нет прав, диск заполнен) пишутся в лог и не останавливают поток экспорта.
+
+Если трассировка выключена, спаны не создаются: start_span и new_span
+отдают пустой спан, traceparent не разбирается и не добавляется.
+
+Настройки окружения:
+    TRACING_ENABLED     — "1" включает запись спанов (по умолчанию "0")
+    TRACE_EXPORT_PATH   — путь к файлу (по умолчанию traces/spans.jsonl)
+    TRACE_MAX_BYTES     — размер файла до ротации, байт (по умолчанию 50 МБ)
+    TRACE_BACKUP_COUNT  — сколько старых файлов хранить (по умолчанию 3)
+"""
+
+import atexit
+import json
+import logging
+import os
+import queue
+import re
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Optional
+
+from metrics import add_operation_listener
+
+TRACEPARENT_HEADER = "traceparent"
+
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "0") == "1"
+TRACE_EXPORT_PATH = os.getenv("TRACE_EXPORT_PATH", os.path.join("traces", "spans.jsonl"))
+TRACE_MAX_BYTES = int(os.getenv("TRACE_MAX_BYTES", str(50 * 1024 * 1024)))
+TRACE_BACKUP_COUNT = int(os.getenv("TRACE_BACKUP_COUNT", "3"))
+
+logger = logging.getLogger(__name__)
+
+_TRACEPARENT_RE = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+
+class SpanContext:
+    """Идентификаторы спана, которые передаются между процессами."""
+
+    __slots__ = ("trace_id", "span_id")
+
+    def __init__(self, trace_id: str, span_id: str):
+        self.trace_id = trace_id
+        self.span_id = span_id
+
+    def to_traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+
+class Span:
+    """Один участок работы (HTTP запрос, вызов инструмента, операция FreeCAD)."""
+
+    __slots__ = ("name", "kind", "context", "parent_id", "start_ns", "end_ns", "attributes", "status")
+
+    def __init__(self, name: str, kind: str, trace_id: str, parent_id: Optional[str], start_ns: Optional[int] = None):
+        self.name = name
+        self.kind = kind
+        self.context = SpanContext(trace_id, secrets.token_hex(8))
+        self.parent_id = parent_id
+        self.start_ns = start_ns if start_ns is not None else time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes: Dict[str, Any] = {}
+        self.status = "OK"
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def record_error(self, error: BaseException):
+        self.status = "ERROR"
+        self.attributes["error.type"] = type(error).__name__
+        self.attributes["error.message"] = str(error)
+
+    def end(self, end_ns: Optional[int] = None):
+        if self.end_ns is not None:
+            return
+        self.end_ns = end_ns if end_ns is not None else time.time_ns()
+        _exporter.export(self)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "traceId": self.context.trace_id,
+            "spanId": self.context.span_id,
+            "parentSpanId": self.parent_id or "",
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": self.start_ns,
+            "endTimeUnixNano": self.end_ns,
+            "durationMs": round((self.end_ns - self.start_ns) / 1e6, 3),
+            "attributes": self.attributes,
+            "status": self.status,
+        }
+
+
+class _NoopSpan:
+    """Спан при выключенной трассировке: принимает вызовы и ничего не делает."""
+
+    __slots__ = ()
+
+    def set_attribute(self, key: str, value: Any):
+        pass
+
+    def record_error(self, error: BaseException):
+        pass
+
+    def end(self, end_ns: Optional[int] = None):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class _FileExporter:
+    """Пишет спаны в JSON Lines из фонового потока, не блокируя event loop."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._queue: "queue.Queue[Optional[Span]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def export(self, span: Span):
+        if not TRACING_ENABLED:
+            return
+        if self._thread is None:
+            self._start()
+        self._queue.put(span)
+
+    def _start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+            self._thread.start()
+            atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            span = self._queue.get()
+            batch = [span]
+            # Забираем всё, что успело накопиться, и пишем одной пачкой
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._write(batch)
+            except Exception as e:
+                # Спаны пачки теряются, но поток живет: иначе flush() при выходе ждал бы вечно
+                logger.error(f"Не удалось записать {len(batch)} спанов в {self.path}: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _write(self, batch):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._rotate_if_full()
+        lines = [
+            json.dumps(item.to_dict(), ensure_ascii=False, default=str) + "\n"
+            for item in batch if item is not None
+        ]
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.writelines(lines)
+
+    def _rotate_if_full(self):
+        # Как RotatingFileHandler: spans.jsonl -> .1 -> .2 ... старше TRACE_BACKUP_COUNT удаляются
+        try:
+            if os.path.getsize(self.path) < TRACE_MAX_BYTES:
+                return
+        except OSError:
+            return
+        if TRACE_BACKUP_COUNT <= 0:
+            os.remove(self.path)
+            return
+        for i in range(TRACE_BACKUP_COUNT - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{i}"):
+                os.replace(f"{self.path}.{i}", f"{self.path}.{i + 1}")
+        os.replace(self.path, f"{self.path}.1")
+
+    def flush(self):
+        """Дождаться записи всех накопленных спанов."""
+        if self._thread is not None:
+            self._queue.join()
+
+
+_exporter = _FileExporter(TRACE_EXPORT_PATH)
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+def flush():
+    """Дождаться записи всех спанов в файл."""
+    _exporter.flush()
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def new_span(name: str, kind: str, parent: Optional[SpanContext] = None, start_ns: Optional[int] = None) -> Span:
+    """
+    Создать спан, не делая его текущим (нужно закрыть вручную через span.end()).
+
+    Родитель по умолчанию — текущий спан. Используется там, где начало
+    и конец работы приходят разными callback'ами (httpx hooks, LangChain).
+    При выключенной трассировке возвращается пустой спан.
+    """
+    if not TRACING_ENABLED:
+        return _NOOP_SPAN
+    if parent is None:
+        active = _current_span.get()
+        parent = active.context if active is not None else None
+    if parent is None:
+        return Span(name, kind, secrets.token_hex(16), None, start_ns)
+    return Span(name, kind, parent.trace_id, parent.span_id, start_ns)
+
+
+@contextmanager
+def start_span(name: str, kind: str = "INTERNAL", attributes: Optional[Dict[str, Any]] = None, parent: Optional[SpanContext] = None):
+    """
+    Открыть спан и сделать его текущим на время блока.
+
+    Пример:
+        with start_span("agent.process", attributes={"query": query}):
+            ...
+    """
+    if not TRACING_ENABLED:
+        yield _NOOP_SPAN
+        return
+    span = new_span(name, kind, parent)
+    if attributes:
+        span.attributes.update(attributes)
+    token = _current_span.set(span)
+    try:
+        yield span
+    except BaseException as e:
+        span.record_error(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        span.end()
+
+
+def extract(headers) -> Optional[SpanContext]:
+    """Достать контекст родителя из заголовка traceparent."""
+    value = headers.get(TRACEPARENT_HEADER) if headers else None
+    if not value:
+        return None
+    match = _TRACEPARENT_RE.match(value.strip().lower())
+    if not match:
+        return None
+    return SpanContext(match.group(1), match.group(2))
+
+
+def inject(headers: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+    """Добавить traceparent текущего спана в заголовки исходящего запроса."""
+    headers = headers if headers is not None else {}
+    span = _current_span.get()
+    if span is not None:
+        headers[TRACEPARENT_HEADER] = span.context.to_traceparent()
+    return headers
+
+
+def _record_operation(operation: str, start: float, duration: float):
+    """Подписчик metrics.time_operation: операция FreeCADCore как дочерний спан."""
+    if not TRACING_ENABLED or _current_span.get() is None:
+        return
+    end_ns = time.time_ns()
+    span = new_span(f"freecad.{operation}", "INTERNAL", None, end_ns - int(duration * 1e9))
+    span.end(end_ns)
+
+
+add_operation_listener(_record_operation)
+
+
+# ============ ИНТЕГРАЦИИ ============
+
+class TracingMiddleware:
+    """ASGI middleware: серверный спан на каждый HTTP запрос с учетом traceparent."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not TRACING_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        headers = {name.decode("latin-1"): value.decode("latin-1") for name, value in scope.get("headers", [])}
+        status_holder = {"status": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status_holder["status"] = message["status"]
+            await send(message)
+
+        with start_span(f"{scope.get('method')} {scope.get('path')}", "SERVER", parent=extract(headers)) as span:
+            span.set_attribute("http.method", scope.get("method"))
+            span.set_attribute("http.target", scope.get("path"))
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                route = getattr(scope.get("route"), "path", None)
+                if route:
+                    span.name = f"{scope.get('method')} {route}"
+                    span.set_attribute("http.route", route)
+                span.set_attribute("http.status_code", status_holder["status"])
+                if status_holder["status"] >= 500:
+                    span.status = "ERROR"
+                request_id = headers.get("x-request-id")
+                if request_id:
+                    span.set_attribute("request_id", request_id)
+
+
+async def trace_request_start(request):
+    """httpx event hook: клиентский спан и traceparent для исходящего запроса."""
+    if not TRACING_ENABLED:
+        return
+    span = new_span(f"HTTP {request.method} {request.url.path}", "CLIENT", None)
+    span.set_attribute("http.url", str(request.url))
+    request.headers[TRACEPARENT_HEADER] = span.context.to_traceparent()
+    request.extensions["trace_span"] = span
+
+
+async def trace_request_end(response):
+    """httpx event hook: закрыть клиентский спан."""
+    span = response.request.extensions.get("trace_span")
+    if span is not None:
+        span.set_attribute("http.status_code", response.status_code)
+        if response.status_code >= 500:
+            span.status = "ERROR"
+        span.end()
+
+
+def trace_request_error(request, error: BaseException):
+    """Закрыть клиентский спан запроса, который не получил ответа (таймаут, обрыв, отмена)."""
+    span = request.extensions.get("trace_span")
+    if span is not None:
+        span.record_error(error)
+        span.end()
+
+
+def tracing_tool_middleware():
+    """FastMCP middleware: спан на вызов инструмента, родитель — traceparent MCP запроса."""
+    from fastmcp.server.dependencies import get_http_headers
+    from fastmcp.server.middleware import Middleware
+
+    class TracingToolMiddleware(Middleware):
+        async def on_call_tool(self, context, call_next):
+            parent = extract(get_http_headers()) if TRACING_ENABLED and current_span() is None else None
+            with start_span(f"mcp.tool/{context.message.name}", "SERVER", parent=parent):
+                return await call_next(context)
+
+    return TracingToolMiddleware()